@@ -0,0 +1,141 @@
+# authentech_app/authentication.py
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils import timezone
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from discussable_backend.middleware import pin_to_primary
+
+
+def revocation_key(key):
+    return f'auth-token-revoked:{key}'
+
+
+class LocalTokenCache:
+    # Bounded in-process LRU of token key -> (user, token created), each entry living for `ttl` seconds. Workers
+    # cannot reach each other's entries, so invalidation leaves a revocation stamp in the Django cache and a hit
+    # is only trusted when no stamp newer than the entry exists
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, cached_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        revoked_at = cache.get(revocation_key(key))
+        if revoked_at is not None and revoked_at >= cached_at:
+            self.discard(key)
+            return None
+        return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, time.time_ns(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        self.discard(key)
+        # Entries elsewhere are gone after `ttl` anyway, so the stamp does not need to outlive them
+        cache.set(revocation_key(key), time.time_ns(), self.ttl)
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class SharedTokenCache:
+    # Token entries kept in the Django cache, so invalidation reaches every worker process
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+
+    @staticmethod
+    def cache_key(key):
+        return f'auth-token:{key}'
+
+    def get(self, key):
+        return cache.get(self.cache_key(key))
+
+    def set(self, key, value):
+        cache.set(self.cache_key(key), value, self.ttl)
+
+    def delete(self, key):
+        cache.delete(self.cache_key(key))
+
+
+if settings.TOKEN_AUTH_CACHE == 'django':
+    token_cache = SharedTokenCache(settings.TOKEN_AUTH_CACHE_TTL)
+else:
+    token_cache = LocalTokenCache(settings.TOKEN_AUTH_CACHE_SIZE, settings.TOKEN_AUTH_CACHE_TTL)
+
+
+def token_expiry_cutoff():
+    # Tokens created before this moment have expired, None when tokens never expire
+    if settings.TOKEN_EXPIRY_SECONDS is None:
+        return None
+    return timezone.now() - timedelta(seconds=settings.TOKEN_EXPIRY_SECONDS)
+
+
+def token_has_expired(created):
+    cutoff = token_expiry_cutoff()
+    return cutoff is not None and created < cutoff
+
+
+def issue_token(user):
+    # Returns the user's token, replacing it first if it has expired
+    token, created = Token.objects.get_or_create(user=user)
+    if not created and token_has_expired(token.created):
+        token.delete()
+        token = Token.objects.create(user=user)
+    # The client's next requests must not look for a fresh token or user on a lagging replica
+    pin_to_primary(f'{CachedTokenAuthentication.keyword} {token.key}')
+    return token
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Drop-in replacement for TokenAuthentication that remembers token -> user lookups, so an
+    authenticated request usually costs no query. Entries are dropped when the token is deleted
+    (logout, rotation) or its user is saved, and expire after TOKEN_AUTH_CACHE_TTL regardless.
+    """
+
+    def authenticate_credentials(self, key):
+        entry = token_cache.get(key)
+        if entry is None:
+            try:
+                # Read from the primary: a token missing from a lagging replica would reject a valid login
+                token = Token.objects.using(DEFAULT_DB_ALIAS).select_related('user').get(key=key)
+            except Token.DoesNotExist:
+                raise exceptions.AuthenticationFailed('Invalid token.')
+            entry = (token.user, token.created)
+            token_cache.set(key, entry)
+
+        user, created = entry
+        if token_has_expired(created):
+            Token.objects.filter(key=key).delete()
+            raise exceptions.AuthenticationFailed('Token has expired.')
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+
+        # An unsaved instance stands in for the row; its primary key is the token key
+        return user, Token(key=key, user=user, created=created)
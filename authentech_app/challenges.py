@@ -0,0 +1,40 @@
+# authentech_app/challenges.py
+# Short-lived WebAuthn challenges kept in the Django cache instead of the session, so a login
+# attempt does not write a session row. The browser only holds a random handle in a cookie.
+import secrets
+
+from django.conf import settings
+from django.core.cache import cache
+
+CHALLENGE_COOKIE_NAME = 'webauthn_challenge'
+
+
+def _cache_key(handle):
+    return f'webauthn-challenge:{handle}'
+
+
+def store_challenge(response, challenge, username=None):
+    handle = secrets.token_urlsafe(32)
+    cache.set(_cache_key(handle), {'challenge': challenge, 'username': username}, settings.WEBAUTHN_CHALLENGE_TTL)
+    response.set_cookie(
+        CHALLENGE_COOKIE_NAME,
+        handle,
+        max_age=settings.WEBAUTHN_CHALLENGE_TTL,
+        httponly=True,
+        secure=settings.SESSION_COOKIE_SECURE,
+        samesite=settings.SESSION_COOKIE_SAMESITE,
+    )
+    return response
+
+
+def consume_challenge(request):
+    # Returns the stored {'challenge', 'username'} once; later calls with the same handle get None
+    handle = request.COOKIES.get(CHALLENGE_COOKIE_NAME)
+    if not handle:
+        return None
+    key = _cache_key(handle)
+    stored = cache.get(key)
+    # Only the request that actually removes the entry may use it
+    if stored is None or not cache.delete(key):
+        return None
+    return stored
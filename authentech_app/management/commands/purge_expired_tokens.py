@@ -0,0 +1,28 @@
+# authentech_app/management/commands/purge_expired_tokens.py
+from django.core.management.base import BaseCommand
+from rest_framework.authtoken.models import Token
+
+from authentech_app.authentication import token_expiry_cutoff
+
+
+class Command(BaseCommand):
+    help = 'Deletes expired API tokens in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Tokens deleted per statement')
+
+    def handle(self, *args, **options):
+        cutoff = token_expiry_cutoff()
+        if cutoff is None:
+            self.stdout.write(self.style.WARNING('TOKEN_EXPIRY_SECONDS is not set, tokens never expire.'))
+            return
+
+        deleted = 0
+        while True:
+            keys = list(Token.objects.filter(created__lt=cutoff).values_list('key', flat=True)[:options['batch_size']])
+            if not keys:
+                break
+            Token.objects.filter(key__in=keys).delete()
+            deleted += len(keys)
+
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired tokens'))
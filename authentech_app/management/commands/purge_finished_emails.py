@@ -0,0 +1,33 @@
+# authentech_app/management/commands/purge_finished_emails.py
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from authentech_app.models import EmailStatus, OutboundEmail
+
+
+class Command(BaseCommand):
+    help = 'Deletes sent and failed outbound emails older than EMAIL_OUTBOX_RETENTION_SECONDS in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Emails deleted per statement')
+
+    def handle(self, *args, **options):
+        # The last attempt leases the row until next_attempt_at, so it marks when the email was finished
+        # and lets the (status, next_attempt_at) index find old rows
+        cutoff = timezone.now() - timedelta(seconds=settings.EMAIL_OUTBOX_RETENTION_SECONDS)
+        finished = OutboundEmail.objects.filter(
+            status__in=[EmailStatus.SENT.value, EmailStatus.FAILED.value], next_attempt_at__lt=cutoff
+        )
+
+        deleted = 0
+        while True:
+            ids = list(finished.values_list('id', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            OutboundEmail.objects.filter(id__in=ids).delete()
+            deleted += len(ids)
+
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} finished emails'))
@@ -0,0 +1,27 @@
+# authentech_app/management/commands/purge_verification_tokens.py
+from django.core.management.base import BaseCommand
+
+from authentech_app.models import EmailVerificationToken
+
+
+class Command(BaseCommand):
+    help = 'Deletes expired email verification tokens in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Tokens deleted per statement')
+
+    def handle(self, *args, **options):
+        cutoff = EmailVerificationToken.expiry_cutoff()
+        deleted = 0
+        while True:
+            # created_at is indexed, so each batch is found without scanning the table
+            ids = list(
+                EmailVerificationToken.objects.filter(created_at__lt=cutoff)
+                .order_by('created_at').values_list('id', flat=True)[:options['batch_size']]
+            )
+            if not ids:
+                break
+            EmailVerificationToken.objects.filter(id__in=ids).delete()
+            deleted += len(ids)
+
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired verification tokens'))
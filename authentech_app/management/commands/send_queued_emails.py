@@ -0,0 +1,29 @@
+# authentech_app/management/commands/send_queued_emails.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from authentech_app.outbox import send_due_emails
+
+
+class Command(BaseCommand):
+    help = 'Delivers queued outbound emails in batches, retrying failures with backoff'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Emails sent per SMTP connection')
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new emails instead of exiting')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds to wait between polls when idle')
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = send_due_emails(options['batch_size'])
+            if sent or failed:
+                self.stdout.write(f'Sent {sent} emails, {failed} failed')
+
+            # A full batch means more emails may already be due, so only a partial one waits or stops
+            if sent + failed < options['batch_size']:
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS('No more emails due'))
@@ -1,9 +1,14 @@
 # authentech_app/models.py
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models.functions import Now
 from django.contrib.auth.models import User
+from django.utils import timezone
+from datetime import timedelta
+from enum import Enum
 import uuid
 
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
 
@@ -14,10 +19,45 @@ class UserProfile(models.Model):
 
 
 class EmailVerificationToken(models.Model):
-    # Represents an email verification token for a user
+    # Represents a single-use email verification token for a user, valid for EMAIL_VERIFICATION_TOKEN_TTL seconds
     user = models.ForeignKey(User, on_delete=models.CASCADE)
-    token = models.UUIDField(default=uuid.uuid4, editable=False)
+    token = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    @staticmethod
+    def expiry_cutoff():
+        # Tokens created before this moment have expired
+        return timezone.now() - timedelta(seconds=settings.EMAIL_VERIFICATION_TOKEN_TTL)
+
+    def has_expired(self):
+        return self.created_at < self.expiry_cutoff()
+
+
+class EmailStatus(Enum):
+    PENDING = "pending"
+    SENT = "sent"
+    FAILED = "failed"
+
+    @classmethod
+    def choices(cls):
+        return [(key.value, key.name) for key in cls]
+
+
+class OutboundEmail(models.Model):
+    # An email queued by a request and delivered later by the send_queued_emails command
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254)
+    recipients = models.JSONField()
+    status = models.CharField(max_length=10, choices=EmailStatus.choices(), default=EmailStatus.PENDING.value)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'next_attempt_at'], name='outbound_email_due_idx')]
 
 
 class WebAuthnCredential(models.Model):
@@ -31,5 +71,30 @@ class WebAuthnCredential(models.Model):
 @receiver(post_save, sender=UserProfile)
 def update_votable_creator_name(sender, instance, **kwargs):
     from discussable_app.models import Discussion, Comment  # Import here to avoid circular import
-    Discussion.objects.filter(creator=instance.user).update(creator_name=instance.preferred_name)
-    Comment.objects.filter(creator=instance.user).update(creator_name=instance.preferred_name)
+    from discussable_app.leaderboards import invalidate_leaderboards
+    from discussable_app.payload_cache import invalidate_detail_payloads
+    # Only rows whose name actually changes are written, so delta sync clients only receive those
+    renamed = 0
+    for model in (Discussion, Comment):
+        renamed += model.objects.filter(creator=instance.user).exclude(creator_name=instance.preferred_name).update(
+            creator_name=instance.preferred_name, updated_at=Now(),
+        )
+    if renamed:
+        # Cached boards and detail payloads carry the old name
+        transaction.on_commit(invalidate_leaderboards)
+        transaction.on_commit(invalidate_detail_payloads)
+
+
+@receiver(post_delete, sender='authtoken.Token')
+def invalidate_cached_token(sender, instance, **kwargs):
+    from .authentication import token_cache  # Import here so settings are only read once apps are loaded
+    token_cache.delete(instance.key)
+
+
+@receiver(post_save, sender=User)
+def invalidate_cached_user_tokens(sender, instance, **kwargs):
+    # Cached tokens carry a copy of the user, so a saved user (e.g. deactivated) is looked up again
+    from rest_framework.authtoken.models import Token
+    from .authentication import token_cache
+    for key in Token.objects.filter(user=instance).values_list('key', flat=True):
+        token_cache.delete(key)
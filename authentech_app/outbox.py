@@ -0,0 +1,88 @@
+# authentech_app/outbox.py
+# Durable outbound email: requests only enqueue, the send_queued_emails worker delivers in batches
+# over one SMTP connection and retries failures with exponential backoff.
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OutboundEmail, EmailStatus
+
+
+def queue_email(subject, body, recipients, from_email=None):
+    return OutboundEmail.objects.create(
+        subject=subject,
+        body=body,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        recipients=list(recipients),
+    )
+
+
+def retry_delay(attempts):
+    delay = settings.EMAIL_OUTBOX_RETRY_SECONDS * 2 ** (attempts - 1)
+    return timedelta(seconds=min(delay, settings.EMAIL_OUTBOX_MAX_RETRY_SECONDS))
+
+
+def claim_due_emails(batch_size):
+    # Claimed rows are leased by pushing their next attempt into the future, so a crashed worker's
+    # batch is picked up again once the lease runs out and concurrent workers skip them meanwhile.
+    now = timezone.now()
+    with transaction.atomic():
+        batch = list(
+            OutboundEmail.objects.select_for_update(skip_locked=True)
+            .filter(status=EmailStatus.PENDING.value, next_attempt_at__lte=now)
+            .order_by('next_attempt_at')[:batch_size]
+        )
+        OutboundEmail.objects.filter(pk__in=[email.pk for email in batch]).update(
+            next_attempt_at=now + timedelta(seconds=settings.EMAIL_OUTBOX_LEASE_SECONDS)
+        )
+    return batch
+
+
+def record_failure(email, error):
+    email.attempts += 1
+    email.last_error = str(error)
+    if email.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+        email.status = EmailStatus.FAILED.value
+    else:
+        email.next_attempt_at = timezone.now() + retry_delay(email.attempts)
+
+
+def send_due_emails(batch_size):
+    """
+    Sends one batch of due emails and returns (sent, failed). All messages of the batch share
+    a single connection to the mail server.
+    """
+    batch = claim_due_emails(batch_size)
+    if not batch:
+        return 0, 0
+
+    sent = failed = 0
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as exc:
+        for email in batch:
+            record_failure(email, exc)
+        failed = len(batch)
+    else:
+        try:
+            for email in batch:
+                try:
+                    EmailMessage(email.subject, email.body, email.from_email, email.recipients,
+                                 connection=connection).send()
+                except Exception as exc:
+                    record_failure(email, exc)
+                    failed += 1
+                else:
+                    email.status = EmailStatus.SENT.value
+                    email.attempts += 1
+                    email.sent_at = timezone.now()
+                    sent += 1
+        finally:
+            connection.close()
+
+    OutboundEmail.objects.bulk_update(batch, ['status', 'attempts', 'last_error', 'next_attempt_at', 'sent_at'])
+    return sent, failed
@@ -12,10 +12,21 @@ from .models import UserProfile
 class UserProfileSerializer(serializers.ModelSerializer):
     email = serializers.EmailField(source='user.email', read_only=True)
     preferred_name = serializers.CharField()
+    reputation = serializers.SerializerMethodField()
 
     class Meta:
         model = UserProfile
-        fields = ('email', 'preferred_name')
+        fields = ('email', 'preferred_name', 'reputation')
+
+    def get_reputation(self, obj):
+        from discussable_app.models import UserReputation  # Import here to avoid circular import
+        from discussable_app.serializers import UserReputationSerializer
+        # Users whose content has never been voted on have no row yet
+        try:
+            reputation = obj.user.reputation
+        except UserReputation.DoesNotExist:
+            reputation = UserReputation(user=obj.user)
+        return UserReputationSerializer(reputation).data
 
 
 class RegistrationChallengeSerializer(serializers.Serializer):
@@ -1,3 +1,286 @@
-from django.test import TestCase
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+from .authentication import CachedTokenAuthentication, LocalTokenCache, SharedTokenCache
+from .challenges import CHALLENGE_COOKIE_NAME, consume_challenge, store_challenge
+from .models import EmailStatus, EmailVerificationToken, OutboundEmail, UserProfile
+from .outbox import claim_due_emails, queue_email, send_due_emails
+
+
+class FailingSendBackend(EmailBackend):
+    # Local stand-in for a mail server that accepts the connection but rejects the next `failures` messages
+    failures = 0
+
+    def send_messages(self, messages):
+        if FailingSendBackend.failures:
+            FailingSendBackend.failures -= 1
+            raise ConnectionError('Relay rejected the message')
+        return super().send_messages(messages)
+
+
+class UnreachableBackend(EmailBackend):
+    # Local stand-in for a mail server that cannot be reached at all
+
+    def open(self):
+        raise ConnectionRefusedError('Connection refused')
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class OutboxTests(TestCase):
+
+    def make_due(self):
+        OutboundEmail.objects.update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+
+    def test_signup_only_queues_the_email(self):
+        response = self.client.post(
+            '/api/send-verification-email/', {'email': 'reader@example.com', 'preferredName': 'Reader'},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mail.outbox, [])
+        email = OutboundEmail.objects.get()
+        self.assertEqual(email.status, EmailStatus.PENDING.value)
+        self.assertEqual(email.recipients, ['reader@example.com'])
+        self.assertIn('/verify-email/', email.body)
+
+    def test_send_queued_emails_delivers_every_due_email(self):
+        for number in range(3):
+            queue_email(f'Subject {number}', 'Body', [f'user{number}@example.com'])
+        output = StringIO()
+        call_command('send_queued_emails', batch_size=2, stdout=output)
+
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox),
+                         ['user0@example.com', 'user1@example.com', 'user2@example.com'])
+        self.assertFalse(OutboundEmail.objects.exclude(status=EmailStatus.SENT.value).exists())
+        self.assertIn('No more emails due', output.getvalue())
+
+    @override_settings(EMAIL_BACKEND='authentech_app.tests.FailingSendBackend', EMAIL_OUTBOX_RETRY_SECONDS=60)
+    def test_failed_email_is_retried_with_backoff(self):
+        FailingSendBackend.failures = 2
+        queue_email('Subject', 'Body', ['reader@example.com'])
+
+        self.assertEqual(send_due_emails(10), (0, 1))
+        email = OutboundEmail.objects.get()
+        self.assertEqual((email.status, email.attempts), (EmailStatus.PENDING.value, 1))
+        self.assertIn('Relay rejected', email.last_error)
+        self.assertAlmostEqual((email.next_attempt_at - timezone.now()).total_seconds(), 60, delta=5)
+        self.assertEqual(send_due_emails(10), (0, 0))  # Not due before its retry time
+
+        self.make_due()
+        send_due_emails(10)
+        email.refresh_from_db()
+        self.assertAlmostEqual((email.next_attempt_at - timezone.now()).total_seconds(), 120, delta=5)
+
+        self.make_due()
+        self.assertEqual(send_due_emails(10), (1, 0))
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (EmailStatus.SENT.value, 3))
+        self.assertEqual(len(mail.outbox), 1)
+
+    @override_settings(EMAIL_BACKEND='authentech_app.tests.FailingSendBackend', EMAIL_OUTBOX_MAX_ATTEMPTS=2)
+    def test_email_fails_after_the_last_attempt(self):
+        FailingSendBackend.failures = 5
+        queue_email('Subject', 'Body', ['reader@example.com'])
+        for _ in range(3):
+            send_due_emails(10)
+            self.make_due()
+        email = OutboundEmail.objects.get()
+        self.assertEqual((email.status, email.attempts), (EmailStatus.FAILED.value, 2))
+
+    @override_settings(EMAIL_BACKEND='authentech_app.tests.UnreachableBackend')
+    def test_unreachable_server_fails_the_whole_batch(self):
+        for number in range(3):
+            queue_email(f'Subject {number}', 'Body', ['reader@example.com'])
+        self.assertEqual(send_due_emails(10), (0, 3))
+        self.assertFalse(OutboundEmail.objects.exclude(attempts=1).exists())
+
+    @override_settings(EMAIL_OUTBOX_LEASE_SECONDS=300)
+    def test_claimed_batch_is_leased(self):
+        queue_email('Subject', 'Body', ['reader@example.com'])
+        self.assertEqual(len(claim_due_emails(10)), 1)
+        # A second worker skips the claimed email until the lease of a crashed worker runs out
+        self.assertEqual(claim_due_emails(10), [])
+        email = OutboundEmail.objects.get()
+        self.assertAlmostEqual((email.next_attempt_at - timezone.now()).total_seconds(), 300, delta=5)
+        self.make_due()
+        self.assertEqual(len(claim_due_emails(10)), 1)
+
+    @override_settings(EMAIL_OUTBOX_RETENTION_SECONDS=60)
+    def test_purge_removes_only_old_finished_emails(self):
+        old = timezone.now() - timedelta(seconds=120)
+        for status in EmailStatus:
+            queue_email(f'Old {status.value}', 'Body', ['reader@example.com'])
+            queue_email(f'New {status.value}', 'Body', ['reader@example.com'])
+            OutboundEmail.objects.filter(subject__endswith=status.value).update(status=status.value)
+        OutboundEmail.objects.filter(subject__startswith='Old').update(next_attempt_at=old)
+
+        output = StringIO()
+        call_command('purge_finished_emails', batch_size=1, stdout=output)
+        self.assertEqual(sorted(OutboundEmail.objects.values_list('subject', flat=True)),
+                         ['New failed', 'New pending', 'New sent', 'Old pending'])
+        self.assertIn('Deleted 2 finished emails', output.getvalue())
+
+
+@override_settings(EMAIL_VERIFICATION_TOKEN_TTL=60)
+class VerificationTokenTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='reader', email='reader@example.com', is_active=False)
+        UserProfile.objects.create(user=self.user, preferred_name='Reader')
+
+    def make_token(self, age=0):
+        token = EmailVerificationToken.objects.create(user=self.user)
+        EmailVerificationToken.objects.filter(pk=token.pk).update(created_at=timezone.now() - timedelta(seconds=age))
+        return token.token
+
+    def verify(self, token):
+        return self.client.get(f'/api/verify-email/{token}/')
+
+    def test_link_works_once_and_retires_other_links(self):
+        token = self.make_token()
+        self.make_token()
+        self.assertEqual(self.verify(token).status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.is_active)
+        self.assertFalse(EmailVerificationToken.objects.exists())
+        self.assertEqual(self.verify(token).status_code, 400)
+
+    def test_expired_link_is_rejected_and_deleted(self):
+        response = self.verify(self.make_token(age=61))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Invalid or expired token.'})
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        self.assertFalse(EmailVerificationToken.objects.exists())
+
+    def test_purge_removes_only_expired_tokens(self):
+        for age in (61, 120, 3600):
+            self.make_token(age)
+        fresh = self.make_token(age=30)
+        output = StringIO()
+        call_command('purge_verification_tokens', batch_size=2, stdout=output)
+        self.assertEqual(list(EmailVerificationToken.objects.values_list('token', flat=True)), [fresh])
+        self.assertIn('Deleted 3 expired verification tokens', output.getvalue())
+
+
+class ChallengeTests(TestCase):
+
+    def request_with(self, handle):
+        request = RequestFactory().post('/api/webauthn/login/response/')
+        if handle is not None:
+            request.COOKIES[CHALLENGE_COOKIE_NAME] = handle
+        return request
+
+    def stored_handle(self, challenge=b'challenge', username=None):
+        return store_challenge(HttpResponse(), challenge, username).cookies[CHALLENGE_COOKIE_NAME].value
+
+    def test_challenge_view_writes_no_session(self):
+        response = self.client.post('/api/webauthn/register/challenge/', {'username': 'reader'}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        cookie = response.cookies[CHALLENGE_COOKIE_NAME]
+        self.assertTrue(cookie['httponly'])
+        self.assertFalse(Session.objects.exists())
+        self.assertEqual(consume_challenge(self.request_with(cookie.value))['username'], 'reader')
+
+    def test_challenge_is_used_once(self):
+        handle = self.stored_handle(b'one-shot', 'reader')
+        self.assertEqual(consume_challenge(self.request_with(handle)), {'challenge': b'one-shot', 'username': 'reader'})
+        self.assertIsNone(consume_challenge(self.request_with(handle)))
+
+    def test_missing_or_foreign_handle_gets_nothing(self):
+        self.stored_handle()
+        self.assertIsNone(consume_challenge(self.request_with(None)))
+        self.assertIsNone(consume_challenge(self.request_with('not-a-handle-we-issued')))
+
+    @override_settings(WEBAUTHN_CHALLENGE_TTL=60)
+    def test_challenge_expires(self):
+        handle = self.stored_handle()
+        with mock.patch('time.time', return_value=time.time() + 61):
+            self.assertIsNone(consume_challenge(self.request_with(handle)))
+
+
+class TokenAuthenticationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='reader')
+        self.key = Token.objects.create(user=self.user).key
+
+    def authenticate(self):
+        return CachedTokenAuthentication().authenticate_credentials(self.key)
+
+    def each_cache(self):
+        for token_cache in (LocalTokenCache(10, 300), SharedTokenCache(300)):
+            with self.subTest(cache=type(token_cache).__name__), \
+                    mock.patch('authentech_app.authentication.token_cache', token_cache):
+                cache.clear()
+                yield token_cache
+
+    def test_cached_token_costs_no_query(self):
+        for _ in self.each_cache():
+            self.assertEqual(self.authenticate()[0], self.user)
+            with self.assertNumQueries(0):
+                user, token = self.authenticate()
+            self.assertEqual((user, token.key), (self.user, self.key))
+
+    def test_deleted_token_is_rejected(self):
+        for _ in self.each_cache():
+            self.authenticate()
+            Token.objects.filter(key=self.key).get().delete()
+            with self.assertRaises(AuthenticationFailed):
+                self.authenticate()
+            self.key = Token.objects.create(user=self.user).key
+
+    def test_deactivated_user_is_rejected(self):
+        for _ in self.each_cache():
+            self.authenticate()
+            self.user.is_active = False
+            self.user.save()
+            with self.assertRaises(AuthenticationFailed):
+                self.authenticate()
+            self.user.is_active = True
+            self.user.save()
+
+    @override_settings(TOKEN_EXPIRY_SECONDS=60)
+    def test_expired_token_is_rejected_and_deleted(self):
+        for _ in self.each_cache():
+            self.authenticate()
+            # The cached entry carries the creation time, so expiry is noticed without a query
+            with mock.patch('django.utils.timezone.now', return_value=timezone.now() + timedelta(seconds=61)):
+                with self.assertRaisesMessage(AuthenticationFailed, 'Token has expired.'):
+                    self.authenticate()
+            self.assertFalse(Token.objects.filter(key=self.key).exists())
+            self.key = Token.objects.create(user=self.user).key
+
+    def test_revocation_reaches_other_workers(self):
+        first, second = LocalTokenCache(10, 300), LocalTokenCache(10, 300)
+        first.set(self.key, 'entry')
+        second.set(self.key, 'entry')
+        first.delete(self.key)
+        self.assertIsNone(first.get(self.key))
+        self.assertIsNone(second.get(self.key))
+        # An entry cached after the revocation is trusted again
+        second.set(self.key, 'entry')
+        self.assertEqual(second.get(self.key), 'entry')
+
+    def test_local_entries_expire_and_stay_bounded(self):
+        token_cache = LocalTokenCache(2, 300)
+        for key in ('a', 'b', 'c'):
+            token_cache.set(key, key)
+        self.assertEqual([token_cache.get(key) for key in ('a', 'b', 'c')], [None, 'b', 'c'])
+        with mock.patch('authentech_app.authentication.time.monotonic', return_value=time.monotonic() + 301):
+            self.assertIsNone(token_cache.get('b'))
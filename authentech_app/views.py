@@ -10,7 +10,6 @@ from rest_framework.authtoken.models import Token
 from rest_framework.views import APIView
 from rest_framework.permissions import AllowAny
 from rest_framework.parsers import JSONParser
-from django.core.mail import send_mail
 
 # WebAuthn related imports
 from webauthn import (
@@ -26,6 +25,9 @@ from webauthn.helpers.exceptions import InvalidAuthenticationResponse
 from webauthn.helpers.structs import PublicKeyCredentialDescriptor
 
 # Local app imports
+from .authentication import issue_token
+from .challenges import consume_challenge, store_challenge
+from .outbox import queue_email
 from .serializers import AuthenticationResponseSerializer
 from .models import WebAuthnCredential, UserProfile, EmailVerificationToken
 from rest_framework.permissions import IsAuthenticated
@@ -39,7 +41,8 @@ class UserProfileView(APIView):
 
     def get(self, request, format=None):
         try:
-            user_profile = UserProfile.objects.get(user=request.user)
+            # The reputation aggregate is joined in, so the profile is served by a single query
+            user_profile = UserProfile.objects.select_related('user__reputation').get(user=request.user)
             serializer = UserProfileSerializer(user_profile)
             return Response(serializer.data)
         except UserProfile.DoesNotExist:
@@ -78,16 +81,23 @@ def send_verification_email(request):
     email_subject = "Email Verification"
     email_body = f"Hi {preferred_name},\nPlease verify your email by clicking on this link: {verification_link}"
 
-    send_mail(email_subject, email_body, 'from@example.com', [email], fail_silently=False)
+    # Delivery happens in the send_queued_emails worker, so a slow or unavailable mail relay cannot fail the signup
+    queue_email(email_subject, email_body, [email])
     return JsonResponse({'status': 'success', 'detail': 'Verification email sent'})
 
 
 def verify_email(request, token):
     try:
-        verification_record = EmailVerificationToken.objects.get(token=token)
+        verification_record = EmailVerificationToken.objects.select_related('user').get(token=token)
         user = verification_record.user
+        if verification_record.has_expired():
+            verification_record.delete()
+            raise EmailVerificationToken.DoesNotExist
+
         user.is_active = True
         user.save()
+        # Tokens are single use; any other outstanding links for this user are no longer needed either
+        EmailVerificationToken.objects.filter(user=user).delete()
 
         user_profile = UserProfile.objects.get(user=user)
 
@@ -102,6 +112,7 @@ def verify_email(request, token):
 
 class RegistrationChallengeView(APIView):
     permission_classes = [AllowAny]
+    throttle_scope = 'webauthn_challenge'
 
     def post(self, request, *args, **kwargs):
         # Parsing the request data.
@@ -121,15 +132,10 @@ class RegistrationChallengeView(APIView):
             user_display_name=username,
         )
 
-        # Storing the challenge and username in the session.
-        challenge_base64 = base64.b64encode(registration_options.challenge).decode('utf-8')
-        request.session['webauthn_challenge'] = challenge_base64
-        request.session['webauthn_username'] = username
-        request.session.save()
-
-        # Returning registration options as JSON response.
+        # Returning registration options as JSON response, with the challenge and username stored for the response step.
         registration_options_dict = json.loads(options_to_json(registration_options))
-        return JsonResponse(registration_options_dict)
+        response = JsonResponse(registration_options_dict)
+        return store_challenge(response, registration_options.challenge, username)
 
 
 class RegistrationResponseView(APIView):
@@ -140,14 +146,12 @@ class RegistrationResponseView(APIView):
         # Retrieving the response data sent by the client
         response_data = request.data
 
-        # Extracting the challenge and username from the session
-        challenge_base64 = request.session.pop('webauthn_challenge', None)
-        username = request.session.pop('webauthn_username', None)
-
-        # Decoding the challenge if available
-        challenge = base64.b64decode(challenge_base64) if challenge_base64 else None
+        # Extracting the challenge and username stored by the challenge step; each can only be used once
+        stored_challenge = consume_challenge(request) or {}
+        challenge = stored_challenge.get('challenge')
+        username = stored_challenge.get('username')
 
-        # Handling the case where username is not found in the session
+        # Handling the case where no username was stored for this challenge
         if not username:
             return JsonResponse({'detail': 'Username not found'}, status=400)
 
@@ -182,8 +186,8 @@ class RegistrationResponseView(APIView):
 
             # Log in the user and respond with success
             login(request, user)
-            # Generate or get existing token for the user
-            token, _ = Token.objects.get_or_create(user=user)
+            # Generate or get existing token for the user, replacing it if it has expired
+            token = issue_token(user)
             # Include the token in the response
             return JsonResponse({"status": "success", "token": token.key})
 
@@ -195,6 +199,7 @@ class RegistrationResponseView(APIView):
 class AuthenticationChallengeView(APIView):
     # Allow any user to access this view
     permission_classes = [AllowAny]
+    throttle_scope = 'webauthn_challenge'
 
     def post(self, request, *args, **kwargs):
         # Parsing the JSON data from the request
@@ -233,13 +238,9 @@ class AuthenticationChallengeView(APIView):
             # Add other required parameters here
         )
 
-        # Storing the challenge in the session
-        challenge_base64 = base64.urlsafe_b64encode(authentication_options.challenge).decode().rstrip("=")
-        request.session['webauthn_challenge'] = challenge_base64
-
-        # Converting options to JSON and sending it as a response
+        # Converting options to JSON and sending it as a response, with the challenge stored for the response step
         options_dict = json.loads(options_to_json(authentication_options))
-        return JsonResponse(options_dict)
+        return store_challenge(JsonResponse(options_dict), authentication_options.challenge)
 
 
 class AuthenticationResponseView(APIView):
@@ -253,9 +254,8 @@ class AuthenticationResponseView(APIView):
 
         # Proceed only if the serializer is valid
         if serializer.is_valid():
-            # Extract and decode the challenge stored in the session
-            challenge_base64 = request.session.pop('webauthn_challenge', None)
-            challenge = self._base64_urlsafe_decode(challenge_base64) if challenge_base64 else None
+            # Extract the challenge stored by the challenge step; each can only be used once
+            challenge = (consume_challenge(request) or {}).get('challenge')
 
             try:
                 # Convert the received data into bytes for processing
@@ -298,8 +298,8 @@ class AuthenticationResponseView(APIView):
 
                 # Log in the user and respond with success
                 login(request, user)
-                # Generate or get existing token for the user
-                token, _ = Token.objects.get_or_create(user=user)
+                # Generate or get existing token for the user, replacing it if it has expired
+                token = issue_token(user)
                 # Include the token in the response
                 return JsonResponse({"status": "success", "token": token.key})
 
@@ -319,21 +319,14 @@ class AuthenticationResponseView(APIView):
             # Handle invalid serializer data
             return JsonResponse(serializer.errors, status=400)
 
-    def _base64_urlsafe_decode(self, data):
-        # Decoding utility for base64 data
-        padding = '=' * ((4 - len(data) % 4) % 4)
-        data_with_padding = data + padding
-        try:
-            return base64.urlsafe_b64decode(data_with_padding)
-        except Exception as e:
-            # Handle exceptions during base64 decoding
-            raise e
-
 
 class LogoutView(APIView):
     permission_classes = [AllowAny]
 
     def post(self, request):
+        # Deleting the token also drops it from the authentication cache
+        if isinstance(request.auth, Token):
+            Token.objects.filter(key=request.auth.key).delete()
         logout(request)
         return JsonResponse({"status": "success", "message": "Logged out successfully"})
 
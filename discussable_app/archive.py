@@ -0,0 +1,118 @@
+# discussable_app/archive.py
+# Moves inactive discussions out of the hot tables into ArchivedDiscussion snapshots.
+#
+# Vote and UserContentPreference reference their votables through generic foreign keys, so
+# deleting a discussion does not cascade to the votes; both are copied and deleted explicitly here.
+from datetime import timedelta
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import ArchivedCreatorTotal, ArchivedDiscussion, Comment, Discussion, UserContentPreference, UserPreference, VotableType, Vote
+from .serializers import CommentSerializer, DiscussionSerializer
+
+
+def inactivity_cutoff(inactive_days):
+    return timezone.now() - timedelta(days=inactive_days)
+
+
+def inactive_discussions(cutoff):
+    # Discussions created before the cutoff with no comment, new vote or changed vote on the thread since
+    discussion_ct = ContentType.objects.get_for_model(Discussion)
+    comment_ct = ContentType.objects.get_for_model(Comment)
+    recently_voted_comments = Vote.objects.filter(content_type=comment_ct, updated_at__gte=cutoff).values('object_id')
+    return Discussion.objects.filter(created_at__lt=cutoff).exclude(
+        id__in=Comment.objects.filter(created_at__gte=cutoff).values('discussion_id')
+    ).exclude(
+        id__in=Vote.objects.filter(content_type=discussion_ct, updated_at__gte=cutoff).values('object_id')
+    ).exclude(
+        id__in=Comment.objects.filter(id__in=recently_voted_comments).values('discussion_id')
+    )
+
+
+def snapshot_data(serializer):
+    # The preference field depends on who is asking, so it is filled in when the snapshot is served
+    data = dict(serializer.data)
+    data.pop('user_preference', None)
+    return data
+
+
+def archive_discussions(discussion_ids):
+    """
+    Snapshots the given discussions with everything attached to them and deletes the originals.
+    Returns the number of discussions archived.
+    """
+    discussion_ct = ContentType.objects.get_for_model(Discussion)
+    comment_ct = ContentType.objects.get_for_model(Comment)
+    kinds = {discussion_ct.id: VotableType.DISCUSSION.value, comment_ct.id: VotableType.COMMENT.value}
+
+    with transaction.atomic():
+        discussions = list(Discussion.objects.filter(id__in=discussion_ids).select_for_update())
+        if not discussions:
+            return 0
+        ids = [discussion.id for discussion in discussions]
+        comments = list(Comment.objects.filter(discussion_id__in=ids).order_by('id'))
+        comment_ids = [comment.id for comment in comments]
+        discussion_of = {comment.id: comment.discussion_id for comment in comments}
+
+        def thread_of(content_type_id, object_id):
+            return object_id if content_type_id == discussion_ct.id else discussion_of[object_id]
+
+        thread_rows = Q(content_type=discussion_ct, object_id__in=ids) | Q(content_type=comment_ct, object_id__in=comment_ids)
+        attached = {
+            Vote: ('vote', 'votes'),
+            UserContentPreference: ('preference', 'preferences'),
+        }
+        archives = {
+            discussion.id: ArchivedDiscussion(
+                original_id=discussion.id,
+                creator_id=discussion.creator_id,
+                category=discussion.category,
+                created_at=discussion.created_at,
+                discussion=snapshot_data(DiscussionSerializer(discussion)),
+                comments=[],
+                votes=[],
+                preferences=[],
+            )
+            for discussion in discussions
+        }
+        for comment in comments:
+            archives[comment.discussion_id].comments.append(snapshot_data(CommentSerializer(comment)))
+        creator_totals = {}
+        for votable in (*discussions, *comments):
+            key = (getattr(votable, 'discussion_id', votable.id), votable.creator_id)
+            positive, negative = creator_totals.get(key, (0, 0))
+            creator_totals[key] = (positive + votable.positive_votes, negative + votable.negative_votes)
+
+        for model, (value_field, archive_field) in attached.items():
+            rows = model.objects.filter(thread_rows).order_by('id').values_list('content_type_id', 'object_id', 'user_id', value_field)
+            for content_type_id, object_id, user_id, value in rows.iterator():
+                getattr(archives[thread_of(content_type_id, object_id)], archive_field).append(
+                    [kinds[content_type_id], object_id, user_id, value]
+                )
+            model.objects.filter(thread_rows).delete()
+
+        ArchivedDiscussion.objects.bulk_create(archives.values())
+        ArchivedCreatorTotal.objects.bulk_create([
+            ArchivedCreatorTotal(archive=archives[discussion_id], user_id=user_id, positive_votes=positive, negative_votes=negative)
+            for (discussion_id, user_id), (positive, negative) in creator_totals.items()
+        ])
+        Discussion.objects.filter(id__in=ids).delete()  # Comments cascade
+    return len(ids)
+
+
+def archived_detail(archive, user, sort_field):
+    # Detail view payload for an archived thread, shaped like the live DiscussionDetailView response
+    discussion_preferences = archive.user_preferences(user, VotableType.DISCUSSION.value)
+    comment_preferences = archive.user_preferences(user, VotableType.COMMENT.value)
+    none = UserPreference.NONE.value
+    return {
+        'discussion': {**archive.discussion, 'user_preference': discussion_preferences.get(archive.original_id, none)},
+        'comments': [
+            {**comment, 'user_preference': comment_preferences.get(comment['id'], none)}
+            for comment in archive.sorted_comments(sort_field)
+        ],
+        'archived': True,
+    }
@@ -0,0 +1,157 @@
+# discussable_app/async_views.py
+# Async counterparts of the discussion read views, for deployments served through ASGI.
+# DRF's APIView has no async support, so these are plain Django views reusing the DRF
+# authentication classes and serializers. Database calls all run through the thread-sensitive
+# sync_to_async executor, so they are awaited one after another; the gain is that the event loop
+# stays free for other requests, not that one request's queries overlap.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views import View
+from rest_framework import exceptions
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from discussable_backend.compression import negotiate
+from discussable_backend.renderers import ORJSONRenderer
+
+from .archive import archived_detail
+from .live import broker, event_stream
+from .models import ArchivedDiscussion, Discussion, Comment, UserContentPreference
+from .payload_cache import CachedPayload, payload_response
+from .serializers import DiscussionSerializer, CommentSerializer, ValuesSerializer, fieldset_key
+from .views import (
+    COMMENT_SORT_OPTIONS, COMMENT_STUB_FIELDS, SORT_OPTIONS, comment_group_approvals, related_discussions, visible_only,
+    viewer_rows,
+)
+
+
+@sync_to_async
+def authenticate(request):
+    # Runs the configured DRF authentication classes against the plain Django request
+    drf_request = Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+    return drf_request.user
+
+
+async def fetch_user_preferences(user, model, object_ids):
+    if not user.is_authenticated:
+        return {}
+    content_type = await sync_to_async(ContentType.objects.get_for_model)(model)
+    preferences = UserContentPreference.objects.filter(
+        user=user,
+        content_type=content_type,
+        object_id__in=object_ids,
+    ).values_list('object_id', 'preference')
+    return {obj_id: pref async for obj_id, pref in preferences}
+
+
+class AsyncView(View):
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            request.user = await authenticate(request)
+        except exceptions.AuthenticationFailed as exc:
+            return JsonResponse({'detail': str(exc.detail)}, status=401)
+        return await super().dispatch(request, *args, **kwargs)
+
+
+class AsyncDiscussionsListView(AsyncView):
+
+    async def get(self, request, *args, **kwargs):
+        user = request.user
+        if not user.is_authenticated:
+            return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+        sort_field = SORT_OPTIONS.get(request.GET.get('sort', 'created_at'), '-created_at')
+        discussions = Discussion.objects.all().order_by(sort_field)
+        if visible_only(request):
+            context = {'request': request}
+            serializer = ValuesSerializer(DiscussionSerializer, context)
+            rows = await sync_to_async(viewer_rows)(serializer, discussions, user, context)
+            return JsonResponse(serializer.to_representation(rows), safe=False)
+
+        discussion_list = await self.fetch_discussions(discussions)
+        user_pref_dict = await fetch_user_preferences(user, Discussion, [discussion.id for discussion in discussion_list])
+
+        context = {'request': request, 'user_preferences': user_pref_dict}
+        serializer = DiscussionSerializer(discussion_list, many=True, context=context)
+        return JsonResponse(serializer.data, safe=False)
+
+    @staticmethod
+    async def fetch_discussions(queryset):
+        return [discussion async for discussion in queryset.aiterator()]
+
+
+class AsyncDiscussionDetailView(AsyncView):
+
+    async def get(self, request, discussion_id, *args, **kwargs):
+        sort_field = COMMENT_SORT_OPTIONS.get(request.GET.get('sort', 'newest'), '-created_at')
+        cached = encoding = None
+        if not request.user.is_authenticated and settings.DETAIL_PAYLOAD_CACHE_TTL:
+            # Anonymous readers all get the same payload, served compressed from the cache
+            encoding = negotiate(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+            cached = await sync_to_async(CachedPayload)(
+                discussion_id, sort_field, fieldset_key(request), visible_only(request)
+            )
+            body = await sync_to_async(cached.get)(encoding)
+            if body is not None:
+                return payload_response(body, encoding)
+
+        comments = Comment.objects.filter(discussion_id=discussion_id).order_by(sort_field)
+        context = {'request': request}
+        comment_serializer = ValuesSerializer(CommentSerializer, context, stub_fields=COMMENT_STUB_FIELDS)
+
+        discussion = await Discussion.objects.filter(pk=discussion_id).afirst()
+        if discussion is None:
+            archive = await ArchivedDiscussion.objects.filter(original_id=discussion_id).afirst()
+            if archive is None:
+                return JsonResponse({'detail': 'Not found.'}, status=404)
+            return JsonResponse(archived_detail(archive, request.user, sort_field))
+        if visible_only(request):
+            # The preferences come with the comment rows, so only the approvals of shown comments are left to fetch
+            comment_rows = await sync_to_async(viewer_rows)(comment_serializer, comments, request.user, context)
+            user_pref_dict = context['user_preferences']
+            group_approvals = await sync_to_async(comment_group_approvals)(
+                [row['pk'] for row in comment_rows if not row['collapsed']]
+            )
+        else:
+            comment_rows = await self.fetch_rows(comment_serializer.values(comments))
+            user_pref_dict = await fetch_user_preferences(request.user, Comment, comments.values('id'))
+            group_approvals = await sync_to_async(comment_group_approvals)(comments.values('id'))
+        related = await sync_to_async(related_discussions)(discussion_id)
+
+        context.update(user_preferences=user_pref_dict, group_approvals=group_approvals)
+        data = {
+            'discussion': DiscussionSerializer(discussion, context={'request': request}).data,
+            'comments': comment_serializer.to_representation(comment_rows),
+            'related_discussions': related,
+        }
+        if cached is not None:
+            body = await sync_to_async(cached.store)(ORJSONRenderer().render(data), encoding)
+            return payload_response(body, encoding)
+        return JsonResponse(data)
+
+    @staticmethod
+    async def fetch_rows(queryset):
+        return [row async for row in queryset.aiterator()]
+
+
+class DiscussionEventsView(AsyncView):
+    # Server-sent event stream of new comments, counter and visibility changes in one discussion. Only an ASGI
+    # server (discussable_backend.asgi) sends it as events happen; a WSGI server would drain the whole stream first.
+
+    async def get(self, request, discussion_id, *args, **kwargs):
+        if not isinstance(request, ASGIRequest):
+            return JsonResponse({'detail': 'Live updates are only served through ASGI.'}, status=501)
+        if not await Discussion.objects.filter(pk=discussion_id).aexists():
+            return JsonResponse({'detail': 'Not found.'}, status=404)
+
+        response = StreamingHttpResponse(
+            event_stream(broker.subscribe(discussion_id)),
+            content_type='text/event-stream',
+        )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # Stops nginx from buffering the stream
+        return response
@@ -0,0 +1,118 @@
+# discussable_app/batch.py
+# Several discussable_app API calls in one round trip. Sub-requests are dispatched straight to the
+# resolved views, skipping middleware; BatchAuthentication stands in for the view's authentication
+# classes and hands them the batch's already authenticated user.
+import io
+import json
+from contextlib import nullcontext
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.db import transaction
+from django.http import HttpRequest, QueryDict
+from django.urls import Resolver404, resolve
+from rest_framework import status
+from rest_framework.authentication import BaseAuthentication
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+# URL names of the routes a batch may call
+BATCH_ROUTES = {
+    'discussions-list',
+    'discussion-detail',
+    'similar-discussions',
+    'changes',
+    'create-discussion',
+    'create-comment',
+    'vote',
+    'update-content-preference',
+    'hide-all-from-user',
+    'show_all_from_user',
+}
+BATCH_METHODS = {'GET', 'POST', 'PUT', 'PATCH', 'DELETE'}
+
+
+class BatchAuthentication(BaseAuthentication):
+    # Authenticates a sub-request as the (user, auth) pair the batch request was authenticated with
+
+    def authenticate(self, request):
+        return request.batch_auth
+
+
+def sub_request(request, method, path, query, body):
+    # A bare HttpRequest carrying the batch request's identity, headers and cookies, asking for JSON
+    payload = json.dumps(body).encode() if body is not None else b''
+    sub = HttpRequest()
+    sub.method = method
+    sub.path = sub.path_info = path
+    sub.META = {
+        **request.META,
+        'REQUEST_METHOD': method,
+        'PATH_INFO': path,
+        'QUERY_STRING': query,
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(payload)),
+        'HTTP_ACCEPT': 'application/json',
+    }
+    sub.GET = QueryDict(query)
+    sub.COOKIES = request.COOKIES
+    sub._stream = io.BytesIO(payload)
+    sub._read_started = False
+    sub.csrf_processing_done = True  # The batch request itself went through the CSRF checks
+    sub.batch_auth = (request.user, request.auth)
+    return sub
+
+
+def run_sub_request(request, item):
+    if not isinstance(item, dict) or not isinstance(item.get('path'), str):
+        return {'status': status.HTTP_400_BAD_REQUEST, 'body': {'error': 'Each request needs a path'}}
+    method = str(item.get('method', 'GET')).upper()
+    if method not in BATCH_METHODS:
+        return {'status': status.HTTP_405_METHOD_NOT_ALLOWED, 'body': {'error': f'Unsupported method {method}'}}
+
+    url = urlsplit(item['path'])
+    try:
+        match = resolve(url.path)
+    except Resolver404:
+        match = None
+    if match is None or match.url_name not in BATCH_ROUTES:
+        return {'status': status.HTTP_404_NOT_FOUND, 'body': {'error': 'Not a batchable route'}}
+
+    sub = sub_request(request, method, url.path, url.query, item.get('body'))
+    sub.resolver_match = match
+    view = match.func.cls.as_view(**{**match.func.initkwargs, 'authentication_classes': [BatchAuthentication]})
+    response = view(sub, *match.args, **match.kwargs)
+    if hasattr(response, 'data'):
+        return {'status': response.status_code, 'body': response.data}
+    # Plain Django responses, such as cached payloads, only carry their encoded body
+    return {'status': response.status_code, 'body': json.loads(response.content) if response.content else None}
+
+
+class BatchView(APIView):
+    """
+    Runs an ordered list of {"method", "path", "body"} sub-requests and returns their responses
+    as a list of {"status", "body"}. With "atomic" (the default) all of them share one transaction:
+    the first failing sub-request rolls the whole batch back and the ones after it are not run.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        items = request.data.get('requests')
+        if not isinstance(items, list) or not items:
+            return Response({'error': 'Expected a non-empty list of requests'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > settings.BATCH_MAX_REQUESTS:
+            return Response({'error': f'At most {settings.BATCH_MAX_REQUESTS} requests per batch'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        atomic = request.data.get('atomic', True)
+
+        responses = []
+        with transaction.atomic() if atomic else nullcontext():
+            for index, item in enumerate(items):
+                responses.append(run_sub_request(request, item))
+                if atomic and responses[-1]['status'] >= 400:
+                    transaction.set_rollback(True)
+                    skipped = {'status': status.HTTP_424_FAILED_DEPENDENCY, 'body': {'error': 'Not run, the batch was rolled back'}}
+                    responses.extend(dict(skipped) for _ in items[index + 1:])
+                    return Response(responses, status=status.HTTP_400_BAD_REQUEST)
+        return Response(responses)
@@ -0,0 +1,137 @@
+# discussable_app/bridging.py
+# Bridging scores: approval that holds across factions, found by matrix factorization of the votes.
+#
+# Every vote (1 positive, 0 negative) is modelled as mu + user intercept + votable intercept +
+# user factors . votable factors. The factors absorb approval explained by where voters and votables
+# sit on the dominant divides; the votable intercept is what is left, approval shared across them,
+# and becomes the bridging score. The model is fitted by alternating least squares, each side solved
+# for all users or votables at once, and is warm-started from the factors of the previous run.
+import os
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db.models.functions import Now
+
+from .models import Comment, Discussion
+from .opinion_groups import vote_matrix
+
+CHANGE_TOLERANCE = 1e-4  # Scores moving less than this are not written back
+
+
+def solve_side(index, size, features, targets, regularization):
+    # Per-row ridge regressions of targets on features, for every row of one side at once
+    width = features.shape[1]
+    normal = np.zeros((size, width, width))
+    rhs = np.zeros((size, width))
+    for a in range(width):
+        rhs[:, a] = np.bincount(index, weights=features[:, a] * targets, minlength=size)
+        for b in range(a, width):
+            normal[:, a, b] = normal[:, b, a] = np.bincount(index, weights=features[:, a] * features[:, b], minlength=size)
+    normal += np.diag(regularization)
+    return np.linalg.solve(normal, rhs[..., None])[..., 0]
+
+
+def fit(users, items, ratings, user_params, item_params, mu, iterations, tolerance=1e-5):
+    # Params hold the intercept in column 0 and the factors after it
+    regularization = np.array(
+        [settings.BRIDGING_INTERCEPT_REG] + [settings.BRIDGING_FACTOR_REG] * (user_params.shape[1] - 1)
+    )
+    ones = np.ones((len(ratings), 1))
+    previous_loss = None
+    for _ in range(iterations):
+        user_params = solve_side(
+            users, len(user_params), np.hstack([ones, item_params[items, 1:]]),
+            ratings - mu - item_params[items, 0], regularization,
+        )
+        item_params = solve_side(
+            items, len(item_params), np.hstack([ones, user_params[users, 1:]]),
+            ratings - mu - user_params[users, 0], regularization,
+        )
+        interaction = (user_params[users, 1:] * item_params[items, 1:]).sum(axis=1)
+        residual = ratings - user_params[users, 0] - item_params[items, 0] - interaction
+        mu = residual.mean()
+
+        loss = ((residual - mu) ** 2).sum() + (regularization * (user_params ** 2)).sum() + (regularization * (item_params ** 2)).sum()
+        if previous_loss is not None and previous_loss - loss < tolerance * previous_loss:
+            break
+        previous_loss = loss
+    return user_params, item_params, mu
+
+
+def carry_over(previous_ids, previous_params, ids, width, rng):
+    # Params for `ids`, taken from the previous run where it knew them and freshly initialized otherwise
+    params = np.hstack([np.zeros((len(ids), 1)), rng.normal(0, 0.1, (len(ids), width - 1))])
+    if previous_ids is not None and len(previous_ids) and previous_params.shape[1] == width:
+        positions = np.clip(np.searchsorted(previous_ids, ids), 0, len(previous_ids) - 1)
+        known = previous_ids[positions] == ids
+        params[known] = previous_params[positions[known]]
+    return params
+
+
+def load_factors(path):
+    try:
+        with np.load(path) as saved:
+            return {name: saved[name] for name in saved.files}
+    except FileNotFoundError:
+        return None
+
+
+def save_factors(path, **arrays):
+    # Written beside the target and renamed over it, so a concurrent run never reads a partial file
+    path = Path(path)
+    temporary = path.with_name(path.name + '.tmp')
+    with open(temporary, 'wb') as file:
+        np.savez(file, **arrays)
+    os.replace(temporary, path)
+
+
+def build_bridging_scores(dimensions=1, iterations=None, warm_start=True, seed=0, batch_size=100000):
+    """
+    Refits the factorization and writes changed bridging scores back to discussions and comments.
+    Returns the number of votables whose score was written.
+    """
+    rng = np.random.default_rng(seed)
+    matrix, user_ids, column_keys = vote_matrix(batch_size)
+    if not matrix.nnz:
+        return 0
+    votes = matrix.tocoo()
+    ratings = (votes.data > 0).astype(np.float64)
+
+    previous = (load_factors(settings.BRIDGING_FACTORS_PATH) if warm_start else None) or {}
+    width = dimensions + 1
+    # Factors saved with a different --dimensions cannot seed this fit, which then starts cold
+    warm = bool(previous) and previous['user_params'].shape[1] == previous['item_params'].shape[1] == width
+    seed_from = previous if warm else {}
+    user_params = carry_over(seed_from.get('user_ids'), seed_from.get('user_params'), user_ids, width, rng)
+    item_params = carry_over(seed_from.get('column_keys'), seed_from.get('item_params'), column_keys, width, rng)
+    mu = float(previous['mu']) if warm else float(ratings.mean())
+    # A warm start only has to absorb the votes cast since the last run
+    iterations = iterations or (5 if warm else 50)
+
+    user_params, item_params, mu = fit(votes.row, votes.col, ratings, user_params, item_params, mu, iterations)
+    save_factors(
+        settings.BRIDGING_FACTORS_PATH,
+        user_ids=user_ids, user_params=user_params, column_keys=column_keys, item_params=item_params, mu=mu,
+    )
+
+    scores = item_params[:, 0]
+    if previous:
+        old_scores = carry_over(previous['column_keys'], previous['item_params'][:, :1], column_keys, 1, rng)[:, 0]
+        changed = np.abs(scores - old_scores) >= CHANGE_TOLERANCE
+        changed |= ~np.isin(column_keys, previous['column_keys'])
+    else:
+        changed = np.ones(len(scores), dtype=bool)
+
+    # Each statement stamps its rows as it runs, so no batch carries a time long before it became visible
+    written = 0
+    for kind, model in enumerate((Discussion, Comment)):
+        columns = np.flatnonzero(changed & (column_keys % 2 == kind))
+        for start in range(0, len(columns), batch_size):
+            chunk = columns[start:start + batch_size]
+            model.objects.bulk_update(
+                [model(id=int(column_keys[column] // 2), bridging_score=float(scores[column]), updated_at=Now()) for column in chunk],
+                ['bridging_score', 'updated_at'], batch_size=1000,
+            )
+        written += len(columns)
+    return written
@@ -0,0 +1,152 @@
+# discussable_app/brigading.py
+# Streaming detection of vote brigades: bursts of one-sided votes on a single object from accounts
+# that also vote on the same other objects.
+#
+# Every vote updates two bounded rolling structures: the recent votes of the object (a time window)
+# and the recent objects of the voter. The similarity of the burst voters is only computed when an
+# object's window reaches the burst size, so an ordinary vote costs a few deque operations. State is
+# per process; with several workers each one sees and judges its share of the traffic.
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from itertools import combinations
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models.functions import Now
+
+from .leaderboards import invalidate_leaderboards
+from .models import BrigadingFlag, FlagStatus
+
+logger = logging.getLogger(__name__)
+
+MAX_COMPARED_VOTERS = 30  # Most recent burst voters compared pairwise when a burst is evaluated
+
+
+class VoteWindow:
+    __slots__ = ('votes', 'unchecked')
+
+    def __init__(self, max_votes):
+        # (time, user id, vote, visibility status of the object before the vote), oldest first
+        self.votes = deque(maxlen=max_votes)
+        self.unchecked = 0  # Votes added since the window was last evaluated
+
+
+class BrigadingDetector:
+
+    def __init__(self, window_seconds, burst_votes, one_sided_share, min_similarity,
+                 max_objects=10000, max_users=50000, user_history=50):
+        self.window_seconds = window_seconds
+        self.burst_votes = burst_votes
+        self.one_sided_share = one_sided_share
+        self.min_similarity = min_similarity
+        self.max_objects = max_objects
+        self.max_users = max_users
+        self.user_history = user_history
+        # A burst is re-evaluated every quarter burst of further votes, not on every vote
+        self.check_every = max(1, burst_votes // 4)
+        self._objects = OrderedDict()  # object key -> VoteWindow
+        self._users = OrderedDict()  # user id -> deque of recently voted object keys
+        # Object key -> time it was last reported; a burst is reported once, a new one after a further window
+        self._flagged = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _touch(entries, key, factory, limit):
+        # LRU lookup: least recently used entries are evicted once `limit` is exceeded
+        entry = entries.get(key)
+        if entry is None:
+            entry = entries[key] = factory()
+            while len(entries) > limit:
+                entries.popitem(last=False)
+        else:
+            entries.move_to_end(key)
+        return entry
+
+    def record(self, key, user_id, vote, status=None, now=None):
+        """
+        Adds a vote, cast while the object had visibility `status`, and returns (vote count, direction,
+        similarity, status before the window's votes) when it completes a suspected brigade on `key`,
+        otherwise None.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._touch(self._users, user_id, lambda: deque(maxlen=self.user_history), self.max_users).append(key)
+            window = self._touch(self._objects, key, lambda: VoteWindow(self.burst_votes * 4), self.max_objects)
+            votes = window.votes
+            votes.append((now, user_id, vote, status))
+            window.unchecked += 1
+            cutoff = now - self.window_seconds
+            while votes[0][0] < cutoff:
+                votes.popleft()
+
+            flagged_at = self._flagged.get(key)
+            recently_flagged = flagged_at is not None and flagged_at >= cutoff
+            if len(votes) < self.burst_votes or window.unchecked < self.check_every or recently_flagged:
+                return None
+            window.unchecked = 0
+
+            # Latest vote per voter, so toggling a vote back and forth does not make a burst
+            latest = {user: value for _, user, value, _ in votes}
+            positive = sum(1 for value in latest.values() if value > 0)
+            direction = 1 if positive * 2 >= len(latest) else -1
+            voters = [user for user, value in latest.items() if value == direction]
+            if len(voters) < self.burst_votes or len(voters) < self.one_sided_share * len(latest):
+                return None
+            histories = [set(self._users.get(user, ())) - {key} for user in voters[-MAX_COMPARED_VOTERS:]]
+            status_before = votes[0][3]
+
+        similarity = mean_jaccard(histories)
+        if similarity < self.min_similarity:
+            return None
+        with self._lock:
+            self._touch(self._flagged, key, lambda: now, self.max_objects)
+            self._flagged[key] = now
+            # The next burst on the object is made of new votes, judged once this one's window has passed
+            window.votes.clear()
+        return len(voters), direction, similarity, status_before
+
+
+def mean_jaccard(sets):
+    pairs = [(a, b) for a, b in combinations(sets, 2) if a or b]
+    if not pairs:
+        return 0.0
+    return sum(len(a & b) / len(a | b) for a, b in pairs) / len(pairs)
+
+
+detector = BrigadingDetector(
+    settings.BRIGADING_WINDOW_SECONDS,
+    settings.BRIGADING_BURST_VOTES,
+    settings.BRIGADING_ONE_SIDED_SHARE,
+    settings.BRIGADING_MIN_SIMILARITY,
+)
+
+
+def check_vote(votable, user_id, vote):
+    """
+    Feeds a vote to the detector before it is counted; a detected brigade is flagged for review and optionally
+    has its visibility held at the status it had before the burst, undoing what the burst votes already changed.
+    """
+    burst = detector.record((votable._meta.model_name, votable.id), user_id, int(vote), votable.visibility_status)
+    if burst is None:
+        return None
+
+    vote_count, direction, similarity, status_before = burst
+    content_type = ContentType.objects.get_for_model(votable)
+    flag, _ = BrigadingFlag.objects.get_or_create(
+        content_type=content_type,
+        object_id=votable.id,
+        status=FlagStatus.PENDING.value,
+        defaults={'vote_count': vote_count, 'direction': direction, 'similarity': similarity},
+    )
+    logger.warning('Suspected vote brigade on %s %s: %s votes, similarity %.2f',
+                   content_type.model, votable.id, vote_count, similarity)
+    if settings.BRIGADING_HOLD_VISIBILITY:
+        status = status_before or votable.visibility_status
+        type(votable).objects.filter(pk=votable.pk).update(visibility_held=True, visibility_status=status, updated_at=Now())
+        votable.visibility_held = True
+        votable.visibility_status = status
+        transaction.on_commit(invalidate_leaderboards)
+    return flag
@@ -0,0 +1,141 @@
+# discussable_app/leaderboards.py
+# Cached top-N discussions per (sort, category), serving the first page of the feed.
+#
+# Each board holds the exact top entries of its sort in serialized form. Vote and create paths
+# adjust boards in place: a discussion that rises above the last entry is inserted, one that falls
+# below it is dropped, which leaves a shorter board that is still exact. Boards that become too short
+# for a request, expire or were never built are rebuilt from the indexed query.
+#
+# Every write to a board holds its lock, taken with cache.add. A writer that finds the board locked
+# cannot apply its change, so it marks the board stale instead and the next read rebuilds it from the
+# database, where the change is already committed; a rebuild that finds it locked serves its rows uncached.
+#
+# Board keys include a global generation. Bulk changes that bypass discussion_changed (brigading holds
+# and dismissals, creator renames, batch jobs) replace it, so every board is rebuilt on its next read.
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Discussion
+from .serializers import DiscussionSerializer
+
+# Board name -> model field it ranks by, highest first
+LEADERBOARD_SORTS = {
+    'popularity': 'wilson_score',
+    'total_votes': 'total_votes',
+    'newest': 'created_at',
+}
+
+
+BOARD_LOCK_SECONDS = 5  # Frees the lock of a writer that died holding it
+GENERATION_KEY = 'leaderboard-generation'
+
+
+def board_generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        generation = time.time_ns()
+        if not cache.add(GENERATION_KEY, generation, None):
+            generation = cache.get(GENERATION_KEY, generation)
+    return generation
+
+
+def cache_key(sort, category, generation):
+    return f'leaderboard:{generation}:{sort}:{category or "*"}'
+
+
+def lock_key(key):
+    return f'{key}:lock'
+
+
+def stale_key(key):
+    return f'{key}:stale'
+
+
+def rank_key(discussion, sort):
+    # Ties are broken by id, matching the order_by used when boards are rebuilt
+    field = Discussion._meta.get_field(LEADERBOARD_SORTS[sort])
+    value = getattr(discussion, field.name)
+    if sort == 'newest':
+        return [value.timestamp(), discussion.id]
+    # A freshly scored instance holds more precision than the column, so it is rounded like the stored value
+    if field.get_internal_type() == 'DecimalField':
+        return [round(float(value), field.decimal_places), discussion.id]
+    return [float(value), discussion.id]
+
+
+def rebuild_board(sort, category=None):
+    field = LEADERBOARD_SORTS[sort]
+    discussions = Discussion.objects.order_by(f'-{field}', '-id')
+    if category:
+        discussions = discussions.filter(category=category)
+    key = cache_key(sort, category, board_generation())
+    locked = cache.add(lock_key(key), True, BOARD_LOCK_SECONDS)
+    try:
+        if locked:
+            cache.delete(stale_key(key))  # Changes committed from here on are read below
+        rows = list(discussions[:settings.LEADERBOARD_CAPACITY])
+        board = {
+            'entries': [{'rank': rank_key(d, sort), 'data': dict(DiscussionSerializer(d).data)} for d in rows],
+            # A board holding fewer rows than its capacity contains every discussion of the category
+            'complete': len(rows) < settings.LEADERBOARD_CAPACITY,
+        }
+        if locked:
+            cache.set(key, board, settings.LEADERBOARD_TTL)
+        return board
+    finally:
+        if locked:
+            cache.delete(lock_key(key))
+
+
+def top_discussions(sort, category=None, limit=None):
+    """
+    Returns up to `limit` serialized discussions from the board, or None when the board cannot
+    answer (unknown sort or a limit above LEADERBOARD_SIZE).
+    """
+    limit = limit or settings.LEADERBOARD_SIZE
+    if sort not in LEADERBOARD_SORTS or limit > settings.LEADERBOARD_SIZE:
+        return None
+    key = cache_key(sort, category, board_generation())
+    cached = cache.get_many([key, stale_key(key)])
+    board = cached.get(key)
+    if board is None or stale_key(key) in cached or (len(board['entries']) < limit and not board['complete']):
+        board = rebuild_board(sort, category)
+    return [dict(entry['data']) for entry in board['entries'][:limit]]
+
+
+def discussion_changed(discussion):
+    # Moves a created or re-scored discussion within every cached board it belongs to
+    data = dict(DiscussionSerializer(discussion).data)
+    generation = board_generation()
+    for sort in LEADERBOARD_SORTS:
+        for category in {None, discussion.category}:
+            key = cache_key(sort, category, generation)
+            if not cache.add(lock_key(key), True, BOARD_LOCK_SECONDS):
+                cache.set(stale_key(key), True, settings.LEADERBOARD_TTL)
+                continue
+            try:
+                board = cache.get(key)
+                if board is None:
+                    continue  # Cold boards are rebuilt on their next read
+
+                entries = [entry for entry in board['entries'] if entry['data']['id'] != discussion.id]
+                rank = rank_key(discussion, sort)
+                # Anything ranking at or below the last entry may be beaten by discussions outside the board
+                if board['complete'] or (entries and rank > entries[-1]['rank']):
+                    entries.append({'rank': rank, 'data': data})
+                    entries.sort(key=lambda entry: entry['rank'], reverse=True)
+                    if len(entries) > settings.LEADERBOARD_CAPACITY:
+                        entries = entries[:settings.LEADERBOARD_CAPACITY]
+                        board['complete'] = False
+
+                board['entries'] = entries
+                cache.set(key, board, settings.LEADERBOARD_TTL)
+            finally:
+                cache.delete(lock_key(key))
+
+
+def invalidate_leaderboards():
+    # Used after bulk changes that bypass discussion_changed; boards rebuild lazily
+    cache.set(GENERATION_KEY, time.time_ns(), None)
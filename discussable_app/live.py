@@ -0,0 +1,159 @@
+# discussable_app/live.py
+# Fan-out of live discussion updates (new comments, vote counters, visibility changes) to
+# server-sent event streams. Views publish events through the broker; each open stream holds a
+# subscription for one discussion.
+import asyncio
+import json
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+COUNTER_FIELDS = (
+    'total_votes', 'positive_votes', 'negative_votes', 'participation_percentage',
+    'positive_percentage', 'negative_percentage', 'wilson_score',
+)
+
+
+class InProcessBackend:
+    """
+    Delivers events to the subscribers of the current process. Deployments running several worker
+    processes plug in a backend with the same three methods on top of a shared pub/sub service.
+    """
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel, callback):
+        with self._lock:
+            self._subscribers[channel].add(callback)
+
+    def unsubscribe(self, channel, callback):
+        with self._lock:
+            self._subscribers[channel].discard(callback)
+            if not self._subscribers[channel]:
+                del self._subscribers[channel]
+
+    def publish(self, channel, event):
+        with self._lock:
+            callbacks = list(self._subscribers.get(channel, ()))
+        for callback in callbacks:
+            callback(event)
+
+
+class Subscription:
+    # Receives the events of one discussion on the event loop of the stream that opened it
+
+    def __init__(self, broker, discussion_id):
+        self.broker = broker
+        self.channel = broker.channel(discussion_id)
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=settings.LIVE_UPDATES_QUEUE_SIZE)
+        self.overflowed = False
+
+    def __enter__(self):
+        self.broker.backend.subscribe(self.channel, self.deliver)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.broker.backend.unsubscribe(self.channel, self.deliver)
+
+    def deliver(self, event):
+        # Called from whichever thread published the event
+        self.loop.call_soon_threadsafe(self._enqueue, event)
+
+    def _enqueue(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # A client this far behind is told to refetch instead of growing the queue
+            self.overflowed = True
+
+    async def get(self, timeout):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+
+class LiveBroker:
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    @staticmethod
+    def channel(discussion_id):
+        return f'discussion:{discussion_id}'
+
+    def publish(self, discussion_id, event):
+        # Subscribers only hear about changes once they are committed
+        transaction.on_commit(lambda: self.backend.publish(self.channel(discussion_id), event))
+
+    def subscribe(self, discussion_id):
+        return Subscription(self, discussion_id)
+
+    def publish_comment(self, comment_data):
+        self.publish(comment_data['discussion'], {'type': 'comment', 'comment': comment_data})
+
+    def publish_vote(self, votable, previous_visibility):
+        discussion_id = discussion_id_for(votable)
+        votable_type = votable._meta.model_name
+        counters = {field: getattr(votable, field) for field in COUNTER_FIELDS}
+        self.publish(discussion_id, {'type': 'counters', 'votable_type': votable_type, 'id': votable.id, **counters})
+        if votable.visibility_status != previous_visibility:
+            self.publish(discussion_id, {
+                'type': 'visibility',
+                'votable_type': votable_type,
+                'id': votable.id,
+                'visibility_status': votable.visibility_status,
+            })
+
+
+def discussion_id_for(votable):
+    return getattr(votable, 'discussion_id', None) or votable.id
+
+
+def coalesce_key(event):
+    # Counter and visibility updates for the same votable replace each other within a window
+    if event['type'] in ('counters', 'visibility'):
+        return event['type'], event['votable_type'], event['id']
+    return event['type'], id(event)
+
+
+def format_event(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event, cls=DjangoJSONEncoder)}\n\n"
+
+
+async def event_stream(subscription):
+    loop = asyncio.get_running_loop()
+    # Streams are closed after a while so connections of vanished clients do not pile up;
+    # EventSource reconnects on its own after the advertised retry delay.
+    closes_at = loop.time() + settings.LIVE_UPDATES_MAX_STREAM_SECONDS
+    yield 'retry: 2000\n\n'
+
+    with subscription:
+        while loop.time() < closes_at:
+            try:
+                event = await subscription.get(settings.LIVE_UPDATES_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ': keep-alive\n\n'
+                continue
+
+            pending = {coalesce_key(event): event}
+            window_ends = loop.time() + settings.LIVE_UPDATES_COALESCE_SECONDS
+            while (remaining := window_ends - loop.time()) > 0:
+                try:
+                    event = await subscription.get(remaining)
+                except asyncio.TimeoutError:
+                    break
+                pending[coalesce_key(event)] = event
+
+            if subscription.overflowed:
+                yield format_event({'type': 'resync'})
+                return
+            for event in pending.values():
+                yield format_event(event)
+
+
+broker = LiveBroker(import_string(settings.LIVE_UPDATES_BACKEND)())
@@ -0,0 +1,45 @@
+# discussable_app/management/commands/_bench.py
+# Shared helpers for the bench_* management commands (the leading underscore hides this module from manage.py)
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.test import Client
+from rest_framework.authtoken.models import Token
+
+from authentech_app.models import UserProfile
+from discussable_app.models import Discussion
+
+BENCH_USERNAME = 'bench-user'
+
+
+def bench_client():
+    # An API client authenticated as a dedicated benchmark user, talking to the in-process application
+    user, _ = User.objects.get_or_create(username=BENCH_USERNAME)
+    UserProfile.objects.get_or_create(user=user, defaults={'preferred_name': BENCH_USERNAME})
+    token, _ = Token.objects.get_or_create(user=user)
+    return user, Client(HTTP_HOST='localhost', HTTP_AUTHORIZATION=f'Token {token.key}')
+
+
+def bench_discussion(user):
+    discussion = Discussion.objects.order_by('id').first()
+    if discussion is None:
+        discussion = Discussion.objects.create(creator=user, subject='Benchmark discussion')
+    return discussion
+
+
+def time_calls(func, iterations, warmup=3):
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def summarize(samples):
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return f'median {statistics.median(ordered):8.2f} ms   p95 {p95:8.2f} ms   mean {statistics.fmean(ordered):8.2f} ms'
@@ -0,0 +1,37 @@
+# discussable_app/management/commands/archive_discussions.py
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from discussable_app.archive import archive_discussions, inactive_discussions, inactivity_cutoff
+from discussable_app.leaderboards import invalidate_leaderboards
+from discussable_app.payload_cache import invalidate_detail_payloads
+
+
+class Command(BaseCommand):
+    help = 'Moves inactive discussions, with their comments, votes and preferences, into read-only archive snapshots'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--inactive-days', type=int, default=settings.ARCHIVE_INACTIVE_DAYS,
+                            help='Archive discussions with no comment or vote for this many days')
+        parser.add_argument('--batch-size', type=int, default=100, help='Discussions archived per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many discussions would be archived')
+
+    def handle(self, *args, **options):
+        candidates = inactive_discussions(inactivity_cutoff(options['inactive_days'])).order_by('id')
+        if options['dry_run']:
+            self.stdout.write(f'{candidates.count()} discussions would be archived')
+            return
+
+        archived = 0
+        last_id = 0
+        while True:
+            ids = list(candidates.filter(id__gt=last_id).values_list('id', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            archived += archive_discussions(ids)
+            last_id = ids[-1]
+
+        if archived:
+            invalidate_leaderboards()
+            invalidate_detail_payloads()
+        self.stdout.write(self.style.SUCCESS(f'Archived {archived} discussions'))
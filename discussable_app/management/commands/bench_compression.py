@@ -0,0 +1,44 @@
+# discussable_app/management/commands/bench_compression.py
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from django.test import Client, override_settings
+
+from discussable_app.models import Discussion
+from discussable_backend.compression import ENCODINGS
+
+from ._bench import summarize, time_calls
+
+
+class Command(BaseCommand):
+    help = ('Measures bytes on the wire and CPU per request of the anonymous discussion detail payload for each '
+            'Accept-Encoding, compressed per request by the middleware and served pre-compressed from the cache')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=100, help='Requests per encoding and mode')
+        parser.add_argument('--discussion', type=int, help='Discussion to request; defaults to the one with most comments')
+
+    def handle(self, *args, **options):
+        discussion_id = options['discussion'] or (
+            Discussion.objects.annotate(comment_count=Count('comments')).order_by('-comment_count')
+            .values_list('id', flat=True).first()
+        )
+        if discussion_id is None:
+            self.stdout.write(self.style.WARNING('No discussions to request'))
+            return
+        client = Client(HTTP_HOST='localhost')
+        url = f'/api/discussions/{discussion_id}/'
+
+        for label, ttl in [('Compressed per request', 0), ('Pre-compressed in the cache', 300)]:
+            self.stdout.write(self.style.MIGRATE_HEADING(label))
+            with override_settings(DETAIL_PAYLOAD_CACHE_TTL=ttl):
+                for encoding in (None, *ENCODINGS):
+                    headers = {'HTTP_ACCEPT_ENCODING': encoding} if encoding else {}
+                    size = len(client.get(url, **headers).content)  # Also warms the cache
+                    started = time.process_time()
+                    timings = time_calls(lambda: client.get(url, **headers), options['iterations'], warmup=0)
+                    cpu = (time.process_time() - started) * 1000 / options['iterations']
+                    self.stdout.write(
+                        f'  {encoding or "identity":<9} {size:>10} bytes   cpu {cpu:8.2f} ms   {summarize(timings)}'
+                    )
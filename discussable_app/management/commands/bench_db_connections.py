@@ -0,0 +1,72 @@
+# discussable_app/management/commands/bench_db_connections.py
+from itertools import cycle
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connections
+from django.test import override_settings
+
+from discussable_app.models import Discussion, Vote
+
+from ._bench import BENCH_USERNAME, bench_client, bench_discussion, summarize, time_calls
+
+
+class Command(BaseCommand):
+    help = ('Compares per-request latency of the vote and list endpoints with and without persistent DB connections. '
+            'The votes are real writes through the vote endpoint, so --allow-writes is required; the benchmark '
+            'user\'s vote is removed and recounted afterwards, and the user too if the run created it')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200, help='Requests per endpoint and mode')
+        parser.add_argument('--list-url', default='/api/discussions/?sort=newest', help='List endpoint to request')
+        parser.add_argument('--allow-writes', action='store_true',
+                            help='Confirms the run may vote through the API on the configured database')
+
+    def handle(self, *args, **options):
+        if not options['allow_writes']:
+            raise CommandError(f"This benchmark votes on {connections['default'].settings_dict['NAME']}; "
+                               f"pass --allow-writes to run it there")
+        user_existed = User.objects.filter(username=BENCH_USERNAME).exists()
+        user, client = bench_client()
+        discussion = bench_discussion(user)
+        try:
+            self.run(client, discussion, options)
+        finally:
+            self.clean_up(user, user_existed, discussion)
+
+    def run(self, client, discussion, options):
+        vote_url = f'/api/vote/discussion/{discussion.id}/'
+        vote_values = cycle([1, -1])
+
+        # The test client disconnects close_old_connections from the request signals, so each call runs it
+        # itself, as a real request would on finishing; it closes the connection unless CONN_MAX_AGE keeps it
+        def vote():
+            client.post(vote_url, {'vote': next(vote_values)}, content_type='application/json')
+            close_old_connections()
+
+        def list_discussions():
+            client.get(options['list_url'])
+            close_old_connections()
+
+        connection = connections['default']
+        # The vote throttle would reject most of the timed requests
+        unthrottled = {**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {}}
+        for label, max_age in [('New connection per request', 0), ('Persistent connection', None)]:
+            # CONN_MAX_AGE is read when a connection opens, so the current one is closed after switching
+            connection.settings_dict['CONN_MAX_AGE'] = max_age
+            connection.close()
+
+            self.stdout.write(self.style.MIGRATE_HEADING(label))
+            with override_settings(REST_FRAMEWORK=unthrottled):
+                self.stdout.write(f"  vote  {summarize(time_calls(vote, options['iterations']))}")
+                self.stdout.write(f"  list  {summarize(time_calls(list_discussions, options['iterations']))}")
+
+    @staticmethod
+    def clean_up(user, user_existed, discussion):
+        Vote.objects.filter(user=user, content_type=ContentType.objects.get_for_model(Discussion), object_id=discussion.id).delete()
+        if user_existed or discussion.creator_id != user.id:
+            discussion.get_vote_data()
+        if not user_existed:
+            user.delete()  # Takes its token, profile and any discussion it created along
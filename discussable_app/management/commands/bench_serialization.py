@@ -0,0 +1,58 @@
+# discussable_app/management/commands/bench_serialization.py
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from discussable_app.models import Comment
+from discussable_app.serializers import CommentSerializer, ValuesSerializer
+from discussable_backend.renderers import ORJSONRenderer
+
+from ._bench import bench_client, bench_discussion, summarize, time_calls
+
+SPARSE_FIELDS = 'id,parent,creator_name,comment_content,created_at,wilson_score,user_preference'
+
+
+class Command(BaseCommand):
+    help = ('Times fetching, serializing and rendering the comments of one discussion with the ModelSerializer and '
+            'the stdlib or orjson renderer, against the .values() serializer with and without a sparse fieldset. '
+            'Missing comments are created for the run and rolled back')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--comments', type=int, default=10000, help='Comments serialized per call')
+        parser.add_argument('--iterations', type=int, default=10, help='Calls timed per variant')
+
+    def handle(self, *args, **options):
+        user, _ = bench_client()
+        with transaction.atomic():
+            discussion = bench_discussion(user)
+            missing = options['comments'] - discussion.comments.count()
+            if missing > 0:
+                Comment.objects.bulk_create(
+                    (Comment(discussion=discussion, creator=user, creator_name=user.username,
+                             comment_content=f'Benchmark comment {number} ' * 5) for number in range(missing)),
+                    batch_size=1000,
+                )
+            comments = discussion.comments.order_by('-created_at')[:options['comments']]
+            context = {'user_preferences': {}, 'group_approvals': {}}
+            sparse_request = Request(APIRequestFactory().get('/', {'fields': SPARSE_FIELDS}))
+            sparse_context = {**context, 'request': sparse_request}
+
+            variants = [
+                ('ModelSerializer, stdlib JSON',
+                 lambda: JSONRenderer().render(CommentSerializer(comments, many=True, context=context).data)),
+                ('ModelSerializer, orjson',
+                 lambda: ORJSONRenderer().render(CommentSerializer(comments, many=True, context=context).data)),
+                ('.values() serializer, orjson',
+                 lambda: ORJSONRenderer().render(ValuesSerializer(CommentSerializer, context).serialize(comments))),
+                ('.values() serializer, orjson, sparse fields',
+                 lambda: ORJSONRenderer().render(ValuesSerializer(CommentSerializer, sparse_context).serialize(comments))),
+            ]
+            self.stdout.write(f'{comments.count()} comments per call')
+            for label, render in variants:
+                size = len(render())
+                timings = time_calls(render, options['iterations'], warmup=1)
+                self.stdout.write(f'  {label:<44} {size:>10} bytes   {summarize(timings)}')
+
+            transaction.set_rollback(True)
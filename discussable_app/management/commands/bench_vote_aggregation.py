@@ -0,0 +1,129 @@
+# discussable_app/management/commands/bench_vote_aggregation.py
+import random
+from itertools import cycle
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from discussable_app.models import Comment, Discussion, Vote, VoteType, vote_count_aggregates
+
+from ._bench import summarize, time_calls
+
+PLACEHOLDER_ID = 987654321  # Stands for the counted object in the captured SQL
+COVERING_INDEX = 'vote_votable_idx'  # Vote's index serving get_vote_data, dropped for the last layout
+
+
+def typed_count_sql(table):
+    # The typed tables have no models, so their aggregate is written out in the shape the ORM gives get_vote_data's
+    if connection.features.supports_aggregate_filter_clause:
+        count = 'COUNT(vote) FILTER (WHERE vote = %s)'
+    else:
+        count = 'COUNT(CASE WHEN vote = %s THEN vote ELSE NULL END)'
+    return f'SELECT {count}, {count} FROM {table} WHERE votable_id = %s'
+
+
+class Command(BaseCommand):
+    help = ('Compares the per-votable vote count of get_vote_data on the generic Vote table, with and without its '
+            'covering index, against typed per-model vote tables with real foreign keys. Run it against a database '
+            'filled by generate_synthetic_data at the scale of interest; every schema change is rolled back')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=500, help='Aggregates timed per layout and model')
+        parser.add_argument('--seed', type=int, default=0, help='Seed for picking the votables to count')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        quote = connection.ops.quote_name
+        vote_count = Vote.objects.count()
+        if not vote_count:
+            raise CommandError('There are no votes to count; fill the database with generate_synthetic_data first')
+        self.stdout.write(f'{vote_count} votes')
+
+        samples = {}
+        with transaction.atomic(), connection.cursor() as cursor:
+            def generic_count(content_type):
+                # The SQL and parameters of get_vote_data's aggregate, captured from the ORM and replayed through the
+                # cursor like the typed tables' query, so both are timed without ORM overhead
+                captured = []
+
+                def capture(execute, sql, params, many, context):
+                    captured.append((sql, list(params)))
+                    return execute(sql, params, many, context)
+
+                with connection.execute_wrapper(capture):
+                    Vote.objects.filter(content_type=content_type, object_id=PLACEHOLDER_ID).aggregate(**vote_count_aggregates())
+                sql, params = captured[-1]
+                position = params.index(PLACEHOLDER_ID)
+
+                def count(object_id):
+                    params[position] = object_id
+                    cursor.execute(sql, params)
+                    return cursor.fetchone()
+                return count, sql, params
+
+            def typed_count(table):
+                sql = typed_count_sql(table)
+
+                def count(object_id):
+                    cursor.execute(sql, [VoteType.POSITIVE.value, VoteType.NEGATIVE.value, object_id])
+                    return cursor.fetchone()
+                return count, sql, None
+
+            def measure(model, query):
+                count = query[0]
+                ids = samples[model]
+                object_ids = cycle(ids)
+                timings = time_calls(lambda: count(next(object_ids)), len(ids))
+                self.stdout.write(f'  {model.__name__:<12} {summarize(timings)}')
+
+            def show_plan(query):
+                _, sql, params = query
+                cursor.execute(connection.ops.explain_query_prefix() + ' ' + sql, params)
+                plan = ' | '.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+                self.stdout.write(f'  plan: {plan}')
+
+            content_types = {model: ContentType.objects.get_for_model(model) for model in (Discussion, Comment)}
+            for model in content_types:
+                ids = list(model.objects.values_list('id', flat=True))
+                samples[model] = rng.sample(ids, min(len(ids), options['iterations']))
+            models_with_votes = [model for model in content_types if samples[model]]
+            if not models_with_votes:
+                raise CommandError('The votes belong to no existing discussion or comment')
+
+            self.stdout.write(self.style.MIGRATE_HEADING('Generic Vote table, covering index'))
+            for model in models_with_votes:
+                measure(model, generic_count(content_types[model]))
+            show_plan(generic_count(content_types[models_with_votes[-1]]))
+
+            self.stdout.write(self.style.MIGRATE_HEADING('Typed vote tables with foreign keys'))
+            for model in models_with_votes:
+                measure(model, typed_count(self.create_typed_table(cursor, model, content_types[model])))
+
+            self.stdout.write(self.style.MIGRATE_HEADING('Generic Vote table, unique_together index only'))
+            cursor.execute(f'DROP INDEX {quote(COVERING_INDEX)}')
+            for model in models_with_votes:
+                measure(model, generic_count(content_types[model]))
+            show_plan(generic_count(content_types[models_with_votes[-1]]))
+
+            transaction.set_rollback(True)
+
+    @staticmethod
+    def create_typed_table(cursor, model, content_type):
+        # The layout under evaluation: one vote table per votable model, keyed by a real foreign key
+        quote = connection.ops.quote_name
+        name = f'bench_{model._meta.model_name}_vote'
+        cursor.execute(
+            f'CREATE TABLE {quote(name)} ('
+            f'id integer PRIMARY KEY, '
+            f'user_id integer NOT NULL, '
+            f'votable_id integer NOT NULL REFERENCES {quote(model._meta.db_table)} (id), '
+            f'vote integer NOT NULL)'
+        )
+        cursor.execute(
+            f'INSERT INTO {quote(name)} (id, user_id, votable_id, vote) '
+            f'SELECT id, user_id, object_id, vote FROM {quote(Vote._meta.db_table)} WHERE content_type_id = %s',
+            [content_type.id],
+        )
+        cursor.execute(f'CREATE INDEX {quote(name + "_idx")} ON {quote(name)} (votable_id, vote)')
+        return quote(name)
@@ -0,0 +1,32 @@
+# discussable_app/management/commands/build_bridging_scores.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from discussable_app.bridging import build_bridging_scores
+from discussable_app.payload_cache import invalidate_detail_payloads
+
+
+class Command(BaseCommand):
+    help = 'Refits the vote matrix factorization and writes changed bridging scores to discussions and comments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dimensions', type=int, default=1, help='Factors per user and votable')
+        parser.add_argument('--iterations', type=int, default=None,
+                            help='Alternating least squares rounds; 5 when warm-started, 50 otherwise')
+        parser.add_argument('--cold', action='store_true', help='Ignore the factors saved by the previous run')
+        parser.add_argument('--seed', type=int, default=0, help='Seed for initializing new users and votables')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        written = build_bridging_scores(
+            dimensions=options['dimensions'],
+            iterations=options['iterations'],
+            warm_start=not options['cold'],
+            seed=options['seed'],
+        )
+        if written:
+            invalidate_detail_payloads()
+        self.stdout.write(self.style.SUCCESS(
+            f'Updated {written} bridging scores in {time.monotonic() - started:.1f}s'
+        ))
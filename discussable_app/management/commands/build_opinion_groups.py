@@ -0,0 +1,33 @@
+# discussable_app/management/commands/build_opinion_groups.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from discussable_app.opinion_groups import build_opinion_groups
+from discussable_app.payload_cache import invalidate_detail_payloads
+
+
+class Command(BaseCommand):
+    help = 'Clusters users into opinion groups from the vote matrix and stores each group\'s approval of every comment'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--components', type=int, default=2, help='Principal components users are projected onto')
+        parser.add_argument('--max-groups', type=int, default=5, help='Largest number of groups tried')
+        parser.add_argument('--min-votes', type=int, default=5, help='Votes a user needs to be placed in a group')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed; the same votes and seed give the same groups')
+        parser.add_argument('--batch-size', type=int, default=100000, help='Votes read and rows written per batch')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        groups = build_opinion_groups(
+            n_components=options['components'],
+            max_groups=options['max_groups'],
+            min_votes=options['min_votes'],
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+        )
+        if not groups:
+            self.stdout.write(self.style.WARNING('Too few active voters to form opinion groups'))
+            return
+        invalidate_detail_payloads()
+        self.stdout.write(self.style.SUCCESS(f'Found {groups} opinion groups in {time.monotonic() - started:.1f}s'))
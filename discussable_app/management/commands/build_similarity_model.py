@@ -0,0 +1,28 @@
+# discussable_app/management/commands/build_similarity_model.py
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from discussable_app.similarity import build_similarity_model
+from discussable_app.payload_cache import invalidate_detail_payloads
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the TF-IDF model behind similar subject suggestions and the related discussions of every discussion'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--neighbours', type=int, default=settings.SIMILARITY_NEIGHBOURS,
+                            help='Related discussions stored per discussion')
+        parser.add_argument('--top-comments', type=int, default=settings.SIMILARITY_TOP_COMMENTS,
+                            help='Best scored comments indexed alongside each subject')
+        parser.add_argument('--min-score', type=float, default=settings.SIMILARITY_MIN_SCORE,
+                            help='Lowest cosine similarity stored as related')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        count = build_similarity_model(options['neighbours'], options['top_comments'], options['min_score'])
+        invalidate_detail_payloads()
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {count} discussions in {time.monotonic() - started:.1f}s'
+        ))
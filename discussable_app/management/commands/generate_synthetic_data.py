@@ -0,0 +1,156 @@
+# discussable_app/management/commands/generate_synthetic_data.py
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from faker import Faker
+
+from authentech_app.models import UserProfile
+from discussable_app.models import Discussion, Comment, Vote, VoteType, rebuild_comment_subtrees, rebuild_user_reputations, rescore_votables
+
+CATEGORIES = ['Technology', 'Health', 'Politics', 'Environment', 'Education', 'Science', 'Culture', 'Economy']
+
+
+class Command(BaseCommand):
+    help = 'Generates large volumes of deterministic synthetic users, discussions, comment trees and votes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='Number of users to create')
+        parser.add_argument('--discussions', type=int, default=1000, help='Number of discussions to create')
+        parser.add_argument('--comments', type=int, default=5, help='Top-level comments per discussion')
+        parser.add_argument('--replies', type=int, default=2, help='Replies per comment at each reply level')
+        parser.add_argument('--depth', type=int, default=2, help='Number of reply levels below the top-level comments')
+        parser.add_argument('--votes', type=float, default=20, help='Mean number of votes per discussion or comment')
+        parser.add_argument('--approval', type=float, default=0.7, help='Mean share of positive votes')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed; the same seed produces the same data')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per bulk_create statement')
+        parser.add_argument('--prefix', default='synthetic', help='Username prefix for generated users')
+        parser.add_argument('--password', default=None,
+                            help='Shared password for generated users, hashed once. Users get unusable passwords if omitted')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.faker = Faker()
+        self.faker.seed_instance(options['seed'])
+        self.batch_size = options['batch_size']
+        started = time.monotonic()
+
+        user_ids, names = self.create_users(options)
+        self.log(f'{len(user_ids)} users ready', started)
+
+        discussion_ct = ContentType.objects.get_for_model(Discussion)
+        comment_ct = ContentType.objects.get_for_model(Comment)
+        first_discussion_id = first_comment_id = None
+        chunk_size = max(1, self.batch_size // max(1, options['comments']))
+
+        for offset in range(0, options['discussions'], chunk_size):
+            count = min(chunk_size, options['discussions'] - offset)
+            with transaction.atomic():
+                discussions = self.create_discussions(count, user_ids, names)
+                self.create_votes(discussion_ct, [d.id for d in discussions], user_ids, options)
+
+                parents = [(d.id, None) for d in discussions]
+                per_parent = options['comments']
+                for _ in range(options['depth'] + 1):
+                    comments = self.create_comments(parents, per_parent, user_ids, names)
+                    self.create_votes(comment_ct, [c.id for c in comments], user_ids, options)
+                    if first_comment_id is None and comments:
+                        first_comment_id = comments[0].id
+                    parents = [(c.discussion_id, c.id) for c in comments]
+                    per_parent = options['replies']
+
+            if first_discussion_id is None and discussions:
+                first_discussion_id = discussions[0].id
+            self.log(f'{offset + count} discussions written', started)
+
+        # Counters are filled in once at the end instead of after every object
+        if first_discussion_id is not None:
+            rescore_votables(Discussion, Discussion.objects.filter(pk__gte=first_discussion_id))
+        if first_comment_id is not None:
+            rescore_votables(Comment, Comment.objects.filter(pk__gte=first_comment_id))
+        self.log('Vote counters rescored', started)
+        if first_discussion_id is not None:
+            rebuild_comment_subtrees(Discussion.objects.filter(pk__gte=first_discussion_id))
+            self.log('Comment subtrees rebuilt', started)
+        rebuild_user_reputations(User.objects.filter(username__startswith=self.username_prefix(options)))
+        self.log('User reputations rebuilt', started)
+
+        self.stdout.write(self.style.SUCCESS('Successfully generated synthetic data'))
+
+    @staticmethod
+    def username_prefix(options):
+        return f"{options['prefix']}-{options['seed']}-"
+
+    def create_users(self, options):
+        prefix = self.username_prefix(options)
+        # Hashing is the slowest part of user creation, so it is done at most once for all users
+        password = make_password(options['password'])
+
+        users = [
+            User(username=f'{prefix}{i}', email=f'{prefix}{i}@example.com', password=password)
+            for i in range(options['users'])
+        ]
+        User.objects.bulk_create(users, batch_size=self.batch_size, ignore_conflicts=True)
+        user_ids = list(
+            User.objects.filter(username__startswith=prefix).order_by('id').values_list('id', flat=True)
+        )
+
+        existing = set(UserProfile.objects.filter(user_id__in=user_ids).values_list('user_id', flat=True))
+        profiles = [
+            UserProfile(user_id=user_id, preferred_name=self.faker.name())
+            for user_id in user_ids if user_id not in existing
+        ]
+        UserProfile.objects.bulk_create(profiles, batch_size=self.batch_size)
+        names = dict(UserProfile.objects.filter(user_id__in=user_ids).values_list('user_id', 'preferred_name'))
+        return user_ids, names
+
+    def create_discussions(self, count, user_ids, names):
+        discussions = []
+        for _ in range(count):
+            creator_id = self.rng.choice(user_ids)
+            discussions.append(Discussion(
+                creator_id=creator_id,
+                creator_name=names.get(creator_id, ''),
+                subject=self.faker.sentence(nb_words=8)[:255],
+                category=self.rng.choice(CATEGORIES),
+            ))
+        return Discussion.objects.bulk_create(discussions, batch_size=self.batch_size)
+
+    def create_comments(self, parents, per_parent, user_ids, names):
+        comments = []
+        for discussion_id, parent_id in parents:
+            for _ in range(per_parent):
+                creator_id = self.rng.choice(user_ids)
+                comments.append(Comment(
+                    discussion_id=discussion_id,
+                    parent_id=parent_id,
+                    creator_id=creator_id,
+                    creator_name=names.get(creator_id, ''),
+                    comment_content=self.faker.paragraph(nb_sentences=2),
+                ))
+        return Comment.objects.bulk_create(comments, batch_size=self.batch_size)
+
+    def create_votes(self, content_type, object_ids, user_ids, options):
+        mean_votes = options['votes']
+        # Beta parameters giving each votable its own approval rate around the requested mean
+        alpha = max(options['approval'], 0.01) * 4
+        beta = max(1 - options['approval'], 0.01) * 4
+
+        votes = []
+        for object_id in object_ids:
+            count = min(len(user_ids), int(self.rng.expovariate(1 / mean_votes))) if mean_votes > 0 else 0
+            approval = self.rng.betavariate(alpha, beta)
+            for user_id in self.rng.sample(user_ids, count):
+                vote = VoteType.POSITIVE.value if self.rng.random() < approval else VoteType.NEGATIVE.value
+                votes.append(Vote(user_id=user_id, content_type=content_type, object_id=object_id, vote=vote))
+            if len(votes) >= self.batch_size:
+                Vote.objects.bulk_create(votes, batch_size=self.batch_size)
+                votes = []
+        Vote.objects.bulk_create(votes, batch_size=self.batch_size)
+
+    def log(self, message, started):
+        self.stdout.write(f'{message} ({time.monotonic() - started:.1f}s)')
@@ -0,0 +1,19 @@
+# discussable_app/management/commands/rebuild_comment_subtrees.py
+from django.core.management.base import BaseCommand
+
+from discussable_app.models import Discussion, rebuild_comment_subtrees
+from discussable_app.payload_cache import invalidate_detail_payloads
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the reply count, vote total and best score of every comment subtree from the stored counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--discussion', type=int, action='append', help='Only rebuild this discussion (repeatable)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows written per statement')
+
+    def handle(self, *args, **options):
+        discussions = Discussion.objects.filter(pk__in=options['discussion']) if options['discussion'] else None
+        count = rebuild_comment_subtrees(discussions, batch_size=options['batch_size'])
+        invalidate_detail_payloads()
+        self.stdout.write(self.style.SUCCESS(f'Updated the subtree aggregates of {count} comments'))
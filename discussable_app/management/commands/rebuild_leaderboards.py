@@ -0,0 +1,18 @@
+# discussable_app/management/commands/rebuild_leaderboards.py
+from django.core.management.base import BaseCommand
+
+from discussable_app.leaderboards import LEADERBOARD_SORTS, rebuild_board
+from discussable_app.models import Discussion
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the cached top discussion boards for every sort and category'
+
+    def handle(self, *args, **options):
+        categories = [None, *Discussion.objects.exclude(category=None).order_by()
+                      .values_list('category', flat=True).distinct()]
+        for sort in LEADERBOARD_SORTS:
+            for category in categories:
+                rebuild_board(sort, category)
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {len(LEADERBOARD_SORTS) * len(categories)} leaderboards'))
@@ -0,0 +1,15 @@
+# discussable_app/management/commands/rebuild_reputation.py
+from django.core.management.base import BaseCommand
+
+from discussable_app.models import rebuild_user_reputations
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds every user reputation aggregate from the vote counters on discussions and comments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows written per statement')
+
+    def handle(self, *args, **options):
+        count = rebuild_user_reputations(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt reputation for {count} users'))
@@ -0,0 +1,25 @@
+# discussable_app/management/commands/recompute_visibility.py
+from django.core.management.base import BaseCommand
+
+from discussable_app.leaderboards import invalidate_leaderboards
+from discussable_app.models import Comment, Discussion, recompute_visibility
+from discussable_app.payload_cache import invalidate_detail_payloads
+
+
+class Command(BaseCommand):
+    help = ('Recomputes the visibility status of every discussion and comment from its vote counters and the '
+            'category thresholds, e.g. after a threshold changes')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--category', nargs='+', help='Only recompute these categories')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Ids covered per statement')
+
+    def handle(self, *args, **options):
+        count = sum(
+            recompute_visibility(model, categories=options['category'], batch_size=options['batch_size'])
+            for model in (Discussion, Comment)
+        )
+        if count:
+            invalidate_detail_payloads()
+            invalidate_leaderboards()
+        self.stdout.write(self.style.SUCCESS(f'Changed the visibility of {count} discussions and comments'))
@@ -0,0 +1,39 @@
+# discussable_app/management/commands/review_brigading_flags.py
+from django.core.management.base import BaseCommand, CommandError
+
+from discussable_app.leaderboards import invalidate_leaderboards
+from discussable_app.models import BrigadingFlag, FlagStatus
+from discussable_app.payload_cache import invalidate_detail_payloads
+
+
+class Command(BaseCommand):
+    help = 'Lists pending vote brigading flags, or confirms or dismisses them. Dismissing releases any held visibility'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--confirm', type=int, nargs='+', default=[], metavar='ID', help='Flags to confirm')
+        parser.add_argument('--dismiss', type=int, nargs='+', default=[], metavar='ID', help='Flags to dismiss')
+
+    def handle(self, *args, **options):
+        decisions = [(flag_id, FlagStatus.CONFIRMED.value) for flag_id in options['confirm']]
+        decisions += [(flag_id, FlagStatus.DISMISSED.value) for flag_id in options['dismiss']]
+
+        if not decisions:
+            pending = BrigadingFlag.objects.filter(status=FlagStatus.PENDING.value).select_related('content_type')
+            for flag in pending.order_by('detected_at'):
+                direction = 'up' if flag.direction > 0 else 'down'
+                self.stdout.write(
+                    f'{flag.id}: {flag.content_type.model} {flag.object_id}, {flag.vote_count} votes {direction}, '
+                    f'similarity {flag.similarity:.2f}, detected {flag.detected_at:%Y-%m-%d %H:%M}'
+                )
+            return
+
+        for flag_id, status in decisions:
+            try:
+                flag = BrigadingFlag.objects.get(pk=flag_id, status=FlagStatus.PENDING.value)
+            except BrigadingFlag.DoesNotExist:
+                raise CommandError(f'No pending flag {flag_id}')
+            flag.resolve(status)
+            self.stdout.write(self.style.SUCCESS(f'Flag {flag_id} {status}'))
+        # A dismissal can release held visibility
+        invalidate_detail_payloads()
+        invalidate_leaderboards()
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.9 on 2026-10-19 17:43
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('discussable_app', '0003_alter_usercontentpreference_preference'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserReputation',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='reputation', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('total_votes', models.PositiveIntegerField(default=0)),
+                ('positive_votes', models.PositiveIntegerField(default=0)),
+                ('negative_votes', models.PositiveIntegerField(default=0)),
+                ('wilson_score', models.DecimalField(decimal_places=8, default=0.0, max_digits=10)),
+            ],
+        ),
+    ]
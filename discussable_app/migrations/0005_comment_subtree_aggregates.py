@@ -0,0 +1,28 @@
+# Generated by Django 4.2.9 on 2026-10-19 17:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discussable_app', '0004_userreputation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='descendant_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='subtree_best_wilson',
+            field=models.DecimalField(decimal_places=8, default=0.0, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='subtree_total_votes',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.9 on 2026-10-19 17:49
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('discussable_app', '0005_comment_subtree_aggregates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedDiscussion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('original_id', models.PositiveIntegerField(unique=True)),
+                ('category', models.CharField(blank=True, max_length=50, null=True)),
+                ('created_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('discussion', models.JSONField()),
+                ('comments', models.JSONField(default=list)),
+                ('votes', models.JSONField(default=list)),
+                ('preferences', models.JSONField(default=list)),
+                ('creator_totals', models.JSONField(default=dict)),
+                ('creator', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.9 on 2026-10-19 17:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discussable_app', '0006_archiveddiscussion'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='vote',
+            index=models.Index(fields=['content_type', 'object_id', 'vote'], name='vote_votable_idx'),
+        ),
+    ]
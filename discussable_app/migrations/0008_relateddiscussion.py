@@ -0,0 +1,26 @@
+# Generated by Django 4.2.9 on 2026-10-19 17:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discussable_app', '0007_vote_votable_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedDiscussion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('discussion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_discussions', to='discussable_app.discussion')),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='discussable_app.discussion')),
+            ],
+            options={
+                'unique_together': {('discussion', 'related')},
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.9 on 2026-10-19 17:54
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discussable_app', '0008_relateddiscussion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OpinionGroup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveSmallIntegerField(unique=True)),
+                ('member_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CommentGroupApproval',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('positive_votes', models.PositiveIntegerField(default=0)),
+                ('negative_votes', models.PositiveIntegerField(default=0)),
+                ('approval', models.FloatField()),
+                ('comment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='group_approvals', to='discussable_app.comment')),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='comment_approvals', to='discussable_app.opiniongroup')),
+            ],
+            options={
+                'unique_together': {('comment', 'group')},
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.9 on 2026-10-19 17:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discussable_app', '0009_opinion_groups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='bridging_score',
+            field=models.FloatField(db_index=True, default=0.0),
+        ),
+        migrations.AddField(
+            model_name='discussion',
+            name='bridging_score',
+            field=models.FloatField(db_index=True, default=0.0),
+        ),
+    ]
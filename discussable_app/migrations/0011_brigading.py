@@ -0,0 +1,39 @@
+# Generated by Django 4.2.9 on 2026-10-19 17:58
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('discussable_app', '0010_votable_bridging_score'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='visibility_held',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='discussion',
+            name='visibility_held',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='BrigadingFlag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField()),
+                ('detected_at', models.DateTimeField(auto_now_add=True)),
+                ('vote_count', models.PositiveIntegerField()),
+                ('direction', models.IntegerField(choices=[(1, 'POSITIVE'), (-1, 'NEGATIVE'), (0, 'NO_VOTE')])),
+                ('similarity', models.FloatField()),
+                ('status', models.CharField(choices=[('pending', 'PENDING'), ('confirmed', 'CONFIRMED'), ('dismissed', 'DISMISSED')], db_index=True, default='pending', max_length=10)),
+                ('reviewed_at', models.DateTimeField(blank=True, null=True)),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+            ],
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.9 on 2026-10-19 18:12
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discussable_app', '0012_sync_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryVisibilityThreshold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category', models.CharField(max_length=50, unique=True)),
+                ('threshold', models.PositiveSmallIntegerField(validators=[django.core.validators.MaxValueValidator(100)])),
+            ],
+        ),
+    ]
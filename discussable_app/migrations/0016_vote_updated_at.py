@@ -0,0 +1,29 @@
+# Generated by Django 4.2.9 on 2026-10-19 18:33
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_updated_at(apps, schema_editor):
+    # Existing votes would otherwise all look changed at migration time and hold off archiving
+    apps.get_model('discussable_app', 'Vote').objects.using(schema_editor.connection.alias).update(updated_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discussable_app', '0015_deleted_votable'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vote',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='vote',
+            index=models.Index(fields=['content_type', 'updated_at'], name='vote_activity_idx'),
+        ),
+    ]
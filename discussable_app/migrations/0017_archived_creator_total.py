@@ -0,0 +1,51 @@
+# Generated by Django 4.2.9 on 2026-10-19 18:39
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def copy_creator_totals(apps, schema_editor):
+    # Moves the per-creator totals out of the archive snapshots into rows indexed by user
+    ArchivedDiscussion = apps.get_model('discussable_app', 'ArchivedDiscussion')
+    ArchivedCreatorTotal = apps.get_model('discussable_app', 'ArchivedCreatorTotal')
+    db = schema_editor.connection.alias
+    totals = []
+    for archive_id, creator_totals in ArchivedDiscussion.objects.using(db).values_list('pk', 'creator_totals').iterator():
+        totals.extend(
+            ArchivedCreatorTotal(archive_id=archive_id, user_id=int(user_id), positive_votes=positive, negative_votes=negative)
+            for user_id, (positive, negative) in creator_totals.items()
+        )
+        if len(totals) >= 1000:
+            ArchivedCreatorTotal.objects.using(db).bulk_create(totals)
+            totals = []
+    ArchivedCreatorTotal.objects.using(db).bulk_create(totals)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('discussable_app', '0016_vote_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedCreatorTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('positive_votes', models.IntegerField(default=0)),
+                ('negative_votes', models.IntegerField(default=0)),
+                ('archive', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='discussable_app.archiveddiscussion')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('archive', 'user')},
+            },
+        ),
+        migrations.RunPython(copy_creator_totals, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='archiveddiscussion',
+            name='creator_totals',
+        ),
+    ]
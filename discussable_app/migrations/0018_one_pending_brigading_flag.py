@@ -0,0 +1,31 @@
+# Generated by Django 4.2.9 on 2026-10-19 18:41
+
+from django.db import migrations, models
+
+
+def drop_duplicate_pending_flags(apps, schema_editor):
+    # Keeps the earliest pending flag of each object; later ones reported the same burst
+    BrigadingFlag = apps.get_model('discussable_app', 'BrigadingFlag')
+    flags = BrigadingFlag.objects.using(schema_editor.connection.alias)
+    kept = set()
+    duplicates = []
+    for pk, content_type_id, object_id in flags.filter(status='pending').order_by('pk').values_list('pk', 'content_type_id', 'object_id'):
+        if (content_type_id, object_id) in kept:
+            duplicates.append(pk)
+        kept.add((content_type_id, object_id))
+    flags.filter(pk__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discussable_app', '0017_archived_creator_total'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_pending_flags, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='brigadingflag',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'pending')), fields=('content_type', 'object_id'), name='one_pending_brigading_flag'),
+        ),
+    ]
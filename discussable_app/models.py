@@ -1,16 +1,27 @@
 # discussable_app/models.py
 
-from django.db import models
+from django.conf import settings
+from django.core.cache import cache
+from django.core.validators import MaxValueValidator
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from enum import Enum
-from django.db.models import Count
+from fractions import Fraction
+from django.db.models import Case, Count, Exists, F, FilteredRelation, Max, Min, OuterRef, Sum, Value, When
 from math import sqrt
-from django.db.models.functions import Greatest
-from django.contrib.contenttypes.fields import GenericForeignKey
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast, Coalesce, Greatest, Mod, Now, Sqrt
+from django.db.models.lookups import Exact, GreaterThan, GreaterThanOrEqual, LessThan
+from django.contrib.contenttypes.fields import GenericForeignKey, GenericRelation
 from django.contrib.contenttypes.models import ContentType
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
 
 from authentech_app.models import UserProfile
 
+WILSON_Z = 1.96  # For 95% confidence
+
 
 class VoteType(Enum):
     POSITIVE = 1
@@ -47,6 +58,8 @@ class Votable(models.Model):
     creator = models.ForeignKey(User, on_delete=models.CASCADE)
     creator_name = models.CharField(max_length=100, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Last change of any column, counters included; set explicitly by the set-based updates that bypass save()
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     total_votes = models.PositiveIntegerField(default=0)
     positive_votes = models.PositiveIntegerField(default=0)
     negative_votes = models.PositiveIntegerField(default=0)
@@ -55,42 +68,57 @@ class Votable(models.Model):
     negative_percentage = models.DecimalField(max_digits=3, decimal_places=0, default=0)
     wilson_score = models.DecimalField(max_digits=10, decimal_places=8, default=0.0)
     visibility_status = models.CharField(max_length=20, choices=VisibilityStatus.choices(), default=VisibilityStatus.VISIBLE.value)
+    # Cross-faction approval, the votable intercept of the matrix factorization in build_bridging_scores
+    bridging_score = models.FloatField(default=0.0, db_index=True)
+    # Set while a suspected vote brigade is under review; the visibility status then stops following the votes
+    visibility_held = models.BooleanField(default=False)
+    # Every user's explicit show/hide preference for this row, joined by the filtered views
+    preferences = GenericRelation('UserContentPreference')
     VISIBILITY_THRESHOLD = 33  # Approval percentage below which content is hidden
+    # Columns written only by set-based updates, never from a possibly stale instance
+    MAINTAINED_FIELDS = ('bridging_score', 'visibility_held')
 
     class Meta:
         abstract = True
 
     def get_vote_data(self):
+        with transaction.atomic():
+            # Concurrent recounts of this object queue on the row lock, so each one starts from the counters the
+            # previous one saved and the deltas handed to the maintained aggregates add up. The category comes
+            # along, so a comment's threshold costs no query for its discussion, whose row is not locked.
+            stored = type(self).objects.select_for_update(of=('self',)).only(
+                'positive_votes', 'negative_votes', 'visibility_status', 'visibility_held',
+            ).annotate(stored_category=F(self.CATEGORY_LOOKUP)).get(pk=self.pk)
+            self.visibility_status = stored.visibility_status
+            self.visibility_held = stored.visibility_held
+            self._visibility_category = stored.stored_category
+            return self.recount_votes(stored.positive_votes, stored.negative_votes)
+
+    def recount_votes(self, previous_positive_votes, previous_negative_votes):
         content_type = ContentType.objects.get_for_model(self)
-        vote_data = Vote.objects.filter(content_type=content_type, object_id=self.id).aggregate(
-            positive_votes=Count('id', filter=models.Q(vote=VoteType.POSITIVE.value)),
-            negative_votes=Count('id', filter=models.Q(vote=VoteType.NEGATIVE.value)),
-        )
+        vote_data = Vote.objects.filter(content_type=content_type, object_id=self.id).aggregate(**vote_count_aggregates())
         positive_votes = vote_data['positive_votes']
         negative_votes = vote_data['negative_votes']
         total_votes = positive_votes + negative_votes
         total_users = User.objects.count()
-        z = 1.96  # For 95% confidence
+        z = WILSON_Z  # For 95% confidence
         phat = positive_votes / total_votes if total_votes > 0 else 0
         wilson_nominator = phat + (z ** 2) / (2 * total_votes) - z * sqrt(
             (phat * (1 - phat) + (z ** 2) / (4 * total_votes)) / total_votes)
         wilson_denominator = 1 + (z ** 2) / total_votes
 
-        self.participation_percentage = round((total_votes / total_users) * 100) if total_users > 0 else 0
-        self.positive_percentage = round((positive_votes / total_votes) * 100) if total_votes > 0 else 0
-        self.negative_percentage = round((negative_votes / total_votes) * 100) if total_votes > 0 else 0
+        self.participation_percentage = rounded_percentage(total_votes, total_users)
+        self.positive_percentage = rounded_percentage(positive_votes, total_votes)
+        self.negative_percentage = rounded_percentage(negative_votes, total_votes)
         self.total_votes = total_votes
         self.positive_votes = positive_votes
         self.negative_votes = negative_votes
         self.wilson_score = wilson_nominator / wilson_denominator
         # Determine visibility status based on approval percentage
-        approval_percentage = self.positive_percentage
-        if approval_percentage is not None and approval_percentage < Votable.VISIBILITY_THRESHOLD:
-            self.visibility_status = VisibilityStatus.HIDDEN.value
-        else:
-            self.visibility_status = VisibilityStatus.VISIBLE.value
+        self.visibility_status = self.visibility_for_votes()
 
         self.save()
+        self.vote_counters_changed(positive_votes - previous_positive_votes, negative_votes - previous_negative_votes)
 
         vote_data = {
             'total_votes': total_votes,
@@ -103,13 +131,35 @@ class Votable(models.Model):
 
         return vote_data
 
-    def save(self, *args, **kwargs):
-        # Logic to set visibility status based on votes
+    def vote_counters_changed(self, positive_delta, negative_delta):
+        # Hook for aggregates maintained from this object's counters, called after get_vote_data saves them
+        if positive_delta or negative_delta:
+            UserReputation.record_votes(self.creator_id, positive_delta, negative_delta)
+
+    def visibility_for_votes(self):
+        # The status implied by the vote counters, unless it is held pending a brigading review
+        if self.visibility_held:
+            return self.visibility_status
         if self.total_votes > 0:
             approval_percentage = (self.positive_votes / float(self.total_votes)) * 100
-            self.visibility_status = VisibilityStatus.HIDDEN.value if approval_percentage < self.VISIBILITY_THRESHOLD else VisibilityStatus.VISIBLE.value
-        else:
-            self.visibility_status = VisibilityStatus.VISIBLE.value
+            return VisibilityStatus.HIDDEN.value if approval_percentage < self.visibility_threshold() else VisibilityStatus.VISIBLE.value
+        return VisibilityStatus.VISIBLE.value
+
+    def visibility_threshold(self):
+        thresholds = CategoryVisibilityThreshold.thresholds()
+        if not thresholds:
+            return self.VISIBILITY_THRESHOLD  # Skips looking up the category while no overrides exist
+        category = self._visibility_category if '_visibility_category' in self.__dict__ else self.visibility_category()
+        return thresholds.get(category, self.VISIBILITY_THRESHOLD)
+
+    def visibility_category(self):
+        # The category whose CategoryVisibilityThreshold applies; None keeps VISIBILITY_THRESHOLD. Subclasses
+        # set CATEGORY_LOOKUP to the same value as a query path, for the set-based recomputation
+        return None
+
+    def save(self, *args, **kwargs):
+        # Logic to set visibility status based on votes
+        self.visibility_status = self.visibility_for_votes()
 
         # Fetch the preferred_name from UserProfile and assign it to creator_name
         # This is done every time a Votable object is saved to ensure the creator_name is always up to date
@@ -117,6 +167,12 @@ class Votable(models.Model):
         if user_profile:
             self.creator_name = user_profile.preferred_name
 
+        if not self._state.adding and 'update_fields' not in kwargs:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.MAINTAINED_FIELDS
+            ]
+
         # Call the parent class's 'save' method with all provided arguments
         super().save(*args, **kwargs)
 
@@ -164,27 +220,260 @@ class Vote(models.Model):
     content_object = GenericForeignKey('content_type', 'object_id')
     vote = models.IntegerField(choices=VoteType.choices(), default=VoteType.default())
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)  # Changed votes count as activity for archiving
 
     class Meta:
         unique_together = ('user', 'content_type', 'object_id')
+        indexes = [
+            # Covers the per-votable count in get_vote_data, which the user-first unique index cannot serve
+            models.Index(fields=['content_type', 'object_id', 'vote'], name='vote_votable_idx'),
+            models.Index(fields=['content_type', 'updated_at'], name='vote_activity_idx'),
+        ]
 
 
 class Discussion(Votable):
     subject = models.CharField(max_length=255)
     category = models.CharField(max_length=50, blank=True, null=True)
+    CATEGORY_LOOKUP = 'category'
 
     def __str__(self):
         return f"{self.subject} - {self.category if self.category else 'General'}"
 
+    def visibility_category(self):
+        return self.category
+
 
 class Comment(Votable):
     discussion = models.ForeignKey(Discussion, on_delete=models.CASCADE, related_name='comments')
     comment_content = models.TextField(blank=True, null=False)
     parent = models.ForeignKey('self', on_delete=models.CASCADE, related_name='replies', null=True, blank=True)
+    # Aggregates over the comment and all of its replies, maintained up the ancestor chain
+    descendant_count = models.PositiveIntegerField(default=0)
+    subtree_total_votes = models.PositiveIntegerField(default=0)
+    subtree_best_wilson = models.DecimalField(max_digits=10, decimal_places=8, default=0.0)
+    SUBTREE_FIELDS = ('descendant_count', 'subtree_total_votes', 'subtree_best_wilson')
+    MAINTAINED_FIELDS = Votable.MAINTAINED_FIELDS + SUBTREE_FIELDS
+    CATEGORY_LOOKUP = 'discussion__category'
 
     def __str__(self):
         return f"Comment by {self.creator.username} on \"{self.discussion.subject}\""
 
+    def visibility_category(self):
+        return self.discussion.category
+
+    @classmethod
+    def with_ancestors(cls, comment_id):
+        # The comment and every comment above it, resolved by the database in one recursive query
+        table = cls._meta.db_table
+        sql = (
+            f'WITH RECURSIVE ancestors(id, parent_id) AS ('
+            f'SELECT id, parent_id FROM {table} WHERE id = %s '
+            f'UNION ALL '
+            f'SELECT c.id, c.parent_id FROM {table} c JOIN ancestors a ON c.id = a.parent_id'
+            f') SELECT id FROM ancestors'
+        )
+        return cls.objects.filter(id__in=RawSQL(sql, (comment_id,)))
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        if adding and self.parent_id:
+            Comment.with_ancestors(self.parent_id).update(descendant_count=F('descendant_count') + 1, updated_at=Now())
+
+    def vote_counters_changed(self, positive_delta, negative_delta):
+        super().vote_counters_changed(positive_delta, negative_delta)
+        if positive_delta or negative_delta:
+            # A falling score is not propagated, so the best score is an upper bound until the next rebuild
+            Comment.with_ancestors(self.id).update(
+                subtree_total_votes=F('subtree_total_votes') + positive_delta + negative_delta,
+                subtree_best_wilson=Greatest(F('subtree_best_wilson'), Value(float(self.wilson_score))),
+                updated_at=Now(),
+            )
+
+
+def deleted_with_discussion(origin):
+    # Whether a delete was started from discussions, an instance or a queryset, taking their comments along
+    model = origin.model if isinstance(origin, models.QuerySet) else type(origin)
+    return model is Discussion
+
+
+@receiver(post_delete, sender=Comment)
+def remove_deleted_subtree(sender, instance, origin=None, **kwargs):
+    # A deleted comment takes its whole subtree with it, so the surviving ancestors lose the comment, its replies
+    # and their votes. Replies of a deleted comment find no ancestors left, so nothing is removed twice. The
+    # best score is not lowered, as for falling scores it is an upper bound until the next rebuild.
+    if not instance.parent_id or deleted_with_discussion(origin):
+        return
+    Comment.with_ancestors(instance.parent_id).update(
+        descendant_count=Greatest(F('descendant_count') - (1 + instance.descendant_count), Value(0)),
+        subtree_total_votes=Greatest(F('subtree_total_votes') - instance.subtree_total_votes, Value(0)),
+        updated_at=Now(),
+    )
+
+
+class DeletedVotable(models.Model):
+    # Discussions and comments deleted outright, kept as tombstones for delta sync clients; archiving a discussion
+    # leaves an ArchivedDiscussion instead
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    discussion_id = models.PositiveIntegerField(db_index=True)
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+
+@receiver(post_delete, sender=Discussion)
+@receiver(post_delete, sender=Comment)
+def record_deleted_votable(sender, instance, origin=None, **kwargs):
+    # Comments removed along with their discussion are covered by the discussion's tombstone or archive
+    if sender is Comment and deleted_with_discussion(origin):
+        return
+    if sender is Discussion and ArchivedDiscussion.objects.filter(original_id=instance.pk).exists():
+        return
+    DeletedVotable.objects.create(
+        content_type=ContentType.objects.get_for_model(sender),
+        object_id=instance.pk,
+        discussion_id=instance.pk if sender is Discussion else instance.discussion_id,
+    )
+
+
+class CategoryVisibilityThreshold(models.Model):
+    # Approval percentage below which discussions of a category and their comments are hidden, in place of
+    # Votable.VISIBILITY_THRESHOLD. Existing rows follow a change once recompute_visibility has run.
+    category = models.CharField(max_length=50, unique=True)
+    threshold = models.PositiveSmallIntegerField(validators=[MaxValueValidator(100)])
+    CACHE_KEY = 'category-visibility-thresholds'
+
+    def __str__(self):
+        return f"{self.category}: hidden below {self.threshold}%"
+
+    @classmethod
+    def thresholds(cls):
+        # Category -> threshold, read from the cache on the vote path
+        thresholds = cache.get(cls.CACHE_KEY)
+        if thresholds is None:
+            thresholds = dict(cls.objects.values_list('category', 'threshold'))
+            cache.set(cls.CACHE_KEY, thresholds, settings.VISIBILITY_THRESHOLDS_CACHE_TTL)
+        return thresholds
+
+
+@receiver([post_save, post_delete], sender=CategoryVisibilityThreshold)
+def invalidate_visibility_thresholds(sender, **kwargs):
+    cache.delete(CategoryVisibilityThreshold.CACHE_KEY)
+
+
+class RelatedDiscussion(models.Model):
+    # Nearest neighbours of a discussion by subject and top comment text, rewritten by build_similarity_model
+    discussion = models.ForeignKey(Discussion, on_delete=models.CASCADE, related_name='related_discussions')
+    related = models.ForeignKey(Discussion, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+
+    class Meta:
+        unique_together = ('discussion', 'related')
+
+
+class OpinionGroup(models.Model):
+    # A cluster of users who vote alike, replaced wholesale by build_opinion_groups
+    number = models.PositiveSmallIntegerField(unique=True)
+    member_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
+class CommentGroupApproval(models.Model):
+    comment = models.ForeignKey(Comment, on_delete=models.CASCADE, related_name='group_approvals')
+    group = models.ForeignKey(OpinionGroup, on_delete=models.CASCADE, related_name='comment_approvals')
+    positive_votes = models.PositiveIntegerField(default=0)
+    negative_votes = models.PositiveIntegerField(default=0)
+    approval = models.FloatField()  # Share of positive votes within the group, smoothed towards 0.5
+
+    class Meta:
+        unique_together = ('comment', 'group')
+
+
+class FlagStatus(Enum):
+    PENDING = "pending"
+    CONFIRMED = "confirmed"
+    DISMISSED = "dismissed"
+
+    @classmethod
+    def choices(cls):
+        return [(key.value, key.name) for key in cls]
+
+
+class BrigadingFlag(models.Model):
+    # A burst of one-sided votes from accounts that vote alike, raised by discussable_app.brigading
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    content_object = GenericForeignKey('content_type', 'object_id')
+    detected_at = models.DateTimeField(auto_now_add=True)
+    vote_count = models.PositiveIntegerField()  # Votes on the object within the detection window
+    direction = models.IntegerField(choices=VoteType.choices())
+    similarity = models.FloatField()  # Mean Jaccard similarity of the burst voters' recent votes
+    status = models.CharField(max_length=10, choices=FlagStatus.choices(), default=FlagStatus.PENDING.value, db_index=True)
+    reviewed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            # Workers that detect the same burst share one pending flag; get_or_create retries the lookup on a clash
+            models.UniqueConstraint(
+                fields=['content_type', 'object_id'], condition=models.Q(status=FlagStatus.PENDING.value),
+                name='one_pending_brigading_flag',
+            ),
+        ]
+
+    def __str__(self):
+        return f"Brigading flag on {self.content_type.model} {self.object_id} ({self.status})"
+
+    def resolve(self, status):
+        self.status = status
+        self.reviewed_at = timezone.now()
+        self.save()
+        # Confirmed brigades keep their visibility frozen; dismissed ones follow their votes again
+        pending = BrigadingFlag.objects.filter(
+            content_type=self.content_type, object_id=self.object_id, status=FlagStatus.PENDING.value
+        )
+        if status == FlagStatus.DISMISSED.value and not pending.exists():
+            model = self.content_type.model_class()
+            votables = model.objects.filter(pk=self.object_id)
+            votables.update(visibility_held=False, updated_at=Now())
+            recompute_visibility(model, votables)
+
+
+class UserReputation(models.Model):
+    # Votes received across all discussions and comments a user created, kept current by the vote path
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='reputation')
+    total_votes = models.PositiveIntegerField(default=0)
+    positive_votes = models.PositiveIntegerField(default=0)
+    negative_votes = models.PositiveIntegerField(default=0)
+    wilson_score = models.DecimalField(max_digits=10, decimal_places=8, default=0.0)
+
+    @property
+    def approval_percentage(self):
+        return rounded_percentage(self.positive_votes, self.total_votes)
+
+    @classmethod
+    def record_votes(cls, user_id, positive_delta, negative_delta):
+        # Applies a counter change in one UPDATE; the Wilson score is computed from the new counters in the same statement
+        positive_votes = F('positive_votes') + positive_delta
+        total_votes = F('total_votes') + positive_delta + negative_delta
+        updated = cls.objects.filter(user_id=user_id).update(
+            positive_votes=positive_votes,
+            negative_votes=F('negative_votes') + negative_delta,
+            total_votes=total_votes,
+            wilson_score=wilson_score_expression(positive_votes, total_votes),
+        )
+        if not updated:
+            # First vote on this user's content: the row is built from the already updated counters. Concurrent
+            # first votes queue on the user row, and those arriving after the row exists apply their delta to it
+            with transaction.atomic():
+                list(User.objects.select_for_update().filter(pk=user_id).values_list('pk'))
+                updated = cls.objects.filter(user_id=user_id).update(
+                    positive_votes=positive_votes,
+                    negative_votes=F('negative_votes') + negative_delta,
+                    total_votes=total_votes,
+                    wilson_score=wilson_score_expression(positive_votes, total_votes),
+                )
+                if not updated:
+                    rebuild_user_reputations(User.objects.filter(pk=user_id))
+
 
 class UserPreference(Enum):
     SHOW = "show"
@@ -202,6 +491,7 @@ class UserContentPreference(models.Model):
     object_id = models.PositiveIntegerField(null=False)
     content_object = GenericForeignKey('content_type', 'object_id')
     preference = models.CharField(max_length=10, choices=UserPreference.choices(), default=UserPreference.NONE.value)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         unique_together = ('user', 'content_type', 'object_id')
@@ -210,6 +500,73 @@ class UserContentPreference(models.Model):
         return f"{self.user.username}'s preference for {self.content_object}"
 
 
+class MutedCreator(models.Model):
+    # Creators whose discussions and comments a user hides wholesale, including those posted after the mute
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='muted_creators')
+    creator = models.ForeignKey(User, on_delete=models.CASCADE, related_name='muted_by')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('user', 'creator')
+
+    def __str__(self):
+        return f"{self.user.username} muted {self.creator.username}"
+
+
+class CollapseReason(Enum):
+    # Why the filtered views send a stub in place of a discussion or comment
+    PREFERENCE = "preference"
+    MUTED = "muted"
+    HIDDEN = "hidden"
+
+    @classmethod
+    def choices(cls):
+        return [(key.value, key.name) for key in cls]
+
+
+class ArchivedDiscussion(models.Model):
+    # Read-only snapshot of an inactive discussion, moved out of the hot tables with its comments, votes and preferences
+    original_id = models.PositiveIntegerField(unique=True)
+    creator = models.ForeignKey(User, on_delete=models.CASCADE)
+    category = models.CharField(max_length=50, blank=True, null=True)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    # Serialized discussion and comments with their counters frozen at archive time
+    discussion = models.JSONField()
+    comments = models.JSONField(default=list)
+    # Compact rows: votes as [votable type, object id, user id, vote], preferences as [votable type, object id, user id, preference]
+    votes = models.JSONField(default=list)
+    preferences = models.JSONField(default=list)
+
+    def __str__(self):
+        return f"Archived: {self.discussion.get('subject', self.original_id)}"
+
+    def user_preferences(self, user, votable_type):
+        if not user.is_authenticated:
+            return {}
+        return {
+            object_id: preference for kind, object_id, user_id, preference in self.preferences
+            if kind == votable_type and user_id == user.id
+        }
+
+    def sorted_comments(self, sort_field):
+        # Orders the frozen comments like order_by(sort_field) would order the live rows
+        name = sort_field.lstrip('-')
+        field = Comment._meta.get_field(name)
+        return sorted(self.comments, key=lambda comment: field.to_python(comment[name]), reverse=sort_field.startswith('-'))
+
+
+class ArchivedCreatorTotal(models.Model):
+    # Votes a creator received in an archived thread, so reputations can still be rebuilt without the live rows
+    archive = models.ForeignKey(ArchivedDiscussion, on_delete=models.CASCADE)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    positive_votes = models.IntegerField(default=0)
+    negative_votes = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('archive', 'user')
+
+
 # Utility function to update user preferences
 def update_user_content_preference(user, content_object, preference):
     content_type = ContentType.objects.get_for_model(content_object)
@@ -219,4 +576,211 @@ def update_user_content_preference(user, content_object, preference):
         object_id=content_object.id,
         defaults={'preference': preference}
     )
-    return obj
\ No newline at end of file
+    return obj
+
+
+def vote_count_aggregates():
+    # Votes per direction. Counting `vote` rather than `id` keeps every column in vote_votable_idx, so PostgreSQL
+    # can answer from the index alone (Count('*') cannot take a filter)
+    return {
+        'positive_votes': Count('vote', filter=models.Q(vote=VoteType.POSITIVE.value)),
+        'negative_votes': Count('vote', filter=models.Q(vote=VoteType.NEGATIVE.value)),
+    }
+
+
+# Set-based equivalents of the per-object scoring in Votable.get_vote_data, used to rescore many rows at once
+def wilson_score_expression(positive, total):
+    n = Cast(total, models.FloatField())
+    phat = Cast(positive, models.FloatField()) / n
+    z_squared = Value(WILSON_Z ** 2)
+    lower_bound = (
+        phat + z_squared / (2 * n) - Value(WILSON_Z) * Sqrt((phat * (1 - phat) + z_squared / (4 * n)) / n)
+    ) / (1 + z_squared / n)
+    return Case(When(GreaterThan(total, 0), then=lower_bound), default=Value(0.0), output_field=models.FloatField())
+
+
+def rounded_percentage(part, total):
+    # Exact, so halves round to even instead of wherever float error puts them
+    return round(Fraction(part * 100, total)) if total > 0 else 0
+
+
+def percentage_expression(part, total):
+    # rounded_percentage in integer arithmetic; SQL ROUND would round halves away from zero
+    quotient = part * 100 / total
+    remainder = Mod(part * 100, total, output_field=models.IntegerField())
+    round_up = Case(
+        When(GreaterThan(remainder * 2, total), then=Value(1)),
+        When(Exact(remainder * 2, total), then=Mod(quotient, 2, output_field=models.IntegerField())),
+        default=Value(0),
+    )
+    return Case(
+        When(GreaterThan(total, 0), then=quotient + round_up),
+        default=Value(0),
+        output_field=models.IntegerField(),
+    )
+
+
+def with_viewer_visibility(queryset, user):
+    """
+    Annotates each row with `viewer_preference`, the user's explicit preference read through a LEFT JOIN,
+    and `collapsed`, the CollapseReason value hiding it from the user or None. An explicit show wins over
+    everything, then an explicit hide, a muted creator and finally the global visibility status.
+    """
+    hidden = When(visibility_status=VisibilityStatus.HIDDEN.value, then=Value(CollapseReason.HIDDEN.value))
+    if not user.is_authenticated:
+        return queryset.annotate(
+            viewer_preference=Value(UserPreference.NONE.value),
+            collapsed=Case(hidden, default=None, output_field=models.CharField()),
+        )
+    queryset = queryset.annotate(
+        viewer_preferences=FilteredRelation('preferences', condition=models.Q(preferences__user=user)),
+    ).annotate(
+        viewer_preference=Coalesce('viewer_preferences__preference', Value(UserPreference.NONE.value)),
+    )
+    return queryset.annotate(collapsed=Case(
+        When(viewer_preference=UserPreference.SHOW.value, then=None),
+        When(viewer_preference=UserPreference.HIDE.value, then=Value(CollapseReason.PREFERENCE.value)),
+        When(Exists(MutedCreator.objects.filter(user=user, creator=OuterRef('creator_id'))),
+             then=Value(CollapseReason.MUTED.value)),
+        hidden,
+        default=None,
+        output_field=models.CharField(),
+    ))
+
+
+def recompute_visibility(model, queryset=None, categories=None, batch_size=5000):
+    """
+    Brings visibility_status in line with the vote counters and the category thresholds without loading
+    any rows: per id range and threshold, one UPDATE hides and one shows, each touching only the rows whose
+    status changes. Rows held for a brigading review keep their status. `categories` limits the run to
+    those categories. Returns the number of rows changed.
+    """
+    queryset = model.objects.all() if queryset is None else queryset
+    thresholds = CategoryVisibilityThreshold.thresholds()
+    category = model.CATEGORY_LOOKUP
+
+    # Rows of categories without an override share the default threshold
+    groups = [(models.Q(**{f'{category}__in': [name]}), threshold) for name, threshold in thresholds.items()]
+    groups.append((~models.Q(**{f'{category}__in': list(thresholds)}), Votable.VISIBILITY_THRESHOLD))
+    if categories is not None:
+        groups = [
+            (condition & models.Q(**{f'{category}__in': list(categories)}), threshold) for condition, threshold in groups
+        ]
+
+    bounds = queryset.aggregate(first=Min('pk'), last=Max('pk'))
+    if bounds['first'] is None:
+        return 0
+    changed = 0
+    for start in range(bounds['first'], bounds['last'] + 1, batch_size):
+        chunk = queryset.filter(pk__gte=start, pk__lt=start + batch_size, visibility_held=False)
+        for condition, threshold in groups:
+            rows = chunk.filter(condition)
+            below = LessThan(F('positive_votes') * 100, F('total_votes') * threshold)
+            at_or_above = GreaterThanOrEqual(F('positive_votes') * 100, F('total_votes') * threshold)
+            changed += rows.filter(below).exclude(visibility_status=VisibilityStatus.HIDDEN.value).update(
+                visibility_status=VisibilityStatus.HIDDEN.value, updated_at=Now(),
+            )
+            changed += rows.filter(at_or_above).exclude(visibility_status=VisibilityStatus.VISIBLE.value).update(
+                visibility_status=VisibilityStatus.VISIBLE.value, updated_at=Now(),
+            )
+    return changed
+
+
+def rescore_votables(model, queryset=None, batch_size=900):
+    # Recompute the vote counters of every row in the queryset from one grouped aggregate over the Vote table
+    queryset = model.objects.all() if queryset is None else queryset
+    content_type = ContentType.objects.get_for_model(model)
+    vote_counts = Vote.objects.filter(
+        content_type=content_type, object_id__in=queryset.values('pk')
+    ).order_by().values('object_id').annotate(**vote_count_aggregates())
+
+    # Counter pairs repeat heavily across votables, so rows sharing a pair are updated together
+    ids_by_counts = {}
+    for row in vote_counts.iterator(chunk_size=batch_size):
+        ids_by_counts.setdefault((row['positive_votes'], row['negative_votes']), []).append(row['object_id'])
+
+    with transaction.atomic():
+        queryset.update(positive_votes=0, negative_votes=0, total_votes=0)
+        for (positive, negative), ids in ids_by_counts.items():
+            for start in range(0, len(ids), batch_size):
+                model.objects.filter(pk__in=ids[start:start + batch_size]).update(
+                    positive_votes=positive, negative_votes=negative, total_votes=positive + negative,
+                )
+
+        # The derived columns only depend on the counters, so they are filled in by a single UPDATE
+        total_users = User.objects.count()
+        updated = queryset.update(
+            participation_percentage=percentage_expression(F('total_votes'), Value(total_users)),
+            positive_percentage=percentage_expression(F('positive_votes'), F('total_votes')),
+            negative_percentage=percentage_expression(F('negative_votes'), F('total_votes')),
+            wilson_score=wilson_score_expression(F('positive_votes'), F('total_votes')),
+            updated_at=Now(),
+        )
+        recompute_visibility(model, queryset)
+        return updated
+
+
+def rebuild_user_reputations(users=None, batch_size=1000):
+    # Rebuilds reputation rows from the counters stored on discussions and comments, without touching Vote
+    users = User.objects.all() if users is None else users
+    totals = {}
+    for model in (Discussion, Comment):
+        rows = model.objects.filter(creator__in=users).order_by().values('creator_id').annotate(
+            positive=Sum('positive_votes'), negative=Sum('negative_votes'),
+        )
+        for row in rows.iterator(chunk_size=batch_size):
+            positive, negative = totals.get(row['creator_id'], (0, 0))
+            totals[row['creator_id']] = (positive + row['positive'], negative + row['negative'])
+
+    # Archived threads no longer have rows to sum, so their frozen per-creator totals are added instead
+    archived_totals = ArchivedCreatorTotal.objects.filter(user__in=users).order_by().values('user_id').annotate(
+        positive=Sum('positive_votes'), negative=Sum('negative_votes'),
+    )
+    for row in archived_totals.iterator(chunk_size=batch_size):
+        positive, negative = totals.get(row['user_id'], (0, 0))
+        totals[row['user_id']] = (positive + row['positive'], negative + row['negative'])
+
+    reputations = [
+        UserReputation(user_id=user_id, positive_votes=positive, negative_votes=negative, total_votes=positive + negative)
+        for user_id, (positive, negative) in totals.items()
+    ]
+    # Rows are upserted rather than deleted and recreated, so a vote recording its delta meanwhile never
+    # finds the row missing and tries to create it a second time
+    with transaction.atomic():
+        UserReputation.objects.filter(user__in=users).exclude(user_id__in=totals).delete()
+        UserReputation.objects.bulk_create(
+            reputations, batch_size=batch_size, update_conflicts=True, unique_fields=['user'],
+            update_fields=['positive_votes', 'negative_votes', 'total_votes'],
+        )
+        UserReputation.objects.filter(user__in=users).update(
+            wilson_score=wilson_score_expression(F('positive_votes'), F('total_votes'))
+        )
+    return len(reputations)
+
+
+def rebuild_comment_subtrees(discussions=None, batch_size=1000):
+    # Recomputes the subtree aggregates of every comment in the given discussions from the stored counters
+    comments = Comment.objects.all() if discussions is None else Comment.objects.filter(discussion__in=discussions)
+    rows = comments.order_by('-id').values_list('id', 'parent_id', 'total_votes', 'wilson_score', *Comment.SUBTREE_FIELDS)
+
+    # Replies are always created after their parent, so walking ids downwards completes children first
+    subtrees = {}
+    stored = {}
+    for comment_id, parent_id, total_votes, wilson_score, *stored_values in rows.iterator(chunk_size=batch_size):
+        stored[comment_id] = tuple(stored_values)
+        descendants, votes, best = subtrees.get(comment_id, (0, 0, 0))
+        votes, best = votes + total_votes, max(best, wilson_score)
+        subtrees[comment_id] = (descendants, votes, best)
+        if parent_id is not None:
+            parent_descendants, parent_votes, parent_best = subtrees.get(parent_id, (0, 0, 0))
+            subtrees[parent_id] = (parent_descendants + descendants + 1, parent_votes + votes, max(parent_best, best))
+
+    # Only rows whose aggregates drifted are written, so a rebuild does not mark every comment as changed
+    updates = [
+        Comment(id=comment_id, descendant_count=descendants, subtree_total_votes=votes, subtree_best_wilson=best, updated_at=Now())
+        for comment_id, (descendants, votes, best) in subtrees.items()
+        if stored.get(comment_id) != (descendants, votes, best)
+    ]
+    with transaction.atomic():
+        Comment.objects.bulk_update(updates, Comment.SUBTREE_FIELDS + ('updated_at',), batch_size=batch_size)
+    return len(updates)
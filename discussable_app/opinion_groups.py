@@ -0,0 +1,179 @@
+# discussable_app/opinion_groups.py
+# Opinion groups: clusters of users who vote alike, found offline by build_opinion_groups.
+#
+# Votes are streamed into a sparse user x votable matrix (+1 / -1, missing votes are 0), projected
+# onto its first principal components without densifying it, and the projections are clustered
+# with k-means. Each comment then gets the approval of every group, stored in CommentGroupApproval.
+import numpy as np
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from scipy import sparse
+from scipy.sparse.linalg import LinearOperator, svds
+
+from .models import Comment, CommentGroupApproval, OpinionGroup, Vote, VoteType
+
+SILHOUETTE_SAMPLE_SIZE = 2000
+
+
+def vote_matrix(batch_size=100000):
+    """
+    Streams every vote into a CSR matrix with one row per user and one column per votable.
+    Returns (matrix, user ids, column keys); a column key is object_id * 2, plus 1 for comments.
+    """
+    comment_ct = ContentType.objects.get_for_model(Comment)
+    users, columns, values = [], [], []
+
+    def flush(rows):
+        array = np.array(rows, dtype=np.int64)
+        users.append(array[:, 0])
+        columns.append(array[:, 2] * 2 + (array[:, 1] == comment_ct.id))
+        values.append(array[:, 3].astype(np.int8))
+
+    votes = Vote.objects.exclude(vote=VoteType.NO_VOTE.value).order_by().values_list(
+        'user_id', 'content_type_id', 'object_id', 'vote'
+    )
+    rows = []
+    for row in votes.iterator(chunk_size=batch_size):
+        rows.append(row)
+        if len(rows) >= batch_size:
+            flush(rows)
+            rows = []
+    if rows:
+        flush(rows)
+    if not users:
+        return sparse.csr_matrix((0, 0), dtype=np.float32), np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+
+    user_ids, user_rows = np.unique(np.concatenate(users), return_inverse=True)
+    column_keys, column_indexes = np.unique(np.concatenate(columns), return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (np.concatenate(values).astype(np.float32), (user_rows, column_indexes)),
+        shape=(len(user_ids), len(column_keys)),
+    )
+    return matrix, user_ids, column_keys
+
+
+def principal_projections(matrix, n_components, rng):
+    # Projections of the column-centered matrix onto its top principal components; centering stays implicit
+    means = np.asarray(matrix.mean(axis=0)).ravel()
+
+    # Each product works on vectors and on blocks of column vectors alike
+    def product(v):
+        return matrix @ v - means @ v
+
+    def adjoint_product(u):
+        return matrix.T @ u - np.multiply.outer(means, u.sum(axis=0))
+
+    centered = LinearOperator(
+        matrix.shape, matvec=product, rmatvec=adjoint_product, matmat=product, rmatmat=adjoint_product,
+        dtype=np.float64,
+    )
+    u, s, _ = svds(centered, k=n_components, v0=rng.standard_normal(min(matrix.shape)))
+    return u * s
+
+
+def kmeans(points, k, rng, iterations=100):
+    # Lloyd's algorithm with k-means++ seeding; returns (labels, centers)
+    centers = points[[rng.integers(len(points))]]
+    for _ in range(1, k):
+        distances = ((points[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2).min(axis=1)
+        total = distances.sum()
+        chosen = rng.choice(len(points), p=distances / total) if total > 0 else rng.integers(len(points))
+        centers = np.vstack([centers, points[chosen]])
+
+    for _ in range(iterations):
+        labels = ((points[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2).argmin(axis=1)
+        sizes = np.bincount(labels, minlength=k)
+        sums = np.stack([np.bincount(labels, weights=points[:, d], minlength=k) for d in range(points.shape[1])], axis=1)
+        # Empty clusters keep their previous center
+        updated = np.where(sizes[:, None] > 0, sums / np.maximum(sizes, 1)[:, None], centers)
+        if np.allclose(updated, centers):
+            break
+        centers = updated
+    return labels, centers
+
+
+def sampled_silhouette(points, labels, rng):
+    # Mean silhouette coefficient over a random sample, to compare group counts without O(n^2) memory
+    sample = rng.choice(len(points), min(SILHOUETTE_SAMPLE_SIZE, len(points)), replace=False)
+    points, labels = points[sample], labels[sample]
+    distances = np.sqrt(((points[:, None, :] - points[None, :, :]) ** 2).sum(axis=2))
+    clusters = np.unique(labels)
+    if len(clusters) < 2:
+        return -1.0
+
+    totals = np.stack([distances[:, labels == cluster].sum(axis=1) for cluster in clusters], axis=1)
+    sizes = np.array([(labels == cluster).sum() for cluster in clusters])
+    own = np.searchsorted(clusters, labels)
+    own_sizes = sizes[own] - 1
+    a = np.where(own_sizes > 0, totals[np.arange(len(labels)), own] / np.maximum(own_sizes, 1), 0)
+    means = totals / sizes
+    means[np.arange(len(labels)), own] = np.inf
+    b = means.min(axis=1)
+    scores = np.where(own_sizes > 0, (b - a) / np.maximum(np.maximum(a, b), 1e-12), 0)
+    return float(scores.mean())
+
+
+def group_votes(matrix, labels, k):
+    # (groups x columns) counts of positive and negative votes cast by each group's members
+    indicator = sparse.csr_matrix(
+        (np.ones(len(labels), dtype=np.float32), (labels, np.arange(len(labels)))), shape=(k, len(labels))
+    )
+    positive = (indicator @ (matrix > 0).astype(np.float32)).toarray()
+    negative = (indicator @ (matrix < 0).astype(np.float32)).toarray()
+    return positive.astype(np.int64), negative.astype(np.int64)
+
+
+def build_opinion_groups(n_components=2, max_groups=5, min_votes=5, seed=0, batch_size=100000):
+    """
+    Recomputes the opinion groups and the per-group approval of every comment.
+    Returns the number of groups found, 0 when there are too few active voters.
+    """
+    rng = np.random.default_rng(seed)
+    matrix, _, column_keys = vote_matrix(batch_size)
+
+    # Users with only a handful of votes carry too little signal to place, and do not count towards any group
+    active = np.diff(matrix.indptr) >= min_votes
+    matrix = matrix[active]
+    if matrix.shape[0] <= max(n_components, 2) or matrix.shape[1] <= n_components:
+        return 0
+
+    points = principal_projections(matrix, n_components, rng)
+    best = None
+    for k in range(2, max_groups + 1):
+        if k >= len(points):
+            break
+        labels, _ = kmeans(points, k, rng)
+        score = sampled_silhouette(points, labels, rng)
+        if best is None or score > best[0]:
+            best = (score, k, labels)
+    _, k, labels = best
+
+    comment_columns = np.flatnonzero(column_keys % 2 == 1)
+    positive, negative = group_votes(matrix[:, comment_columns], labels, k)
+    comment_ids = column_keys[comment_columns] // 2
+    # Every group gets a row for every comment voted on by an active user, so a silent group reads as no agreement
+    voted = np.flatnonzero((positive + negative).sum(axis=0) > 0)
+    approval = (positive + 1) / (positive + negative + 2)  # Smoothed towards 0.5 for groups with few votes
+    member_counts = np.bincount(labels, minlength=k)
+
+    with transaction.atomic():
+        OpinionGroup.objects.all().delete()
+        groups = OpinionGroup.objects.bulk_create(
+            OpinionGroup(number=number, member_count=int(member_counts[number])) for number in range(k)
+        )
+        for start in range(0, len(voted), batch_size):
+            columns = voted[start:start + batch_size]
+            # Votes outlive deleted comments, so only comments that still exist get rows
+            existing = set(Comment.objects.filter(id__in=comment_ids[columns].tolist()).values_list('id', flat=True))
+            CommentGroupApproval.objects.bulk_create(
+                CommentGroupApproval(
+                    comment_id=int(comment_ids[column]),
+                    group=group,
+                    positive_votes=int(positive[group.number, column]),
+                    negative_votes=int(negative[group.number, column]),
+                    approval=float(approval[group.number, column]),
+                )
+                for column in columns if int(comment_ids[column]) in existing
+                for group in groups
+            )
+    return k
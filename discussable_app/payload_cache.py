@@ -0,0 +1,76 @@
+# discussable_app/payload_cache.py
+# Cached discussion detail payloads for anonymous readers, stored already compressed.
+#
+# Entries are keyed by discussion, request variant and encoding, plus a per-discussion version
+# and a global generation. Votes and new comments replace the version of their discussion and bulk
+# jobs replace the generation, so stale entries are never read again and simply expire. The JSON
+# itself is cached too, so a hot thread is serialized once and compressed once per encoding.
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+
+from discussable_backend.compression import compress
+
+GENERATION_KEY = 'discussion-payload-generation'
+
+
+def version_key(discussion_id):
+    return f'discussion-payload-version:{discussion_id}'
+
+
+def discussion_payload_changed(discussion_id):
+    # Versions are unique tokens rather than counters, so an evicted version never brings back old entries
+    cache.set(version_key(discussion_id), time.time_ns(), None)
+
+
+def invalidate_detail_payloads():
+    # Used after bulk changes to scores, groups or related discussions
+    cache.set(GENERATION_KEY, time.time_ns(), None)
+
+
+class CachedPayload:
+
+    def __init__(self, discussion_id, *variant):
+        # The versions are read before the payload is built, so a change during the build makes the entry stale
+        keys = [GENERATION_KEY, version_key(discussion_id)]
+        versions = cache.get_many(keys)
+        for key in keys:
+            if key not in versions:
+                versions[key] = time.time_ns()
+                if not cache.add(key, versions[key], None):
+                    versions[key] = cache.get(key, versions[key])
+        # The variant holds whatever else shapes the payload: sort, sparse fieldset, filters
+        self.prefix = ':'.join(map(str, ('discussion-payload', discussion_id, versions[keys[0]], versions[keys[1]], *variant)))
+
+    def key(self, encoding):
+        return f'{self.prefix}:{encoding or "identity"}'
+
+    def get(self, encoding):
+        # Compressed bytes for the encoding, compressing the cached JSON on a first request for it
+        body = cache.get(self.key(encoding))
+        if body is None and encoding is not None:
+            content = cache.get(self.key(None))
+            if content is not None:
+                body = self.store_encoded(content, encoding)
+        return body
+
+    def store(self, content, encoding):
+        # Caches the rendered JSON and its encoded form; returns the bytes to send
+        cache.set(self.key(None), content, settings.DETAIL_PAYLOAD_CACHE_TTL)
+        return self.store_encoded(content, encoding) if encoding is not None else content
+
+    def store_encoded(self, content, encoding):
+        body = compress(content, encoding, cached=True)
+        cache.set(self.key(encoding), body, settings.DETAIL_PAYLOAD_CACHE_TTL)
+        return body
+
+
+def payload_response(body, encoding):
+    response = HttpResponse(body, content_type='application/json')
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
@@ -1,16 +1,150 @@
 # discussable_app/serializers.py
 
-from rest_framework import serializers
-from .models import Discussion, Comment, Vote, UserPreference
+import hashlib
+from decimal import Decimal
+from functools import lru_cache
+from types import SimpleNamespace
 
+from django.conf import settings
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+from .models import Discussion, Comment, Vote, UserPreference, UserReputation
 
-class DiscussionSerializer(serializers.ModelSerializer):
+
+def requested_fields(request, model):
+    # Names from ?fields[<model>]=a,b or ?fields=a,b on read requests, None when every field is wanted
+    if request is None or request.method != 'GET':
+        return None
+    params = getattr(request, 'query_params', request.GET)
+    value = params.get(f'fields[{model._meta.model_name}]') or params.get('fields')
+    if not value:
+        return None
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+@lru_cache(maxsize=None)
+def output_fields(serializer_class):
+    return frozenset(name for name, field in serializer_class().fields.items() if not field.write_only)
+
+
+def fieldset_key(request):
+    # The fields a request's sparse fieldsets leave in the detail payload, for keying cached payloads.
+    # Unknown names are dropped and the rest sorted and hashed, so arbitrary query values neither
+    # multiply the cache variants nor produce keys the cache backend rejects.
+    parts = []
+    for serializer_class in (DiscussionSerializer, CommentSerializer):
+        model = serializer_class.Meta.model
+        requested = requested_fields(request, model)
+        if requested is not None:
+            parts.append(f"{model._meta.model_name}={','.join(sorted(requested & output_fields(serializer_class)))}")
+    if not parts:
+        return ''
+    return hashlib.sha256('&'.join(parts).encode()).hexdigest()[:16]
+
+
+class SparseFieldsMixin:
+    # Drops the fields not named in ?fields=, so they are neither computed nor sent; unknown names are ignored
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        requested = requested_fields(self.context.get('request'), self.Meta.model)
+        if requested:
+            for name in set(self.fields) - requested:
+                self.fields.pop(name)
+
+
+class ValuesSerializer:
+    """
+    Read-only fast path for a ModelSerializer: output is built straight from .values() rows, skipping
+    model instances. Plain values are copied as they are; only fields whose representation differs
+    from the database value, such as decimals and datetimes, go through their serializer field.
+    Rows carrying a `collapsed` reason (see with_viewer_visibility) become stubs of their id, the reason
+    and the `stub_fields` columns.
+    """
+    PASS_THROUGH = (
+        serializers.IntegerField, serializers.FloatField, serializers.CharField, serializers.BooleanField,
+        serializers.ChoiceField, serializers.PrimaryKeyRelatedField,
+    )
+
+    def __init__(self, serializer_class, context=None, stub_fields=()):
+        serializer = serializer_class(context=context if context is not None else {})
+        # (output name, bound method of a method field, source column, converter) per readable field
+        self.plan = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            if isinstance(field, serializers.SerializerMethodField):
+                self.plan.append((name, getattr(serializer, field.method_name), None, None))
+            else:
+                converter = None if type(field) in self.PASS_THROUGH else self.converter(field)
+                self.plan.append((name, None, field.source, converter))
+        self.columns = [source for _, method, source, _ in self.plan if method is None]
+        self.has_methods = len(self.columns) < len(self.plan)
+        self.stub_fields = stub_fields
+
+    @staticmethod
+    def converter(field):
+        # Decimals come back from the database at the field's precision and datetimes as aware values, which
+        # allows cheaper equivalents of the field's representation; anything else goes through the field
+        if (type(field) is serializers.DecimalField and field.decimal_places is not None and not field.localize
+                and getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)):
+            exponent = -field.decimal_places
+
+            def convert_decimal(value):
+                if isinstance(value, Decimal) and value.as_tuple().exponent == exponent:
+                    return format(value, 'f')
+                return field.to_representation(value)
+            return convert_decimal
+
+        if type(field) is serializers.DateTimeField and getattr(field, 'format', api_settings.DATETIME_FORMAT) == ISO_8601:
+            field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+
+            def convert_datetime(value):
+                if field_timezone is None or value is None or value.tzinfo is None:
+                    return field.to_representation(value)
+                value = value.astimezone(field_timezone).isoformat()
+                return value[:-6] + 'Z' if value.endswith('+00:00') else value
+            return convert_datetime
+
+        return field.to_representation
+
+    def values(self, queryset, *extra):
+        # Extra columns are fetched for the caller's own use, e.g. as a keyset position
+        return queryset.values(*dict.fromkeys(('pk', *extra, *self.stub_fields, *self.columns)))
+
+    def to_representation(self, rows):
+        data = []
+        for row in rows:
+            collapsed = row.get('collapsed')
+            if collapsed:
+                data.append({'id': row['pk'], **{name: row[name] for name in self.stub_fields}, 'collapsed': collapsed})
+                continue
+            if self.has_methods:
+                # Method fields get a lightweight object with the row's columns as attributes
+                obj = SimpleNamespace(**row)
+                obj.id = row['pk']
+            item = {}
+            for name, method, source, converter in self.plan:
+                if method is not None:
+                    item[name] = method(obj)
+                else:
+                    value = row[source]
+                    item[name] = converter(value) if converter is not None else value
+            data.append(item)
+        return data
+
+    def serialize(self, queryset):
+        return self.to_representation(self.values(queryset))
+
+
+class DiscussionSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     creator = serializers.HiddenField(default=serializers.CurrentUserDefault())
     user_preference = serializers.SerializerMethodField()
 
     class Meta:
         model = Discussion
         fields = '__all__'
+        read_only_fields = Discussion.MAINTAINED_FIELDS
 
     def get_user_preference(self, obj):
         user_pref_dict = self.context.get('user_preferences', {})
@@ -22,18 +156,29 @@ class DiscussionSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
-class CommentSerializer(serializers.ModelSerializer):
+class CommentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     user_preference = serializers.SerializerMethodField()
+    group_approval = serializers.SerializerMethodField()
 
     class Meta:
         model = Comment
         fields = '__all__'
-        read_only_fields = ('creator', 'discussion')
+        read_only_fields = ('creator', 'discussion') + Comment.MAINTAINED_FIELDS
 
     def get_user_preference(self, obj):
         user_pref_dict = self.context.get('user_preferences', {})
         return user_pref_dict.get(obj.id, UserPreference.NONE.value)
 
+    def get_group_approval(self, obj):
+        # Per opinion group approval, precomputed by build_opinion_groups and passed in by the view
+        groups = self.context.get('group_approvals', {}).get(obj.id)
+        if not groups:
+            return None
+        return {
+            'groups': groups,
+            'agreed_across_groups': all(group['approval'] >= settings.OPINION_GROUP_AGREEMENT for group in groups),
+        }
+
     def create(self, validated_data):
         user = self.context['request'].user
         discussion = self.context['discussion']
@@ -48,4 +193,12 @@ class VoteSerializer(serializers.ModelSerializer):
     class Meta:
         model = Vote
         fields = ['id', 'user', 'content_type', 'object_id', 'vote', 'created_at']
-        read_only_fields = ['user', 'content_type', 'object_id']
\ No newline at end of file
+        read_only_fields = ['user', 'content_type', 'object_id']
+
+
+class UserReputationSerializer(serializers.ModelSerializer):
+    approval_percentage = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = UserReputation
+        fields = ['total_votes', 'positive_votes', 'negative_votes', 'approval_percentage', 'wilson_score']
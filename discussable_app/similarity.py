@@ -0,0 +1,203 @@
+# discussable_app/similarity.py
+# TF-IDF similarity between discussions, built offline by build_similarity_model.
+#
+# Text is hashed into a fixed number of features, so no vocabulary has to be stored or loaded.
+# The build writes the precomputed top-k neighbours of every discussion to RelatedDiscussion and
+# saves an inverted index (feature -> discussions) as .npy files. Request-time scoring memory-maps
+# those files and only reads the postings of the query's own terms.
+import os
+import re
+import shutil
+import time
+import zlib
+from collections import Counter
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, FloatField, Window
+from django.db.models.functions import Cast, RowNumber
+from scipy import sparse
+
+from .models import Comment, Discussion, RelatedDiscussion
+
+N_FEATURES = 2 ** 20
+MAX_DOCUMENT_FREQUENCY = 0.5  # Terms in more than this share of discussions carry no signal and are dropped
+MAX_DF_MIN_DOCUMENTS = 20  # Below this many discussions a shared term is the only signal there is, so none are dropped
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+STOP_WORDS = frozenset(
+    'a about an and are as at be but by can do for from has have how i if in is it its not of on or should '
+    'so that the their there they this to was we were what when where which who why will with would you'.split()
+)
+MODEL_FILES = ('ids', 'idf', 'indptr', 'indices', 'data')
+
+
+def term_features(text):
+    # Feature column -> occurrences for every non-stop-word term of the text
+    terms = (term for term in TOKEN_RE.findall(text.lower()) if len(term) > 1 and term not in STOP_WORDS)
+    return Counter(zlib.crc32(term.encode()) % N_FEATURES for term in terms)
+
+
+def discussion_documents(top_comments):
+    # (ids, texts) of every discussion: its subject followed by its best scored comments
+    # Ordering by the float value avoids SQLite wrapping the decimal window ordering in a CAST
+    best_first = Cast('wilson_score', FloatField()).desc()
+    ranked = Comment.objects.annotate(
+        position=Window(RowNumber(), partition_by=F('discussion_id'), order_by=best_first)
+    ).filter(position__lte=top_comments).values_list('discussion_id', 'comment_content')
+    comment_text = {}
+    for discussion_id, content in ranked.iterator():
+        comment_text.setdefault(discussion_id, []).append(content)
+
+    ids, texts = [], []
+    for discussion_id, subject in Discussion.objects.order_by('id').values_list('id', 'subject').iterator():
+        ids.append(discussion_id)
+        texts.append(' '.join([subject, *comment_text.get(discussion_id, [])]))
+    return np.array(ids, dtype=np.int64), texts
+
+
+def tfidf_matrix(texts):
+    # Row-normalized documents x features matrix with sublinear term frequencies, and the idf weights used
+    rows, columns, counts = [], [], []
+    for row, text in enumerate(texts):
+        features = term_features(text)
+        rows.extend([row] * len(features))
+        columns.extend(features.keys())
+        counts.extend(features.values())
+    rows = np.array(rows, dtype=np.int64)
+    columns = np.array(columns, dtype=np.int64)
+
+    n_documents = len(texts)
+    document_frequency = np.bincount(columns, minlength=N_FEATURES)
+    idf = (np.log((1 + n_documents) / (1 + document_frequency)) + 1).astype(np.float32)
+    if n_documents >= MAX_DF_MIN_DOCUMENTS:
+        idf[document_frequency > MAX_DOCUMENT_FREQUENCY * n_documents] = 0
+
+    weights = (1 + np.log(np.array(counts, dtype=np.float32))) * idf[columns]
+    norms = np.sqrt(np.bincount(rows, weights=weights ** 2, minlength=n_documents))
+    weights /= np.where(norms > 0, norms, 1)[rows]
+    matrix = sparse.csr_matrix((weights, (rows, columns)), shape=(n_documents, N_FEATURES), dtype=np.float32)
+    matrix.eliminate_zeros()
+    return matrix, idf
+
+
+def nearest_neighbours(matrix, k, min_score, block_size=1000):
+    # Yields (row, neighbour rows, scores) with the k most similar other rows, one block of rows at a time
+    transposed = matrix.T.tocsr()
+    for start in range(0, matrix.shape[0], block_size):
+        similarities = (matrix[start:start + block_size] @ transposed).tocsr()
+        for offset in range(similarities.shape[0]):
+            row = start + offset
+            begin, end = similarities.indptr[offset], similarities.indptr[offset + 1]
+            columns, scores = similarities.indices[begin:end], similarities.data[begin:end]
+            keep = (columns != row) & (scores >= min_score)
+            columns, scores = columns[keep], scores[keep]
+            if len(scores) > k:
+                top = np.argpartition(-scores, k)[:k]
+                columns, scores = columns[top], scores[top]
+            order = np.argsort(-scores)
+            yield row, columns[order], scores[order]
+
+
+def build_similarity_model(k=None, top_comments=None, min_score=None, batch_size=5000):
+    """
+    Rebuilds RelatedDiscussion and saves a new inverted index for similar_subjects.
+    Returns the number of discussions indexed.
+    """
+    k = k or settings.SIMILARITY_NEIGHBOURS
+    top_comments = settings.SIMILARITY_TOP_COMMENTS if top_comments is None else top_comments
+    min_score = settings.SIMILARITY_MIN_SCORE if min_score is None else min_score
+
+    ids, texts = discussion_documents(top_comments)
+    matrix, idf = tfidf_matrix(texts)
+
+    with transaction.atomic():
+        RelatedDiscussion.objects.all().delete()
+        related = []
+        for row, neighbours, scores in nearest_neighbours(matrix, k, min_score):
+            related.extend(
+                RelatedDiscussion(discussion_id=ids[row], related_id=ids[neighbour], score=float(score))
+                for neighbour, score in zip(neighbours, scores)
+            )
+            if len(related) >= batch_size:
+                RelatedDiscussion.objects.bulk_create(related)
+                related = []
+        RelatedDiscussion.objects.bulk_create(related)
+
+    save_model(ids, idf, matrix.T.tocsr())
+    return len(ids)
+
+
+def save_model(ids, idf, inverted):
+    # Each build goes to its own directory; CURRENT is switched atomically so readers never see a partial model
+    root = Path(settings.SIMILARITY_MODEL_DIR)
+    version = f'model-{time.time_ns()}'
+    (root / version).mkdir(parents=True)
+    arrays = {
+        'ids': ids,
+        'idf': idf,
+        'indptr': inverted.indptr.astype(np.int64),
+        'indices': inverted.indices.astype(np.int32),
+        'data': inverted.data.astype(np.float32),
+    }
+    for name in MODEL_FILES:
+        np.save(root / version / f'{name}.npy', arrays[name])
+
+    pointer = root / 'CURRENT'
+    previous = pointer.read_text().strip() if pointer.exists() else None
+    (root / 'CURRENT.tmp').write_text(version)
+    os.replace(root / 'CURRENT.tmp', pointer)
+
+    # The previous model is kept for processes that still have it mapped
+    for path in root.glob('model-*'):
+        if path.name not in (version, previous):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+@lru_cache(maxsize=2)
+def load_model(path):
+    return {name: np.load(Path(path) / f'{name}.npy', mmap_mode='r') for name in MODEL_FILES}
+
+
+def current_model():
+    root = Path(settings.SIMILARITY_MODEL_DIR)
+    try:
+        version = (root / 'CURRENT').read_text().strip()
+    except FileNotFoundError:
+        return None
+    return load_model(str(root / version))
+
+
+def similar_subjects(text, limit=None):
+    # [(discussion id, score)] for the discussions most similar to a new subject, best first
+    limit = limit or settings.SIMILARITY_NEIGHBOURS
+    model = current_model()
+    features = term_features(text)
+    if model is None or not features:
+        return []
+
+    columns = np.fromiter(features.keys(), dtype=np.int64)
+    weights = (1 + np.log(np.fromiter(features.values(), dtype=np.float32))) * model['idf'][columns]
+    norm = np.sqrt((weights ** 2).sum())
+    if norm == 0:
+        return []
+    weights /= norm
+
+    indptr, indices, data = model['indptr'], model['indices'], model['data']
+    postings = [(indptr[column], indptr[column + 1], weight) for column, weight in zip(columns, weights) if weight]
+    if not postings:
+        return []
+    documents = np.concatenate([indices[begin:end] for begin, end, _ in postings])
+    contributions = np.concatenate([data[begin:end] * weight for begin, end, weight in postings])
+    if not documents.size:
+        return []
+
+    rows, positions = np.unique(documents, return_inverse=True)
+    scores = np.bincount(positions, weights=contributions)
+    if len(scores) > limit:
+        top = np.argpartition(-scores, limit)[:limit]
+        rows, scores = rows[top], scores[top]
+    order = np.argsort(-scores)
+    return [(int(model['ids'][row]), float(score)) for row, score in zip(rows[order], scores[order])]
@@ -0,0 +1,209 @@
+# discussable_app/sync.py
+# Delta sync: the rows created or changed since a cursor, for clients that keep a local copy.
+#
+# Every stream (discussions, comments, the user's preferences, archived and deleted discussions and
+# comments) is read in (timestamp, id) keyset order from its indexed timestamp, and the cursor holds
+# the position reached in each stream, so a page costs a range scan whatever the size of the tables.
+# A row's timestamp is taken before its transaction commits, so cursors never move past the start of
+# the oldest transaction still open on the primary (reported by PostgreSQL only), nor into the last
+# SYNC_SETTLE_SECONDS: a cursor already past a row's timestamp when it commits would never return it.
+# For the same reason pages are always read from the primary, since replica lag has no bound.
+import base64
+import json
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from discussable_backend.db_routers import primary_reads
+
+from .models import ArchivedDiscussion, Comment, DeletedVotable, Discussion, UserContentPreference
+from .serializers import CommentSerializer, DiscussionSerializer, ValuesSerializer
+from .views import comment_group_approvals
+
+STREAMS = ('discussions', 'comments', 'preferences', 'archived', 'deleted')
+TIMESTAMP_FIELDS = {'archived': 'archived_at', 'deleted': 'deleted_at'}  # Other streams follow updated_at
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(positions):
+    payload = {stream: [timestamp.isoformat(), pk] for stream, (timestamp, pk) in positions.items()}
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    # Stream -> (timestamp, id) of the last row returned; an empty cursor starts from the beginning
+    if not cursor:
+        return {}
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        positions = {
+            stream: (datetime.fromisoformat(timestamp), int(pk))
+            for stream, (timestamp, pk) in payload.items() if stream in STREAMS
+        }
+    except (ValueError, TypeError, AttributeError):
+        raise InvalidCursor(cursor)
+    if any(timezone.is_naive(timestamp) for timestamp, _ in positions.values()):
+        raise InvalidCursor(cursor)
+    return positions
+
+
+def keyset_page(queryset, field, position, until, limit):
+    # Up to `limit` rows after `position` in (field, pk) order, and whether more rows follow
+    queryset = queryset.filter(**{f'{field}__lte': until})
+    if position is not None:
+        timestamp, pk = position
+        queryset = queryset.filter(Q(**{f'{field}__gt': timestamp}) | Q(**{field: timestamp, 'pk__gt': pk}))
+    rows = list(queryset.order_by(field, 'pk')[:limit + 1])
+    return rows[:limit], len(rows) > limit
+
+
+def oldest_open_transaction():
+    # Start of the oldest other transaction open on the primary; its rows may carry any timestamp from then on
+    connection = connections[DEFAULT_DB_ALIAS]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT min(xact_start) FROM pg_stat_activity '
+            'WHERE datname = current_database() AND pid <> pg_backend_pid() AND xact_start IS NOT NULL'
+        )
+        return cursor.fetchone()[0]
+
+
+def preference_queryset(user, discussion_id=None):
+    preferences = UserContentPreference.objects.filter(user=user)
+    if discussion_id is None:
+        return preferences
+    content_types = ContentType.objects.get_for_models(Discussion, Comment)
+    return preferences.filter(
+        Q(content_type=content_types[Discussion], object_id=discussion_id)
+        | Q(content_type=content_types[Comment], object_id__in=Comment.objects.filter(discussion_id=discussion_id).values('id'))
+    )
+
+
+def user_preferences(user, model, object_ids):
+    if not object_ids:
+        return {}
+    return dict(UserContentPreference.objects.filter(
+        user=user, content_type=ContentType.objects.get_for_model(model), object_id__in=object_ids,
+    ).values_list('object_id', 'preference'))
+
+
+def changes(request, cursor=None, limit=None, discussion_id=None):
+    """
+    One page of changes per stream after `cursor`, optionally limited to one discussion, with the
+    cursor for the next call. `has_more` is set when any stream filled its page.
+    """
+    limit = max(1, min(limit or settings.SYNC_PAGE_SIZE, settings.SYNC_MAX_PAGE_SIZE))
+    positions = decode_cursor(cursor)
+    until = timezone.now() - timedelta(seconds=settings.SYNC_SETTLE_SECONDS)
+    open_since = oldest_open_transaction()
+    if open_since is not None:
+        until = min(until, open_since)
+    user = request.user
+
+    discussions = Discussion.objects.all()
+    comments = Comment.objects.all()
+    archived = ArchivedDiscussion.objects.all()
+    deleted = DeletedVotable.objects.all()
+    if discussion_id is not None:
+        discussions = discussions.filter(pk=discussion_id)
+        comments = comments.filter(discussion_id=discussion_id)
+        archived = archived.filter(original_id=discussion_id)
+        deleted = deleted.filter(discussion_id=discussion_id)
+
+    discussion_context = {'request': request}
+    comment_context = {'request': request}
+    discussion_serializer = ValuesSerializer(DiscussionSerializer, discussion_context)
+    comment_serializer = ValuesSerializer(CommentSerializer, comment_context)
+
+    pages = {
+        'discussions': keyset_page(discussion_serializer.values(discussions, 'updated_at'), 'updated_at',
+                                   positions.get('discussions'), until, limit),
+        'comments': keyset_page(comment_serializer.values(comments, 'updated_at'), 'updated_at',
+                                positions.get('comments'), until, limit),
+        'preferences': keyset_page(
+            preference_queryset(user, discussion_id).values('pk', 'content_type_id', 'object_id', 'preference', 'updated_at'),
+            'updated_at', positions.get('preferences'), until, limit,
+        ),
+        'archived': keyset_page(archived.values('pk', 'original_id', 'archived_at'), 'archived_at',
+                                positions.get('archived'), until, limit),
+        'deleted': keyset_page(deleted.values('pk', 'content_type_id', 'object_id', 'deleted_at'), 'deleted_at',
+                               positions.get('deleted'), until, limit),
+    }
+
+    # Idle streams move up to `until` too, so the next call does not scan the same range again
+    next_positions = {}
+    for stream, (rows, more) in pages.items():
+        field = TIMESTAMP_FIELDS.get(stream, 'updated_at')
+        last = (rows[-1][field], rows[-1]['pk']) if rows else positions.get(stream)
+        next_positions[stream] = last if more else max(last or (until, 0), (until, 0))
+
+    preferences, _ = pages['preferences']
+    discussion_rows, _ = pages['discussions']
+    comment_rows, _ = pages['comments']
+    discussion_context['user_preferences'] = user_preferences(user, Discussion, [row['pk'] for row in discussion_rows])
+    comment_context['user_preferences'] = user_preferences(user, Comment, [row['pk'] for row in comment_rows])
+    comment_context['group_approvals'] = comment_group_approvals([row['pk'] for row in comment_rows])
+
+    return {
+        'discussions': discussion_serializer.to_representation(discussion_rows),
+        'comments': comment_serializer.to_representation(comment_rows),
+        'preferences': [
+            {
+                'votable_type': ContentType.objects.get_for_id(row['content_type_id']).model,
+                'object_id': row['object_id'],
+                'preference': row['preference'],
+                'updated_at': row['updated_at'],
+            }
+            for row in preferences
+        ],
+        # Tombstones: archived discussions are no longer live, clients drop them with their comments
+        'archived': [
+            {'id': row['original_id'], 'archived_at': row['archived_at']} for row in pages['archived'][0]
+        ],
+        # Discussions and comments deleted outright; as with archives, a discussion's comments go with it
+        'deleted': [
+            {
+                'votable_type': ContentType.objects.get_for_id(row['content_type_id']).model,
+                'id': row['object_id'],
+                'deleted_at': row['deleted_at'],
+            }
+            for row in pages['deleted'][0]
+        ],
+        'cursor': encode_cursor(next_positions),
+        'has_more': any(more for _, more in pages.values()),
+    }
+
+
+class ChangesView(APIView):
+    """
+    GET ?since=<cursor>&limit=&discussion= returns the discussions, comments, preferences and archive and
+    delete tombstones changed since the cursor, with the cursor to pass next. Without `since` the sync starts
+    from the beginning; clients keep calling while `has_more` is set.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        try:
+            limit = int(request.query_params.get('limit', 0)) or None
+            discussion_id = request.query_params.get('discussion')
+            discussion_id = int(discussion_id) if discussion_id else None
+        except ValueError:
+            return Response({'error': 'Invalid limit or discussion'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            with primary_reads():
+                return Response(changes(request, request.query_params.get('since'), limit, discussion_id))
+        except InvalidCursor:
+            return Response({'error': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
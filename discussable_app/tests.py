@@ -1,3 +1,772 @@
-from django.test import TestCase
+import asyncio
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+from contextlib import contextmanager
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from scipy import sparse
+
+from authentech_app.authentication import issue_token
+from authentech_app.models import UserProfile
+from discussable_app import bridging, brigading
+from discussable_app.archive import archive_discussions, inactive_discussions, inactivity_cutoff
+from discussable_app.leaderboards import top_discussions
+from discussable_app.live import InProcessBackend, LiveBroker, event_stream
+from discussable_app.management.commands import bench_db_connections
+from discussable_app.models import (
+    BrigadingFlag, CategoryVisibilityThreshold, Comment, CommentGroupApproval, Discussion, FlagStatus, OpinionGroup, RelatedDiscussion, UserReputation,
+    UserPreference, VisibilityStatus, Vote, VoteType, rebuild_user_reputations, rescore_votables,
+)
+from discussable_app.serializers import CommentSerializer, DiscussionSerializer, ValuesSerializer, fieldset_key
+from discussable_app.similarity import MAX_DF_MIN_DOCUMENTS, similar_subjects, tfidf_matrix
+from discussable_backend.db_routers import PrimaryReplicaRouter, read_from_replica
+from discussable_backend.middleware import ReplicaRoutingMiddleware
+from discussable_backend.renderers import ORJSONParser, ORJSONRenderer
+
+
+@contextmanager
+def local_replica():
+    # A primary and a replica SQLite file, with a runner for management commands configured to use both
+    with tempfile.TemporaryDirectory() as directory:
+        primary, replica = os.path.join(directory, 'primary.sqlite3'), os.path.join(directory, 'replica.sqlite3')
+        env = {**os.environ, 'DATABASE_URL': f'sqlite:///{primary}', 'DATABASE_REPLICA_URL': f'sqlite:///{replica}'}
+
+        def manage(*args, **kwargs):
+            return subprocess.run(
+                [sys.executable, 'manage.py', *args], cwd=settings.BASE_DIR, env=env, check=True,
+                capture_output=True, text=True, **kwargs,
+            )
+        yield manage, primary, replica
+
+
+class ReplicaRoutingTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        # The middleware is only installed alongside a replica
+        patcher = mock.patch.dict(settings.DATABASES, {settings.REPLICA_DATABASE_ALIAS: {'ENGINE': 'django.db.backends.sqlite3'}})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.router = PrimaryReplicaRouter()
+        self.seen = []
+
+        def get_response(request):
+            self.seen.append(self.router.db_for_read(None))
+            return HttpResponse()
+        self.middleware = ReplicaRoutingMiddleware(get_response)
+        self.factory = RequestFactory(HTTP_AUTHORIZATION='Token replica-test')
+
+    def test_safe_requests_read_from_the_replica(self):
+        self.middleware(self.factory.get('/api/discussions/'))
+        self.assertEqual(self.seen, [settings.REPLICA_DATABASE_ALIAS])
+        self.assertFalse(read_from_replica.get())
+
+    def test_writes_pin_the_client_to_the_primary(self):
+        self.middleware(self.factory.post('/api/vote/discussion/1/'))
+        self.middleware(self.factory.get('/api/discussions/'))
+        self.assertEqual(self.seen, ['default', 'default'])
+        self.assertEqual(self.router.db_for_write(None), 'default')
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.cache')
+    def test_login_pins_the_new_session(self):
+        def log_in(request):
+            request.session.cycle_key()
+            return self.middleware(request)
+        response = SessionMiddleware(log_in)(RequestFactory().post('/api/login/'))
+        session_key = response.cookies[settings.SESSION_COOKIE_NAME].value
+        self.middleware(RequestFactory(HTTP_COOKIE=f'{settings.SESSION_COOKIE_NAME}={session_key}').get('/api/discussions/'))
+        self.assertEqual(self.seen, ['default', 'default'])
+
+    def test_only_a_sqlite_replica_is_migrated(self):
+        with mock.patch.dict(settings.DATABASES, {'replica': {'ENGINE': 'django.db.backends.sqlite3'}}):
+            self.assertTrue(self.router.allow_migrate('replica', 'discussable_app'))
+        with mock.patch.dict(settings.DATABASES, {'replica': {'ENGINE': 'django.db.backends.postgresql'}}):
+            self.assertFalse(self.router.allow_migrate('replica', 'discussable_app'))
+        self.assertTrue(self.router.allow_migrate('default', 'discussable_app'))
+
+    def test_two_local_sqlite_files(self):
+        # The local setup from settings.py: both files get the schema, reads of safe requests go to the replica
+        with local_replica() as (manage, primary, replica):
+            manage('migrate', '-v0')
+            manage('migrate', '--database', 'replica', '-v0')
+            for path in (primary, replica):
+                with sqlite3.connect(path) as connection:
+                    tables = {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+                self.assertIn('discussable_app_discussion', tables)
+
+            with sqlite3.connect(replica) as connection:
+                connection.execute("INSERT INTO auth_user (password, is_superuser, username, first_name, last_name, email, "
+                                   "is_staff, is_active, date_joined) VALUES ('', 0, 'replica-only', '', '', '', 0, 1, '2024-01-01')")
+            script = (
+                'from django.contrib.auth.models import User\n'
+                'from discussable_backend.db_routers import read_from_replica\n'
+                'print(User.objects.filter(username="replica-only").exists())\n'
+                'read_from_replica.set(True)\n'
+                'print(User.objects.filter(username="replica-only").exists())\n'
+            )
+            output = manage('shell', input=script).stdout.split()
+            self.assertEqual(output, ['False', 'True'])
+
+    def test_fresh_login_reads_from_the_primary(self):
+        # Neither the user nor the token it was just issued have reached the replica
+        with local_replica() as (manage, primary, replica):
+            manage('migrate', '-v0')
+            shutil.copyfile(primary, replica)
+            script = (
+                'from django.contrib.auth.models import User\n'
+                'from django.test import Client\n'
+                'from django.test.utils import setup_test_environment\n'
+                'from rest_framework.authtoken.models import Token\n'
+                'from authentech_app.authentication import issue_token\n'
+                'from discussable_app.models import Discussion\n'
+                'setup_test_environment()\n'
+                'for name in ("issued", "stored"):\n'
+                '    Discussion.objects.create(creator=User.objects.create(username=name), subject=name)\n'
+                'issued = issue_token(User.objects.get(username="issued"))\n'
+                'stored = Token.objects.create(user=User.objects.get(username="stored"))\n'
+                'for token in (issued, stored):\n'
+                '    response = Client(HTTP_AUTHORIZATION=f"Token {token.key}").get("/api/discussions/")\n'
+                '    print(response.status_code, len(response.json()))\n'
+            )
+            # A token that was not issued by a login is still found, but its reads go to the replica
+            self.assertEqual(manage('shell', input=script).stdout.split(), ['200', '2', '200', '0'])
+
+    def test_sync_reads_from_the_primary(self):
+        # A discussion the replica has not replayed yet must still reach the sync cursor
+        with local_replica() as (manage, primary, replica):
+            manage('migrate', '-v0')
+            manage('shell', input=(
+                'from django.contrib.auth.models import User\n'
+                'from rest_framework.authtoken.models import Token\n'
+                'Token.objects.create(user=User.objects.create(username="syncer"), key="sync-test-token")\n'
+            ))
+            shutil.copyfile(primary, replica)
+            script = (
+                'from datetime import timedelta\n'
+                'from django.contrib.auth.models import User\n'
+                'from django.test import Client\n'
+                'from django.test.utils import setup_test_environment\n'
+                'from django.utils import timezone\n'
+                'from discussable_app.models import Discussion\n'
+                'setup_test_environment()\n'
+                'discussion = Discussion.objects.create(creator=User.objects.get(), subject="Not replayed")\n'
+                'Discussion.objects.update(updated_at=timezone.now() - timedelta(hours=1))\n'
+                'client = Client(HTTP_AUTHORIZATION="Token sync-test-token")\n'
+                'print(len(client.get("/api/discussions/").json()))\n'
+                'print([row["id"] for row in client.get("/api/changes/").json()["discussions"]] == [discussion.id])\n'
+            )
+            self.assertEqual(manage('shell', input=script).stdout.split(), ['0', 'True'])
+
+
+class SyntheticDataTests(TestCase):
+    COUNTERS = ('positive_votes', 'negative_votes', 'total_votes', 'participation_percentage', 'positive_percentage',
+                'negative_percentage', 'wilson_score', 'visibility_status')
+
+    def counters(self, model):
+        return list(model.objects.order_by('pk').values_list(*self.COUNTERS))
+
+    def test_set_based_rescore_matches_a_per_object_recount(self):
+        call_command('generate_synthetic_data', users=8, discussions=3, comments=2, replies=2, depth=1, votes=5,
+                     batch_size=4, stdout=StringIO())
+        self.assertEqual((Discussion.objects.count(), Comment.objects.count()), (3, 18))
+        self.assertTrue(Vote.objects.exists())
+
+        for model in (Discussion, Comment):
+            rescored = self.counters(model)
+            for votable in model.objects.filter(total_votes__gt=0):  # Recounts only run after a vote
+                votable.get_vote_data()
+            self.assertEqual(self.counters(model), rescored)
+
+    def test_same_seed_produces_the_same_data(self):
+        def generate(prefix):
+            call_command('generate_synthetic_data', users=5, discussions=2, comments=1, depth=0, votes=3,
+                         prefix=prefix, stdout=StringIO())
+            discussions = Discussion.objects.filter(creator__username__startswith=prefix).order_by('pk')
+            return list(discussions.values_list('subject', 'category', 'total_votes'))
+
+        self.assertEqual(generate('first'), generate('second'))
+
+
+class ReputationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.creator = User.objects.create(username='creator')
+        self.discussion = Discussion.objects.create(creator=self.creator, subject='Rated')
+        self.comment = Comment.objects.create(discussion=self.discussion, creator=self.creator, comment_content='Rated too')
+
+    def vote(self, voter, votable, vote):
+        self.client.post(f'/api/vote/{votable._meta.model_name}/{votable.pk}/', {'vote': vote.value},
+                         content_type='application/json', HTTP_AUTHORIZATION=f'Token {issue_token(voter).key}')
+
+    def reputation(self):
+        return UserReputation.objects.filter(user=self.creator).values(
+            'positive_votes', 'negative_votes', 'total_votes', 'wilson_score',
+        ).get()
+
+    def test_vote_deltas_match_a_rebuild(self):
+        voters = [User.objects.create(username=f'voter{number}') for number in range(3)]
+        for voter in voters:
+            self.vote(voter, self.discussion, VoteType.POSITIVE)
+            self.vote(voter, self.comment, VoteType.NEGATIVE)
+        # Changed and withdrawn votes move the counters back
+        self.vote(voters[0], self.comment, VoteType.POSITIVE)
+        self.vote(voters[1], self.discussion, VoteType.NO_VOTE)
+
+        maintained = self.reputation()
+        self.assertEqual((maintained['positive_votes'], maintained['negative_votes'], maintained['total_votes']), (3, 2, 5))
+        UserReputation.objects.all().delete()
+        rebuild_user_reputations()
+        self.assertEqual(self.reputation(), maintained)
+
+
+class BridgingWarmStartTests(TestCase):
+
+    def run_fit(self, dimensions):
+        matrix = sparse.csr_matrix(np.array([[1, -1, 1], [1, 1, -1], [-1, 1, 1]]))
+        fit = mock.Mock(side_effect=bridging.fit)
+        with mock.patch.object(bridging, 'vote_matrix', return_value=(matrix, np.arange(3), np.array([2, 4, 6]))), \
+                mock.patch.object(bridging, 'fit', fit):
+            bridging.build_bridging_scores(dimensions=dimensions)
+        return fit.call_args.args
+
+    def test_changed_dimensions_start_cold(self):
+        with tempfile.TemporaryDirectory() as directory, \
+                override_settings(BRIDGING_FACTORS_PATH=os.path.join(directory, 'factors.npz')):
+            self.assertEqual(self.run_fit(1)[-1], 50)
+            self.assertEqual(self.run_fit(1)[-1], 5)
+            *_, mu, iterations = self.run_fit(2)
+            self.assertEqual(iterations, 50)
+            self.assertAlmostEqual(mu, 6 / 9)
+
+
+class BridgingScoreTests(TestCase):
+
+    def setUp(self):
+        model_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, model_dir)
+        patcher = override_settings(BRIDGING_FACTORS_PATH=os.path.join(model_dir, 'factors.npz'))
+        patcher.enable()
+        self.addCleanup(patcher.disable)
+
+        creator = User.objects.create(username='creator')
+        discussion = Discussion.objects.create(creator=creator, subject='Divided')
+        self.comments = [
+            Comment.objects.create(discussion=discussion, creator=creator, comment_content=f'Comment {number}')
+            for number in range(8)
+        ]
+        comment_ct = ContentType.objects.get_for_model(Comment)
+        votes = []
+        # A majority and a minority camp each approve their own three comments and reject the other's. Comment 6
+        # gets a lower approval overall than the majority's comments, but from both camps alike
+        for camp, size in enumerate((7, 3)):
+            for number in range(size):
+                voter = User.objects.create(username=f'camp{camp}-{number}')
+                for index, comment in enumerate(self.comments):
+                    if index == 6:
+                        approves = number < (4 if camp == 0 else 2)
+                    else:
+                        approves = index < 6 and index // 3 == camp
+                    votes.append(Vote(user=voter, content_type=comment_ct, object_id=comment.pk, vote=1 if approves else -1))
+        Vote.objects.bulk_create(votes)
+
+    def test_approval_across_camps_beats_partisan_approval(self):
+        output = StringIO()
+        call_command('build_bridging_scores', stdout=output)
+        self.assertIn('Updated 8 bridging scores', output.getvalue())
+        scores = [comment.bridging_score for comment in Comment.objects.order_by('pk')]
+        self.assertGreater(scores[6], max(scores[:6]))
+        self.assertLess(scores[7], min(scores[:6]))
+
+
+class ArchiveInactivityTests(TestCase):
+
+    def test_changed_vote_keeps_the_thread_active(self):
+        user = User.objects.create(username='voter')
+        discussion = Discussion.objects.create(creator=user, subject='Old thread')
+        old = inactivity_cutoff(60)
+        Discussion.objects.filter(pk=discussion.pk).update(created_at=old)
+        vote = Vote.objects.create(user=user, content_object=discussion, vote=VoteType.POSITIVE.value)
+        Vote.objects.filter(pk=vote.pk).update(created_at=old, updated_at=old)
+        cutoff = inactivity_cutoff(30)
+        self.assertQuerySetEqual(inactive_discussions(cutoff), [discussion])
+
+        Vote.objects.update_or_create(
+            user=user, content_type=ContentType.objects.get_for_model(Discussion), object_id=discussion.pk,
+            defaults={'vote': VoteType.NEGATIVE.value},
+        )
+        self.assertQuerySetEqual(inactive_discussions(cutoff), [])
+
+    def test_archived_votes_still_count_towards_reputation(self):
+        creator, other = User.objects.create(username='creator'), User.objects.create(username='other')
+        discussion = Discussion.objects.create(creator=creator, subject='Archived', positive_votes=3, negative_votes=1)
+        Comment.objects.create(creator=creator, discussion=discussion, comment_content='Mine', positive_votes=2)
+        Comment.objects.create(creator=other, discussion=discussion, comment_content='Theirs', negative_votes=4)
+        Discussion.objects.create(creator=creator, subject='Live', positive_votes=1)
+        rebuild_user_reputations()
+        before = dict(UserReputation.objects.values_list('user_id', 'total_votes'))
+
+        archive_discussions([discussion.pk])
+        with CaptureQueriesContext(connection) as queries:
+            rebuild_user_reputations(User.objects.filter(pk=creator.pk))
+        self.assertFalse([query for query in queries if 'discussable_app_archiveddiscussion' in query['sql']])
+        rebuild_user_reputations(User.objects.filter(pk=other.pk))
+        self.assertEqual(dict(UserReputation.objects.values_list('user_id', 'total_votes')), before)
+        self.assertEqual(before, {creator.pk: 7, other.pk: 4})
+
+
+class FieldsetKeyTests(SimpleTestCase):
+
+    def key(self, query):
+        return fieldset_key(RequestFactory().get('/api/discussions/1/', query))
+
+    def test_equivalent_fieldsets_share_a_key(self):
+        self.assertEqual(self.key({}), '')
+        self.assertEqual(self.key({'fields[comment]': 'id,comment_content'}),
+                         self.key({'fields[comment]': ' comment_content , id,unknown,id'}))
+        self.assertNotEqual(self.key({'fields[comment]': 'id'}), self.key({'fields[comment]': 'id,comment_content'}))
+        self.assertNotEqual(self.key({'fields': 'id'}), self.key({}))
+
+    def test_key_is_short_and_safe_for_any_input(self):
+        key = self.key({'fields': ' '.join(['a' * 100] * 10), 'fields[discussion]': 'subject\n\x00'})
+        self.assertRegex(key, r'^[0-9a-f]{16}$')
+
+
+class VisibilityThresholdTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        creator = User.objects.create(username='creator')
+        for category in ('Science', 'Politics', None):
+            discussion = Discussion.objects.create(creator=creator, subject=f'{category} thread', category=category)
+            for number in range(2):
+                Comment.objects.create(discussion=discussion, creator=creator, comment_content=f'Comment {number}')
+        # Every row is 60% approved, visible under the default threshold
+        for model in (Discussion, Comment):
+            model.objects.update(positive_votes=6, negative_votes=4, total_votes=10)
+        self.held = Comment.objects.filter(discussion__category='Science').first()
+        Comment.objects.filter(pk=self.held.pk).update(visibility_held=True)
+
+    def hidden(self, model):
+        return set(model.objects.filter(visibility_status=VisibilityStatus.HIDDEN.value).values_list('pk', flat=True))
+
+    def assert_matches_per_row(self):
+        for model in (Discussion, Comment):
+            for votable in model.objects.all():
+                self.assertEqual(votable.visibility_status, votable.visibility_for_votes())
+
+    def test_threshold_change_applies_to_its_category_and_skips_held_rows(self):
+        CategoryVisibilityThreshold.objects.create(category='Science', threshold=70)
+        output = StringIO()
+        call_command('recompute_visibility', batch_size=2, stdout=output)
+
+        science = Discussion.objects.get(category='Science')
+        self.assertEqual(self.hidden(Discussion), {science.pk})
+        self.assertEqual(self.hidden(Comment), set(science.comments.exclude(pk=self.held.pk).values_list('pk', flat=True)))
+        self.assertIn('Changed the visibility of 2 discussions and comments', output.getvalue())
+        self.assert_matches_per_row()
+
+        # Lowering it again shows them, and a run for other categories leaves them alone
+        threshold = CategoryVisibilityThreshold.objects.get(category='Science')
+        threshold.threshold = 50
+        threshold.save()
+        call_command('recompute_visibility', category=['Politics'], stdout=StringIO())
+        self.assertEqual(self.hidden(Discussion), {science.pk})
+        call_command('recompute_visibility', category=['Science'], stdout=StringIO())
+        self.assertEqual(self.hidden(Discussion) | self.hidden(Comment), set())
+        self.assert_matches_per_row()
+
+
+class SerializerTests(TestCase):
+
+    def setUp(self):
+        creator = User.objects.create(username='creator')
+        voter = User.objects.create(username='voter')
+        self.discussion = Discussion.objects.create(creator=creator, subject='Serialized', category='Science')
+        self.comments = [
+            Comment.objects.create(discussion=self.discussion, creator=creator, comment_content=f'Comment {number} é')
+            for number in range(3)
+        ]
+        comment_ct = ContentType.objects.get_for_model(Comment)
+        Vote.objects.create(user=voter, content_type=comment_ct, object_id=self.comments[0].pk, vote=1)
+        Vote.objects.create(user=creator, content_type=comment_ct, object_id=self.comments[0].pk, vote=-1)
+        rescore_votables(Comment)
+        self.context = {
+            'user_preferences': {self.comments[1].pk: UserPreference.HIDE.value},
+            'group_approvals': {self.comments[0].pk: [{'group': 0, 'approval': 0.75}]},
+        }
+
+    def assert_same_output(self, serializer_class, queryset, context):
+        expected = [dict(serializer_class(obj, context=context).data) for obj in queryset]
+        self.assertEqual(ValuesSerializer(serializer_class, context).serialize(queryset), expected)
+
+    def test_values_serializer_matches_the_model_serializer(self):
+        self.assert_same_output(DiscussionSerializer, Discussion.objects.all(), self.context)
+        self.assert_same_output(CommentSerializer, Comment.objects.order_by('pk'), self.context)
+
+    def test_sparse_fieldsets_match(self):
+        request = RequestFactory().get('/api/discussions/1/', {'fields[comment]': 'id,wilson_score,group_approval,unknown'})
+        context = {**self.context, 'request': request}
+        self.assert_same_output(CommentSerializer, Comment.objects.order_by('pk'), context)
+        row, = ValuesSerializer(CommentSerializer, context).serialize(Comment.objects.filter(pk=self.comments[0].pk))
+        self.assertEqual(set(row), {'id', 'wilson_score', 'group_approval'})
+
+    def test_orjson_renderer_matches_drf(self):
+        data = CommentSerializer(Comment.objects.order_by('pk'), many=True, context=self.context).data
+        extra = {'score': Decimal('0.5'), 'created': Comment.objects.first().created_at, 1: None}
+        for value in (data, extra):
+            self.assertEqual(ORJSONRenderer().render(value), JSONRenderer().render(value))
+        with self.assertRaises(ParseError):
+            ORJSONParser().parse(BytesIO(b'{"unterminated": '))
+
+
+class TfidfTests(SimpleTestCase):
+
+    def similarities(self, texts):
+        matrix, _ = tfidf_matrix(texts)
+        return (matrix @ matrix.T).toarray()
+
+    def test_small_corpus_keeps_shared_terms(self):
+        scores = self.similarities(['Electric cars and batteries', 'Battery recycling for electric cars', 'Tax policy'])
+        self.assertGreater(scores[0, 1], 0)
+        self.assertEqual(scores[0, 2], 0)
+
+    def test_large_corpus_drops_common_terms(self):
+        texts = [f'common topic{number}' for number in range(MAX_DF_MIN_DOCUMENTS)]
+        scores = self.similarities(texts)
+        self.assertEqual(scores[0, 1], 0)
+
+
+class SimilarityModelTests(TestCase):
+
+    def setUp(self):
+        model_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, model_dir)
+        patcher = override_settings(SIMILARITY_MODEL_DIR=model_dir)
+        patcher.enable()
+        self.addCleanup(patcher.disable)
+
+        creator = User.objects.create(username='creator')
+        self.cars, self.recycling, self.taxes = (
+            Discussion.objects.create(creator=creator, subject=subject)
+            for subject in ('Electric cars and batteries', 'Recycling electric car batteries', 'Tax policy')
+        )
+        Comment.objects.create(discussion=self.taxes, creator=creator, comment_content='Income brackets and batteries')
+
+    def test_build_stores_neighbours_and_suggests_subjects(self):
+        call_command('build_similarity_model', min_score=0.01, stdout=StringIO())
+        related = {
+            discussion: set(RelatedDiscussion.objects.filter(discussion=discussion).values_list('related', flat=True))
+            for discussion in (self.cars, self.recycling, self.taxes)
+        }
+        self.assertEqual(related[self.cars], {self.recycling.pk, self.taxes.pk})
+        self.assertEqual(related[self.recycling], {self.cars.pk, self.taxes.pk})
+
+        suggestions = similar_subjects('Which electric car batteries last longest?')
+        self.assertEqual([discussion_id for discussion_id, _ in suggestions][:2], [self.recycling.pk, self.cars.pk])
+        self.assertEqual(similar_subjects('Unrelated words only'), [])
+
+    def test_comments_can_be_left_out(self):
+        call_command('build_similarity_model', min_score=0.01, top_comments=0, stdout=StringIO())
+        self.assertFalse(RelatedDiscussion.objects.filter(discussion=self.taxes).exists())
+
+
+class OpinionGroupTests(TestCase):
+
+    def setUp(self):
+        creator = User.objects.create(username='creator')
+        discussion = Discussion.objects.create(creator=creator, subject='Split')
+        self.comments = [
+            Comment.objects.create(discussion=discussion, creator=creator, comment_content=f'Comment {number}')
+            for number in range(7)
+        ]
+        comment_ct = ContentType.objects.get_for_model(Comment)
+        votes = []
+        # Two camps vote against each other on the first six comments and agree on the last one
+        for camp, sign in (('a', 1), ('b', -1)):
+            for number in range(4):
+                voter = User.objects.create(username=f'{camp}{number}')
+                for index, comment in enumerate(self.comments):
+                    vote = 1 if index == 6 else sign * (1 if index < 3 else -1)
+                    votes.append(Vote(user=voter, content_type=comment_ct, object_id=comment.pk, vote=vote))
+        Vote.objects.bulk_create(votes)
+
+    def approvals(self, comment):
+        return sorted(CommentGroupApproval.objects.filter(comment=comment).values_list('positive_votes', 'negative_votes'))
+
+    def test_camps_form_groups_with_their_own_approvals(self):
+        output = StringIO()
+        call_command('build_opinion_groups', max_groups=3, stdout=output)
+        self.assertIn('Found 2 opinion groups', output.getvalue())
+        self.assertEqual(sorted(OpinionGroup.objects.values_list('member_count', flat=True)), [4, 4])
+        self.assertEqual(self.approvals(self.comments[0]), [(0, 4), (4, 0)])
+        self.assertEqual(self.approvals(self.comments[6]), [(4, 0), (4, 0)])
+        agreed = CommentGroupApproval.objects.filter(comment=self.comments[6])
+        self.assertTrue(all(approval >= settings.OPINION_GROUP_AGREEMENT for approval in agreed.values_list('approval', flat=True)))
+
+    def test_too_few_active_voters(self):
+        output = StringIO()
+        call_command('build_opinion_groups', min_votes=8, stdout=output)
+        self.assertIn('Too few active voters', output.getvalue())
+        self.assertFalse(OpinionGroup.objects.exists())
+
+
+class BrigadingTests(TestCase):
+
+    def setUp(self):
+        self.detector = brigading.BrigadingDetector(window_seconds=600, burst_votes=4, one_sided_share=0.8, min_similarity=0.3)
+        for name, value in (('detector', self.detector), ('logger', mock.Mock())):
+            patcher = mock.patch.object(brigading, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.discussion = Discussion.objects.create(creator=User.objects.create(username='creator'), subject='Target')
+        # The burst voters all voted on the same two other discussions shortly before
+        for user_id in range(1, 5):
+            for other in (1001, 1002):
+                self.detector.record(('discussion', other), user_id, 1)
+
+    def burst(self):
+        return [brigading.check_vote(self.discussion, user_id, 1) for user_id in range(1, 5)]
+
+    def test_burst_of_alike_voters_is_flagged_once(self):
+        results = self.burst()
+        self.assertEqual(results[:3], [None, None, None])
+        flag = BrigadingFlag.objects.get()
+        self.assertEqual(results[3], flag)
+        self.assertEqual((flag.status, flag.vote_count, flag.direction), (FlagStatus.PENDING.value, 4, 1))
+        brigading.logger.warning.assert_called_once()
+        self.assertIsNone(brigading.check_vote(self.discussion, 5, 1))  # Already reported within the window
+
+    def test_unrelated_voters_are_not_flagged(self):
+        self.detector._users.clear()
+        self.assertEqual(self.burst(), [None] * 4)
+        self.assertFalse(BrigadingFlag.objects.exists())
+
+    def test_workers_share_one_pending_flag(self):
+        self.burst()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            BrigadingFlag.objects.create(content_object=self.discussion, vote_count=4, direction=1, similarity=1)
+        # A second worker detecting the same burst finds the existing flag
+        self.detector._flagged.clear()
+        for user_id in range(1, 5):
+            for other in (1001, 1002):
+                self.detector.record(('discussion', other), user_id, 1)
+        self.assertEqual(self.burst()[3], BrigadingFlag.objects.get())
+
+    @override_settings(BRIGADING_HOLD_VISIBILITY=True)
+    def test_hold_restores_the_pre_burst_status_until_dismissed(self):
+        self.discussion.visibility_status = VisibilityStatus.HIDDEN.value
+        brigading.check_vote(self.discussion, 1, 1)
+        # The burst votes counted so far made the discussion visible
+        self.discussion.visibility_status = VisibilityStatus.VISIBLE.value
+        for user_id in range(2, 5):
+            brigading.check_vote(self.discussion, user_id, 1)
+        self.discussion.refresh_from_db()
+        self.assertEqual((self.discussion.visibility_status, self.discussion.visibility_held), (VisibilityStatus.HIDDEN.value, True))
+
+        Discussion.objects.filter(pk=self.discussion.pk).update(positive_votes=9, total_votes=10)
+        BrigadingFlag.objects.get().resolve(FlagStatus.DISMISSED.value)
+        self.discussion.refresh_from_db()
+        self.assertEqual((self.discussion.visibility_status, self.discussion.visibility_held), (VisibilityStatus.VISIBLE.value, False))
+
+    @override_settings(BRIGADING_HOLD_VISIBILITY=True)
+    def test_hold_and_dismissal_refresh_the_leaderboards(self):
+        cache.clear()
+        Discussion.objects.filter(pk=self.discussion.pk).update(visibility_status=VisibilityStatus.VISIBLE.value)
+        self.discussion.visibility_status = VisibilityStatus.HIDDEN.value
+        brigading.check_vote(self.discussion, 1, 1)
+        self.discussion.visibility_status = VisibilityStatus.VISIBLE.value
+        self.assertEqual(top_discussions('newest')[0]['visibility_status'], VisibilityStatus.VISIBLE.value)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            for user_id in range(2, 5):
+                brigading.check_vote(self.discussion, user_id, 1)
+        self.assertEqual(top_discussions('newest')[0]['visibility_status'], VisibilityStatus.HIDDEN.value)
+
+        Discussion.objects.filter(pk=self.discussion.pk).update(positive_votes=9, total_votes=10)
+        call_command('review_brigading_flags', dismiss=[BrigadingFlag.objects.get().pk], stdout=StringIO())
+        self.assertEqual(top_discussions('newest')[0]['visibility_status'], VisibilityStatus.VISIBLE.value)
+
+    @override_settings(BRIGADING_HOLD_VISIBILITY=True)
+    def test_confirmed_brigade_stays_held(self):
+        self.burst()
+        BrigadingFlag.objects.get().resolve(FlagStatus.CONFIRMED.value)
+        self.discussion.refresh_from_db()
+        self.assertTrue(self.discussion.visibility_held)
+
+
+class LeaderboardTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.creator = User.objects.create(username='creator')
+        self.profile = UserProfile.objects.create(user=self.creator, preferred_name='Old name')
+        Discussion.objects.create(creator=self.creator, subject='Ranked')
+
+    def test_rename_refreshes_the_boards(self):
+        self.assertEqual(top_discussions('newest')[0]['creator_name'], 'Old name')
+        self.profile.preferred_name = 'New name'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.profile.save()
+        self.assertEqual(top_discussions('newest')[0]['creator_name'], 'New name')
+
+
+class LiveUpdatesTests(TestCase):
+
+    def setUp(self):
+        self.discussion = Discussion.objects.create(creator=User.objects.create(username='creator'), subject='Live')
+
+    def test_stream_needs_asgi(self):
+        with self.assertLogs('django.request', 'ERROR'):
+            response = self.client.get(f'/api/discussions/{self.discussion.pk}/events/')
+        self.assertEqual(response.status_code, 501)
+
+    async def test_stream_over_asgi(self):
+        response = await self.async_client.get(f'/api/discussions/{self.discussion.pk}/events/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+
+@override_settings(LIVE_UPDATES_COALESCE_SECONDS=0.05, LIVE_UPDATES_KEEPALIVE_SECONDS=0.05,
+                   LIVE_UPDATES_MAX_STREAM_SECONDS=5, LIVE_UPDATES_QUEUE_SIZE=10)
+class EventStreamTests(SimpleTestCase):
+
+    async def open_stream(self):
+        broker = LiveBroker(InProcessBackend())
+        stream = event_stream(broker.subscribe(1))
+        self.assertEqual(await anext(stream), 'retry: 2000\n\n')
+        first = asyncio.ensure_future(anext(stream))
+        while not broker.backend._subscribers:
+            await asyncio.sleep(0)
+        return broker, stream, first
+
+    async def test_counter_updates_are_coalesced(self):
+        broker, stream, first = await self.open_stream()
+        for positive_votes in (1, 2, 3):
+            broker.backend.publish(broker.channel(1), {'type': 'counters', 'votable_type': 'comment', 'id': 7,
+                                                       'positive_votes': positive_votes})
+        broker.backend.publish(broker.channel(1), {'type': 'comment', 'comment': {'id': 8}})
+        events = [await first, await anext(stream)]
+        self.assertTrue(events[0].startswith('event: counters\n'))
+        self.assertIn('"positive_votes": 3', events[0])
+        self.assertTrue(events[1].startswith('event: comment\n'))
+        self.assertEqual(await anext(stream), ': keep-alive\n\n')
+        await stream.aclose()
+
+    async def test_client_that_falls_behind_is_told_to_resync(self):
+        broker, stream, first = await self.open_stream()
+        for comment_id in range(20):
+            broker.backend.publish(broker.channel(1), {'type': 'comment', 'comment': {'id': comment_id}})
+        self.assertTrue((await first).startswith('event: resync\n'))
+        with self.assertRaises(StopAsyncIteration):
+            await anext(stream)
+        self.assertFalse(broker.backend._subscribers)
+
+
+class BatchTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='batcher')
+        self.client.defaults['HTTP_AUTHORIZATION'] = f'Token {issue_token(self.user).key}'
+
+    def batch(self, requests, path='/api/batch/', **extra):
+        return self.client.post(path, {'requests': requests}, content_type='application/json', **extra)
+
+    def test_sub_requests_run_as_the_batch_user(self):
+        response = self.batch([
+            {'method': 'POST', 'path': '/api/discussions/create/', 'body': {'subject': 'Batched'}},
+            {'path': '/api/discussions/'},
+        ])
+        self.assertEqual(response.status_code, 200)
+        created, listed = response.json()
+        self.assertEqual(created['status'], 201)
+        self.assertEqual(Discussion.objects.get().creator, self.user)
+        self.assertEqual([discussion['subject'] for discussion in listed['body']], ['Batched'])
+
+    def test_sub_requests_answer_json_to_a_browser(self):
+        # The batch response itself is browsable; its sub-responses must still be data
+        response = self.batch([{'path': '/api/discussions/'}], HTTP_ACCEPT='text/html')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/html; charset=utf-8')
+
+    def test_failed_sub_request_rolls_the_batch_back(self):
+        response = self.batch([
+            {'method': 'POST', 'path': '/api/discussions/create/', 'body': {'subject': 'Rolled back'}},
+            {'method': 'POST', 'path': '/api/discussions/create/', 'body': {}},
+            {'path': '/api/discussions/'},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([item['status'] for item in response.json()], [201, 400, 424])
+        self.assertFalse(Discussion.objects.exists())
+
+    def test_batch_needs_authentication(self):
+        del self.client.defaults['HTTP_AUTHORIZATION']
+        self.assertEqual(self.batch([{'path': '/api/discussions/'}]).status_code, 401)
+
+
+class BenchVoteAggregationTests(TestCase):
+
+    def test_needs_votes(self):
+        with self.assertRaisesMessage(CommandError, 'no votes'):
+            call_command('bench_vote_aggregation', stdout=StringIO())
+
+    def test_every_layout_is_measured_and_rolled_back(self):
+        users = [User.objects.create(username=f'voter{number}') for number in range(3)]
+        discussion = Discussion.objects.create(creator=users[0], subject='Counted')
+        comment = Comment.objects.create(creator=users[0], discussion=discussion, comment_content='Counted')
+        for user in users:
+            for votable in (discussion, comment):
+                Vote.objects.create(user=user, content_object=votable, vote=VoteType.POSITIVE.value)
+        output = StringIO()
+        call_command('bench_vote_aggregation', iterations=3, stdout=output)
+        self.assertEqual(output.getvalue().count('plan:'), 2)
+        self.assertIn('Typed vote tables', output.getvalue())
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, Vote._meta.db_table)
+            self.assertIn('vote_votable_idx', constraints)
+            self.assertNotIn('bench_discussion_vote', connection.introspection.table_names(cursor))
+
+
+class BenchDbConnectionsTests(TestCase):
+
+    def test_needs_permission_to_write(self):
+        with self.assertRaisesMessage(CommandError, '--allow-writes'):
+            call_command('bench_db_connections', stdout=StringIO())
+        self.assertFalse(User.objects.exists())
+
+    @override_settings(ALLOWED_HOSTS=['localhost'])
+    def test_leaves_the_votes_as_it_found_them(self):
+        creator = User.objects.create(username='creator')
+        discussion = Discussion.objects.create(creator=creator, subject='Benchmarked')
+        Vote.objects.create(user=creator, content_object=discussion, vote=VoteType.POSITIVE.value)
+        discussion.get_vote_data()
+        command = bench_db_connections.Command(stdout=StringIO())
+        clean_up = command.clean_up
+        votes_cast = []
+        with mock.patch.object(command, 'clean_up', lambda *args: (votes_cast.append(Vote.objects.count()), clean_up(*args))):
+            call_command(command, iterations=2, allow_writes=True)
+        self.assertEqual(votes_cast, [2])
+        discussion.refresh_from_db()
+        self.assertEqual((discussion.positive_votes, discussion.negative_votes), (1, 0))
+        self.assertEqual(list(User.objects.all()), [creator])
+        self.assertEqual(Vote.objects.count(), 1)
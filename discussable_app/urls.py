@@ -1,8 +1,12 @@
 from django.urls import path
+from .async_views import AsyncDiscussionDetailView, AsyncDiscussionsListView, DiscussionEventsView
+from .batch import BatchView
+from .sync import ChangesView
 from .views import (
     CreateDiscussionView,
     DiscussionDetailView,
     DiscussionsListView,
+    SimilarDiscussionsView,
     CreateCommentView,
     VoteView,
     update_content_preference,
@@ -11,10 +15,16 @@ from .views import (
 )
 
 urlpatterns = [
+    path('discussions/similar/', SimilarDiscussionsView.as_view(), name='similar-discussions'),
     path('discussions/create/', CreateDiscussionView.as_view(), name='create-discussion'),
     path('discussions/<int:discussion_id>/comments/create/', CreateCommentView.as_view(), name='create-comment'),
     path('discussions/<int:discussion_id>/', DiscussionDetailView.as_view(), name='discussion-detail'),
+    path('discussions/<int:discussion_id>/events/', DiscussionEventsView.as_view(), name='discussion-events'),
     path('discussions/', DiscussionsListView.as_view(), name='discussions-list'),
+    path('async/discussions/<int:discussion_id>/', AsyncDiscussionDetailView.as_view(), name='async-discussion-detail'),
+    path('async/discussions/', AsyncDiscussionsListView.as_view(), name='async-discussions-list'),
+    path('batch/', BatchView.as_view(), name='batch'),
+    path('changes/', ChangesView.as_view(), name='changes'),
     path('vote/<str:votable_type>/<int:votable_id>/', VoteView.as_view(), name='vote'),
     path('preferences/<str:votable_type>/<int:votable_id>/<str:preference>/', update_content_preference, name='update-content-preference'),
     path('hide-all-from-user/<int:user_id>/', hide_all_from_user, name='hide-all-from-user'),
@@ -1,21 +1,86 @@
 # discussable_app/views.py
-from django.http import JsonResponse
+from django.conf import settings
+from django.db import transaction
+from django.http import Http404, JsonResponse
 from django.shortcuts import get_object_or_404
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated, AllowAny
 
-from .models import Discussion, Comment, Vote, UserContentPreference, update_user_content_preference, UserPreference
+from .models import ArchivedDiscussion, Discussion, Comment, CommentGroupApproval, MutedCreator, RelatedDiscussion, Vote, UserContentPreference, update_user_content_preference, UserPreference, VisibilityStatus, VotableType, with_viewer_visibility
 
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from .serializers import DiscussionSerializer, CommentSerializer, VoteSerializer
+from discussable_backend.compression import negotiate
+from discussable_backend.renderers import ORJSONRenderer
+from .serializers import DiscussionSerializer, CommentSerializer, ValuesSerializer, VoteSerializer, fieldset_key, requested_fields
+from .archive import archived_detail
+from .brigading import check_vote
+from .leaderboards import discussion_changed, top_discussions
+from .live import broker
+from .payload_cache import CachedPayload, discussion_payload_changed, payload_response
+from .similarity import similar_subjects
 from django.contrib.contenttypes.models import ContentType
 
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Query parameter values accepted by the list and detail views, mapped to their ordering
+SORT_OPTIONS = {
+    'popularity': '-wilson_score',
+    'newest': '-created_at',
+    'oldest': 'created_at',
+    'total_votes': '-total_votes',
+    'bridging': '-bridging_score',
+}
+# Comments can also be ordered by the best-scored comment anywhere in their reply subtree
+COMMENT_SORT_OPTIONS = {
+    **SORT_OPTIONS,
+    'best_subthread': '-subtree_best_wilson',
+}
+# Collapsed comments keep their place in the reply tree and say how many replies they fold away
+COMMENT_STUB_FIELDS = ('parent', 'descendant_count')
+
+
+def votable_content_type(votable_type):
+    # Resolved through the ContentType cache, so only the first lookup per process hits the database
+    if votable_type not in {votable.value.lower() for votable in VotableType}:
+        raise Http404
+    return ContentType.objects.get_by_natural_key('discussable_app', votable_type)
+
+
+def visible_only(request):
+    # ?visibility=visible sends stubs for what the reader would not see: hidden by the votes or, for signed-in
+    # readers, by their own preferences and mutes, all decided in the query fetching the rows
+    return request.GET.get('visibility') == VisibilityStatus.VISIBLE.value
+
+
+def viewer_rows(serializer, queryset, user, context):
+    # Rows with their collapse reason; the user's preferences come from the same query
+    rows = list(serializer.values(with_viewer_visibility(queryset, user), 'collapsed', 'viewer_preference'))
+    context['user_preferences'] = {row['pk']: row['viewer_preference'] for row in rows}
+    return rows
+
+
+def related_discussions(discussion_id):
+    rows = RelatedDiscussion.objects.filter(discussion_id=discussion_id).order_by('-score').values_list(
+        'related_id', 'related__subject', 'score'
+    )
+    return [{'id': related_id, 'subject': subject, 'score': score} for related_id, subject, score in rows]
+
+
+def comment_group_approvals(comment_ids):
+    rows = CommentGroupApproval.objects.filter(comment_id__in=comment_ids).order_by('group__number').values_list(
+        'comment_id', 'group__number', 'positive_votes', 'negative_votes', 'approval'
+    )
+    approvals = {}
+    for comment_id, group, positive_votes, negative_votes, approval in rows:
+        approvals.setdefault(comment_id, []).append({
+            'group': group, 'positive_votes': positive_votes, 'negative_votes': negative_votes, 'approval': approval,
+        })
+    return approvals
+
 
 class DiscussionsListView(APIView):
     permission_classes = [IsAuthenticated]
@@ -23,17 +88,49 @@ class DiscussionsListView(APIView):
     def get(self, request, *args, **kwargs):
         user = request.user
         sort_by = request.query_params.get('sort', 'created_at')
-        sort_options = {
-            'popularity': '-wilson_score',
-            'newest': '-created_at',
-            'oldest': 'created_at',
-            'total_votes': '-total_votes',
-        }
-        sort_field = sort_options.get(sort_by, '-created_at')
+        sort_field = SORT_OPTIONS.get(sort_by, '-created_at')
+        category = request.query_params.get('category')
+        limit = request.query_params.get('limit')
+        content_type = ContentType.objects.get_for_model(Discussion)
+
+        if limit is not None:
+            try:
+                limit = int(limit)
+            except ValueError:
+                return Response({"error": "Invalid limit"}, status=status.HTTP_400_BAD_REQUEST)
+            if limit < 1:
+                return Response({"error": "Invalid limit"}, status=status.HTTP_400_BAD_REQUEST)
+            limit = min(limit, settings.LEADERBOARD_SIZE)
+
+            # The first page of the feed is served from the cached leaderboards when they can answer it;
+            # boards are shared by every reader, so a ?visibility=visible feed is always queried
+            leaderboard_sort = 'newest' if sort_field == '-created_at' else sort_by
+            entries = None if visible_only(request) else top_discussions(leaderboard_sort, category, limit)
+            if entries is not None:
+                user_preferences = UserContentPreference.objects.filter(
+                    user=user,
+                    content_type=content_type,
+                    object_id__in=[entry['id'] for entry in entries]
+                ).values_list('object_id', 'preference')
+                user_pref_dict = dict(user_preferences)
+                for entry in entries:
+                    entry['user_preference'] = user_pref_dict.get(entry['id'], UserPreference.NONE.value)
+                # Boards hold every field, so a sparse fieldset is applied to the entries
+                requested = requested_fields(request, Discussion)
+                if requested:
+                    entries = [{name: value for name, value in entry.items() if name in requested} for entry in entries]
+                return Response(entries)
 
         discussions = Discussion.objects.all().order_by(sort_field)
+        if category:
+            discussions = discussions.filter(category=category)
+        if visible_only(request):
+            context = {'request': request}
+            serializer = ValuesSerializer(DiscussionSerializer, context)
+            return Response(serializer.to_representation(viewer_rows(serializer, discussions[:limit], user, context)))
+        if limit is not None:
+            discussions = discussions[:limit]
         # Fetch user content preferences for these discussions
-        content_type = ContentType.objects.get_for_model(Discussion)
         user_preferences = UserContentPreference.objects.filter(
             user=user,
             content_type=content_type,
@@ -51,43 +148,79 @@ class DiscussionDetailView(APIView):
     permission_classes = [AllowAny]
 
     def get(self, request, discussion_id, format=None):
+        # Retrieve sort parameter from request, with 'created_at' as default
+        sort_by = request.query_params.get('sort', 'newest')
+        sort_field = COMMENT_SORT_OPTIONS.get(sort_by, '-created_at')
+
+        cached = encoding = None
+        if not request.user.is_authenticated and settings.DETAIL_PAYLOAD_CACHE_TTL:
+            # Anonymous readers all get the same payload, served compressed from the cache
+            encoding = negotiate(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+            cached = CachedPayload(
+                discussion_id, sort_field, fieldset_key(request), visible_only(request)
+            )
+            body = cached.get(encoding)
+            if body is not None:
+                return payload_response(body, encoding)
+
         try:
             discussion = Discussion.objects.get(pk=discussion_id)
+        except Discussion.DoesNotExist:
+            # Inactive threads are served from their frozen archive snapshot
+            archive = ArchivedDiscussion.objects.filter(original_id=discussion_id).first()
+            if archive is None:
+                return Response(status=status.HTTP_404_NOT_FOUND)
+            return Response(archived_detail(archive, request.user, sort_field))
 
-            # Retrieve sort parameter from request, with 'created_at' as default
-            sort_by = request.query_params.get('sort', 'newest')
-            sort_options = {
-                'popularity': '-wilson_score',
-                'newest': '-created_at',
-                'oldest': 'created_at',
-                'total_votes': '-total_votes',
-            }
-            sort_field = sort_options.get(sort_by, '-created_at')
-
-            # Order comments based on the selected sort option
-            comments = discussion.comments.all().order_by(sort_field)
+        # Order comments based on the selected sort option
+        comments = discussion.comments.all().order_by(sort_field)
 
+        user = request.user
+        context = {'request': request}
+        comment_serializer = ValuesSerializer(CommentSerializer, context, stub_fields=COMMENT_STUB_FIELDS)
+        if visible_only(request):
+            rows = viewer_rows(comment_serializer, comments, user, context)
+            context['group_approvals'] = comment_group_approvals([row['pk'] for row in rows if not row['collapsed']])
+        else:
             # Fetch user content preferences for comments
-            user = request.user
-            content_type = ContentType.objects.get_for_model(Comment)
-            user_preferences = UserContentPreference.objects.filter(
-                user=user,
-                content_type=content_type,
-                object_id__in=comments.values_list('id', flat=True)
-            ).values_list('object_id', 'preference')
-            user_pref_dict = {obj_id: pref for obj_id, pref in user_preferences}
-
-            # Include the user preference in the serialization context for comments
-            context = {'request': request, 'user_preferences': user_pref_dict}
-            discussion_serializer = DiscussionSerializer(discussion)
-            comments_serializer = CommentSerializer(comments, many=True, context=context)
-
-            return Response({
-                'discussion': discussion_serializer.data,
-                'comments': comments_serializer.data
-            })
-        except Discussion.DoesNotExist:
-            return Response(status=status.HTTP_404_NOT_FOUND)
+            user_pref_dict = {}
+            if user.is_authenticated:
+                content_type = ContentType.objects.get_for_model(Comment)
+                user_preferences = UserContentPreference.objects.filter(
+                    user=user,
+                    content_type=content_type,
+                    object_id__in=comments.values_list('id', flat=True)
+                ).values_list('object_id', 'preference')
+                user_pref_dict = {obj_id: pref for obj_id, pref in user_preferences}
+
+            # Include the user preference and opinion group approvals in the serialization context for comments
+            context['user_preferences'] = user_pref_dict
+            context['group_approvals'] = comment_group_approvals(comments.values('id'))
+            rows = comment_serializer.values(comments)
+        discussion_serializer = DiscussionSerializer(discussion, context={'request': request})
+
+        data = {
+            'discussion': discussion_serializer.data,
+            'comments': comment_serializer.to_representation(rows),
+            'related_discussions': related_discussions(discussion.id),
+        }
+        if cached is not None:
+            return payload_response(cached.store(ORJSONRenderer().render(data), encoding), encoding)
+        return Response(data)
+
+
+class SimilarDiscussionsView(APIView):
+    # Existing discussions resembling a subject, suggested while a new discussion is being written
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        subject = request.query_params.get('subject', '')
+        scores = dict(similar_subjects(subject))
+        # The model may be older than the table, so deleted or archived discussions simply drop out
+        discussions = Discussion.objects.filter(id__in=scores).values('id', 'subject', 'category')
+        suggestions = [{**discussion, 'score': scores[discussion['id']]} for discussion in discussions]
+        suggestions.sort(key=lambda suggestion: suggestion['score'], reverse=True)
+        return Response(suggestions)
 
 
 @api_view(['POST'])
@@ -98,6 +231,8 @@ def hide_all_from_user(request, user_id):
         target_user_comments = Comment.objects.filter(creator_id=user_id)
         for comment in target_user_comments:
             update_user_content_preference(request.user, comment, UserPreference.HIDE.value)
+        # The mute also covers what the user posts later, for the filtered views
+        MutedCreator.objects.get_or_create(user=request.user, creator_id=user_id)
         return JsonResponse({'message': 'All comments from the user have been hidden.'})
     else:
         return JsonResponse({'error': 'Invalid request'}, status=400)
@@ -109,6 +244,7 @@ def show_all_from_user(request, user_id):
         target_user_comments = Comment.objects.filter(creator_id=user_id)
         for comment in target_user_comments:
             update_user_content_preference(request.user, comment, UserPreference.SHOW.value)
+        MutedCreator.objects.filter(user=request.user, creator_id=user_id).delete()
         return JsonResponse({'message': 'All comments from the user will now be shown.'})
     else:
         return JsonResponse({'error': 'Invalid request'}, status=400)
@@ -122,7 +258,7 @@ def update_content_preference(request, votable_type, votable_id, preference):
         return Response({"error": "Invalid preference"}, status=400)
 
     # Dynamically get the model class based on votable_type
-    model_class = ContentType.objects.get(model=votable_type).model_class()
+    model_class = votable_content_type(votable_type).model_class()
 
     # Fetch the instance of the model (Discussion or Comment)
     content_object = get_object_or_404(model_class, id=votable_id)
@@ -135,12 +271,14 @@ def update_content_preference(request, votable_type, votable_id, preference):
 
 class VoteView(APIView):
     permission_classes = [IsAuthenticated]
+    throttle_scope = 'vote'
 
     def post(self, request, votable_type, votable_id):
         user = request.user
         data = request.data
-        content_type = ContentType.objects.get(model=votable_type)
+        content_type = votable_content_type(votable_type)
         votable = get_object_or_404(content_type.model_class(), id=votable_id)
+        previous_visibility = votable.visibility_status
 
         vote, created = Vote.objects.update_or_create(
             user=user,
@@ -149,14 +287,23 @@ class VoteView(APIView):
             defaults={'vote': data['vote']}
         )
 
+        check_vote(votable, user.id, vote.vote)
+
         # Update vote counts on the votable object after vote creation/update
         votable.get_vote_data()  # Recalculate and save updated vote counts
+        broker.publish_vote(votable, previous_visibility)
+        if isinstance(votable, Discussion):
+            # Deferred so a batch that is rolled back leaves the boards untouched
+            transaction.on_commit(lambda: discussion_changed(votable))
+        discussion_id = votable.id if isinstance(votable, Discussion) else votable.discussion_id
+        transaction.on_commit(lambda: discussion_payload_changed(discussion_id))
 
         return Response(VoteSerializer(vote).data, status=status.HTTP_200_OK if not created else status.HTTP_201_CREATED)
 
 
 class CreateCommentView(APIView):
     permission_classes = [IsAuthenticated]
+    throttle_scope = 'comment'
 
     def post(self, request, discussion_id):
         try:
@@ -168,6 +315,8 @@ class CreateCommentView(APIView):
         serializer = CommentSerializer(data=request.data, context={'request': request, 'discussion': discussion})
         if serializer.is_valid():
             serializer.save()
+            broker.publish_comment(serializer.data)
+            transaction.on_commit(lambda: discussion_payload_changed(discussion.id))
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         else:
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -181,6 +330,7 @@ class CreateDiscussionView(APIView):
 
         if discussion_serializer.is_valid():
             discussion = discussion_serializer.save()
+            transaction.on_commit(lambda: discussion_changed(discussion))
 
             comment_data = request.data.get('comment')
             print("Comment data received:", comment_data)
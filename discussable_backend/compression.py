@@ -0,0 +1,53 @@
+# discussable_backend/compression.py
+# Content-Encoding negotiation and compression, shared by CompressionMiddleware and the cached
+# discussion payloads. Brotli is used when the optional Brotli package is installed, gzip otherwise.
+import gzip
+
+from django.conf import settings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Encodings we can produce, in order of preference when the client accepts several equally
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def negotiate(accept_encoding):
+    # The preferred encoding accepted by an Accept-Encoding header, or None for an uncompressed response
+    weights = {}
+    for part in accept_encoding.lower().split(','):
+        coding, _, params = part.strip().partition(';')
+        weight = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        if coding:
+            weights[coding.strip()] = weight
+
+    best = None
+    for encoding in ENCODINGS:
+        weight = weights.get(encoding, weights.get('*', 0.0))
+        if weight > 0 and (best is None or weight > best[0]):
+            best = (weight, encoding)
+    return best[1] if best else None
+
+
+def compress(content, encoding, cached=False):
+    """
+    Compresses bytes with a negotiated encoding. Payloads that are cached are compressed once and
+    served many times, so they use the slower, denser levels.
+    """
+    if encoding == 'br':
+        quality = settings.COMPRESSION_CACHED_BROTLI_QUALITY if cached else settings.COMPRESSION_BROTLI_QUALITY
+        return brotli.compress(content, quality=quality)
+    if encoding == 'gzip':
+        level = settings.COMPRESSION_CACHED_GZIP_LEVEL if cached else settings.COMPRESSION_GZIP_LEVEL
+        # A fixed mtime keeps the output of identical content identical
+        return gzip.compress(content, compresslevel=level, mtime=0)
+    return content
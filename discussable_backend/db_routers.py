@@ -0,0 +1,41 @@
+# discussable_backend/db_routers.py
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+# Set by ReplicaRoutingMiddleware for the duration of a request that may read from the replica
+read_from_replica = ContextVar('read_from_replica', default=False)
+
+
+@contextmanager
+def primary_reads():
+    # For reads that must not see replica lag, such as sync cursors that never revisit what they passed
+    token = read_from_replica.set(False)
+    try:
+        yield
+    finally:
+        read_from_replica.reset(token)
+
+
+class PrimaryReplicaRouter:
+    # Reads go to the replica only while a request has opted in; everything else uses the primary
+
+    def db_for_read(self, model, **hints):
+        if read_from_replica.get():
+            return settings.REPLICA_DATABASE_ALIAS
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data, so objects loaded from either may be related
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # A real replica receives its schema through replication from the primary. A local SQLite replica file
+        # has no replication, so `migrate --database replica` builds its schema
+        if db == settings.REPLICA_DATABASE_ALIAS:
+            return settings.DATABASES[db]['ENGINE'] == 'django.db.backends.sqlite3'
+        return db == 'default'
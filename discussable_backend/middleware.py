@@ -0,0 +1,100 @@
+# discussable_backend/middleware.py
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import patch_vary_headers
+
+from .compression import compress, negotiate
+from .db_routers import read_from_replica
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def client_key(credential):
+    return hashlib.sha256(credential.encode()).hexdigest()
+
+
+def pin_cache_key(key):
+    return f'replica-pin:{key}'
+
+
+def pin_to_primary(credential):
+    # Keeps the reads of the client presenting `credential` (an Authorization header or session key) on the primary
+    if settings.REPLICA_DATABASE_ALIAS in settings.DATABASES:
+        cache.set(pin_cache_key(client_key(credential)), True, settings.REPLICA_PIN_SECONDS)
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Sends the reads of safe requests to the replica database. A client that has just written is
+    pinned to the primary for REPLICA_PIN_SECONDS so it always sees its own votes and comments.
+    Credentials issued by a login are pinned too: they have not written anything yet, but the
+    user and token they stand for may not have reached the replica.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        credential = self.get_credential(request)
+        use_replica = request.method in SAFE_METHODS and not self.is_pinned(credential)
+
+        token = read_from_replica.set(use_replica)
+        try:
+            response = self.get_response(request)
+        finally:
+            read_from_replica.reset(token)
+
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            if credential:
+                pin_to_primary(credential)
+            # A login cycles the session key; the new one is only sent as a cookie after this middleware
+            session_key = getattr(getattr(request, 'session', None), 'session_key', None)
+            if session_key and session_key != request.COOKIES.get(settings.SESSION_COOKIE_NAME):
+                pin_to_primary(session_key)
+        return response
+
+    @staticmethod
+    def get_credential(request):
+        # Clients are identified by their API token, falling back to the session cookie
+        return request.META.get('HTTP_AUTHORIZATION') or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+
+    @staticmethod
+    def is_pinned(credential):
+        return bool(credential) and cache.get(pin_cache_key(client_key(credential))) is not None
+
+
+class CompressionMiddleware:
+    """
+    Compresses responses with the best encoding the client accepts (brotli or gzip). Responses that
+    already carry a Content-Encoding, such as cached discussion payloads, are passed through as they
+    are. Streaming responses are left alone so live events are not held back in a compression buffer.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if response.streaming or response.has_header('Content-Encoding'):
+            return response
+        if len(response.content) < settings.COMPRESSION_MIN_BYTES:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = negotiate(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+        compressed = compress(response.content, encoding)
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response.headers['Content-Length'] = str(len(compressed))
+        response.headers['Content-Encoding'] = encoding
+        # A strong ETag no longer matches the bytes sent, so it is weakened
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        return response
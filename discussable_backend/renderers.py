@@ -0,0 +1,40 @@
+# discussable_backend/renderers.py
+# orjson drop-ins for DRF's JSONRenderer and JSONParser. Types orjson does not know natively
+# (decimals, lazy strings, querysets...) fall back to DRF's own encoder, so the output matches.
+import orjson
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+# UTC datetimes end in "Z" and non-string dict keys are stringified, as with DRF's encoder
+OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+encoder_default = JSONEncoder().default
+
+
+def dumps(data, indent=False):
+    return orjson.dumps(data, default=encoder_default, option=OPTIONS | (orjson.OPT_INDENT_2 if indent else 0))
+
+
+class ORJSONRenderer(BaseRenderer):
+    media_type = 'application/json'
+    format = 'json'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        # Only the two-space indent is available; any requested indent (e.g. from the browsable API) uses it
+        indent = 'indent' in (accepted_media_type or '') or bool((renderer_context or {}).get('indent'))
+        return dumps(data, indent)
+
+
+class ORJSONParser(BaseParser):
+    media_type = 'application/json'
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
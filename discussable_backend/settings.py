@@ -26,7 +26,7 @@ INSTALLED_APPS = [
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
-    'django.contrib.sessions',
+    'django.contrib.sessions',  # Expired session rows are removed by Django's `manage.py clearsessions`
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'django_countries',
@@ -35,6 +35,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'discussable_backend.middleware.CompressionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -72,6 +73,7 @@ TEMPLATES = [
 WEBAUTHN_RP_ID = 'localhost'
 WEBAUTHN_RP_NAME = 'Example Corp'
 WEBAUTHN_ORIGIN = 'http://localhost:3000'
+WEBAUTHN_CHALLENGE_TTL = 300  # Seconds a registration or login challenge stays valid
 
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = False
@@ -97,6 +99,35 @@ DATABASES = {
     'default': dj_database_url.config(default=os.getenv('DATABASE_URL'))
 }
 
+# Optional read replica, e.g. DATABASE_REPLICA_URL=sqlite:///replica.sqlite3 next to a sqlite primary for local testing.
+# Nothing replicates between two SQLite files: `migrate --database replica` creates the replica's schema, and
+# copying the primary's file over it brings its data along.
+REPLICA_DATABASE_ALIAS = 'replica'
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', '5'))  # Reads stay on the primary this long after a write
+
+if os.getenv('DATABASE_REPLICA_URL'):
+    DATABASES[REPLICA_DATABASE_ALIAS] = dj_database_url.parse(os.getenv('DATABASE_REPLICA_URL'))
+    # Test runs use the primary's test database for the replica alias
+    DATABASES[REPLICA_DATABASE_ALIAS]['TEST'] = {'MIRROR': 'default'}
+    DATABASE_ROUTERS = ['discussable_backend.db_routers.PrimaryReplicaRouter']
+    MIDDLEWARE.append('discussable_backend.middleware.ReplicaRoutingMiddleware')
+
+# Persistent connections: seconds to keep a connection open between requests, 0 to close after each request
+# and "None" for no limit. Health checks make sure a reused connection is still usable before a request runs.
+# Only WSGI workers reuse connections safely; asgi.py defaults this to 0, since async views run their queries
+# on executor threads whose connections are never closed by the request cycle.
+DATABASE_CONN_MAX_AGE = os.getenv('DATABASE_CONN_MAX_AGE', '60')
+DATABASE_CONN_HEALTH_CHECKS = os.getenv('DATABASE_CONN_HEALTH_CHECKS', 'True').lower() == 'true'
+# Set to "pgbouncer" when DATABASE_URL points at a PgBouncer pool running in transaction mode
+DATABASE_POOLER = os.getenv('DATABASE_POOLER', '')
+
+for database in DATABASES.values():
+    database['CONN_MAX_AGE'] = None if DATABASE_CONN_MAX_AGE.lower() == 'none' else int(DATABASE_CONN_MAX_AGE)
+    database['CONN_HEALTH_CHECKS'] = DATABASE_CONN_HEALTH_CHECKS
+    if DATABASE_POOLER == 'pgbouncer':
+        # Server-side cursors do not survive transaction pooling
+        database['DISABLE_SERVER_SIDE_CURSORS'] = True
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -116,16 +147,59 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 REST_FRAMEWORK = {
+    # JSON is encoded and decoded with orjson; the browsable API stays available
+    'DEFAULT_RENDERER_CLASSES': [
+        'discussable_backend.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'discussable_backend.renderers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'authentech_app.authentication.CachedTokenAuthentication',
         # 'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
         # customize permissions as needed
     ],
+    # Only views with a throttle_scope listed below are limited
+    'DEFAULT_THROTTLE_CLASSES': [
+        'discussable_backend.throttling.TokenBucketThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'vote': os.getenv('THROTTLE_RATE_VOTE', '60/min'),
+        'comment': os.getenv('THROTTLE_RATE_COMMENT', '10/min'),
+        'webauthn_challenge': os.getenv('THROTTLE_RATE_WEBAUTHN_CHALLENGE', '10/min'),
+    },
 }
 
+# Cache shared by throttling, token authentication, WebAuthn challenges and replica pinning.
+# Set REDIS_URL when running more than one worker process so they all see the same entries (uses the redis package).
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# API token lifetime and the token -> user cache used by CachedTokenAuthentication
+TOKEN_EXPIRY_SECONDS = int(os.getenv('TOKEN_EXPIRY_SECONDS', str(30 * 24 * 60 * 60))) or None  # 0 disables expiry
+# "django" keeps entries in the shared cache; "memory" keeps them per process and checks the shared cache for
+# revocations on each hit, so both need a cache shared by all workers (REDIS_URL) for logout to reach every worker
+TOKEN_AUTH_CACHE = os.getenv('TOKEN_AUTH_CACHE', 'django')
+TOKEN_AUTH_CACHE_SIZE = 10000
+TOKEN_AUTH_CACHE_TTL = 300
+
 
 LOGGING = {
     'version': 1,
@@ -146,6 +220,67 @@ LOGGING = {
 
 CSRF_TRUSTED_ORIGINS = ['http://localhost:3000']
 
+# Cached top discussions per sort and category, serving list requests; ?limit= is capped at LEADERBOARD_SIZE
+LEADERBOARD_SIZE = 50
+LEADERBOARD_CAPACITY = 100  # Entries kept per board, so discussions dropping out rarely force a rebuild
+LEADERBOARD_TTL = 600
+
+# Live discussion updates streamed as server-sent events. The stream needs the ASGI application in
+# discussable_backend/asgi.py (e.g. uvicorn discussable_backend.asgi:application); WSGI servers get a 501
+LIVE_UPDATES_BACKEND = os.getenv('LIVE_UPDATES_BACKEND', 'discussable_app.live.InProcessBackend')
+LIVE_UPDATES_COALESCE_SECONDS = 0.5  # Counter updates for the same votable within this window are merged
+LIVE_UPDATES_KEEPALIVE_SECONDS = 15
+LIVE_UPDATES_MAX_STREAM_SECONDS = 300
+LIVE_UPDATES_QUEUE_SIZE = 1000  # Events buffered per stream before the client is told to resync
+
+# Sub-requests accepted by one call to the batch endpoint
+BATCH_MAX_REQUESTS = 20
+
+# Per-category visibility thresholds (CategoryVisibilityThreshold) are cached this long; saving one clears the cache
+VISIBILITY_THRESHOLDS_CACHE_TTL = 300
+
+# Delta sync (/api/changes/): rows per stream and page, and how long fresh changes are held back so
+# transactions still committing are not skipped by a cursor that has moved past their timestamp
+SYNC_PAGE_SIZE = 200
+SYNC_MAX_PAGE_SIZE = 1000
+SYNC_SETTLE_SECONDS = 2
+
+# Response compression negotiated by Accept-Encoding; brotli is offered when the Brotli package is installed.
+# Cached discussion payloads are compressed once at the denser CACHED levels.
+COMPRESSION_MIN_BYTES = 500  # Smaller responses are sent uncompressed
+COMPRESSION_GZIP_LEVEL = 6
+COMPRESSION_BROTLI_QUALITY = 5
+COMPRESSION_CACHED_GZIP_LEVEL = 9
+COMPRESSION_CACHED_BROTLI_QUALITY = 9
+
+# Serialized discussion detail payloads served to anonymous readers, cached per discussion and sort
+DETAIL_PAYLOAD_CACHE_TTL = int(os.getenv('DETAIL_PAYLOAD_CACHE_TTL', '300'))  # 0 disables the cache
+
+# Vote brigading detection: a burst of at least BRIGADING_BURST_VOTES votes on one object within the window,
+# mostly in one direction, from voters whose recent votes overlap by BRIGADING_MIN_SIMILARITY (Jaccard)
+BRIGADING_WINDOW_SECONDS = 600
+BRIGADING_BURST_VOTES = 20
+BRIGADING_ONE_SIDED_SHARE = 0.8
+BRIGADING_MIN_SIMILARITY = 0.3
+BRIGADING_HOLD_VISIBILITY = os.getenv('BRIGADING_HOLD_VISIBILITY', 'False').lower() == 'true'  # Freeze visibility until reviewed
+
+# Similar discussion suggestions, built offline by build_similarity_model
+SIMILARITY_MODEL_DIR = os.getenv('SIMILARITY_MODEL_DIR', BASE_DIR / 'similarity_model')
+SIMILARITY_NEIGHBOURS = 10  # Related discussions stored per discussion and suggestions returned per subject
+SIMILARITY_TOP_COMMENTS = 5  # Best scored comments indexed alongside each subject
+SIMILARITY_MIN_SCORE = 0.1
+
+# A comment counts as agreed across opinion groups when every group's approval reaches this share
+OPINION_GROUP_AGREEMENT = 0.6
+
+# Bridging score factorization, refitted by build_bridging_scores from the factors of its previous run
+BRIDGING_FACTORS_PATH = os.getenv('BRIDGING_FACTORS_PATH', BASE_DIR / 'bridging_factors.npz')
+BRIDGING_INTERCEPT_REG = 0.15  # Intercepts are regularized harder, so polarized approval is explained by the factors
+BRIDGING_FACTOR_REG = 0.03
+
+# Discussions without a comment or vote for this many days are moved to the archive by archive_discussions
+ARCHIVE_INACTIVE_DAYS = int(os.getenv('ARCHIVE_INACTIVE_DAYS', 365))
+
 # Email configuration for testing
 # EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
@@ -156,6 +291,16 @@ EMAIL_HOST_USER = '8ec705afee3563'  # Mailtrap username
 EMAIL_HOST_PASSWORD = '0b2c98d7917c4f'  # Mailtrap password
 EMAIL_PORT = '2525'
 EMAIL_USE_TLS = True  # Optional, based on preference for TLS
+DEFAULT_FROM_EMAIL = 'from@example.com'
+
+EMAIL_VERIFICATION_TOKEN_TTL = 24 * 60 * 60  # Seconds a verification link stays valid
+
+# Outbound email queue drained by the send_queued_emails command
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5
+EMAIL_OUTBOX_RETRY_SECONDS = 60  # First retry delay, doubled after every failed attempt
+EMAIL_OUTBOX_MAX_RETRY_SECONDS = 3600
+EMAIL_OUTBOX_LEASE_SECONDS = 300  # How long a claimed batch is hidden from other workers
+EMAIL_OUTBOX_RETENTION_SECONDS = 7 * 24 * 60 * 60  # Sent and failed emails older than this are removed by purge_finished_emails
 
 # Internationalization
 # https://docs.djangoproject.com/en/4.2/topics/i18n/
@@ -0,0 +1,57 @@
+# discussable_backend/throttling.py
+import math
+import time
+
+from django.core.cache import cache
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+DURATIONS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    # "30/min" -> bucket capacity 30, refilled at 30 tokens per minute
+    capacity, period = rate.split('/')
+    return int(capacity), int(capacity) / DURATIONS[period[0]]
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Token bucket per client and view scope. Views opt in with a `throttle_scope` whose budget is
+    set in DEFAULT_THROTTLE_RATES. Clients are keyed by user when authenticated and by IP otherwise.
+    Buckets live in the Django cache so all workers share them; the read-modify-write is not atomic,
+    which at worst lets a few extra requests through under heavy concurrency.
+    """
+
+    def __init__(self):
+        self.wait_seconds = None
+
+    def allow_request(self, request, view):
+        scope = getattr(view, 'throttle_scope', None)
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(scope) if scope else None
+        if rate is None:
+            return True
+
+        capacity, refill_per_second = parse_rate(rate)
+        if request.user and request.user.is_authenticated:
+            ident = f'user:{request.user.pk}'
+        else:
+            ident = f'ip:{self.get_ident(request)}'
+        key = f'throttle:{scope}:{ident}'
+
+        now = time.time()
+        tokens, updated_at = cache.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated_at) * refill_per_second)
+        # An untouched bucket is full again after this long, so the entry can expire then
+        timeout = math.ceil(capacity / refill_per_second)
+
+        if tokens < 1:
+            self.wait_seconds = (1 - tokens) / refill_per_second
+            cache.set(key, (tokens, now), timeout)
+            return False
+
+        cache.set(key, (tokens - 1, now), timeout)
+        return True
+
+    def wait(self):
+        return self.wait_seconds